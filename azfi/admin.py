@@ -1,9 +1,145 @@
-from django.contrib import admin
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+from django.utils import timezone
+from django.utils.dateformat import format as format_date
+from django.utils.functional import cached_property
+
+from . import booking, exports, search
 from .models import (
     Treatment, TreatmentFAQ, BeforeAfterImage, 
-    TeamMember, Testimonial, BlogPost, Contact
+    TeamMember, Testimonial, BlogPost, Contact, Subscriber, WorkingHours, Booking
 )
 
+# Sorts after every character, so [term, term + PREFIX_END) is "starts with term"
+PREFIX_END = '\U0010ffff'
+
+
+def count_limit():
+    return getattr(settings, 'ADMIN_COUNT_LIMIT', 10000)
+
+
+def estimated_rows(queryset):
+    """The planner's row count for the queryset's table, or None without statistics."""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # sqlite_stat1 only exists once ANALYZE has run
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    rows = int(str(row[0]).split()[0]) if row else 0
+    return rows if rows > 0 else None
+
+
+class CappedCountPaginator(Paginator):
+    """
+    Counts at most ``ADMIN_COUNT_LIMIT`` rows instead of the whole table.
+    Past the limit an unfiltered list reports the planner's estimate and a
+    filtered or searched one reports the limit.
+    """
+
+    @cached_property
+    def count(self):
+        limit = count_limit()
+        counted = self.object_list.order_by().values('pk')[:limit].count()
+        if counted < limit:
+            return counted
+        if not self.object_list.query.where:
+            return max(estimated_rows(self.object_list) or 0, limit)
+        return limit
+
+
+class MonthListFilter(admin.SimpleListFilter):
+    """
+    Filter by calendar month. Replaces ``date_hierarchy``, which runs SELECT
+    DISTINCT over the date of every row on each page load. The months offered
+    come from the first and last dates (two index lookups), and a month
+    filters on a range of the indexed column.
+    """
+    title = 'month'
+    parameter_name = 'month'
+    field_name = 'created_at'
+    max_months = 24
+
+    def lookups(self, request, model_admin):
+        dates = model_admin.get_queryset(request).order_by(self.field_name).values_list(self.field_name, flat=True)
+        first, last = dates.first(), dates.last()
+        if first is None:
+            return []
+        first, last = timezone.localtime(first), timezone.localtime(last)
+        year, month = last.year, last.month
+        choices = []
+        while (year, month) >= (first.year, first.month) and len(choices) < self.max_months:
+            choices.append((f'{year}-{month:02d}', format_date(datetime(year, month, 1), 'F Y')))
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        return choices
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return None
+        try:
+            year, month = (int(part) for part in self.value().split('-'))
+            start = timezone.make_aware(datetime(year, month, 1))
+        except ValueError as exc:
+            raise IncorrectLookupParameters(exc)
+        end = timezone.make_aware(datetime(year + month // 12, month % 12 + 1, 1))
+        return queryset.filter(**{f'{self.field_name}__gte': start, f'{self.field_name}__lt': end})
+
+
+@admin.action(description="Export selected rows as CSV", permissions=['view'])
+def export_csv(modeladmin, request, queryset):
+    return exports.stream(exports.for_model(modeladmin.model), 'csv', queryset=queryset)
+
+
+@admin.action(description="Export selected rows as JSON Lines", permissions=['view'])
+def export_jsonl(modeladmin, request, queryset):
+    return exports.stream(exports.for_model(modeladmin.model), 'jsonl', queryset=queryset)
+
+
+class LargeTableAdminMixin:
+    """
+    Changelist for tables that grow to millions of rows: capped counts, a
+    month filter instead of ``date_hierarchy`` and a case-insensitive prefix
+    search on ``search_fields``, which need a ``Lower()`` index each so the
+    search reads an index range instead of scanning with LIKE. Fields in
+    ``lowercase_fields`` are stored lowercase and searched on a plain index.
+    """
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    date_hierarchy = None
+    lowercase_fields = ()
+
+    def search_matches(self, term):
+        matches = Q()
+        for field in self.search_fields:
+            if field in self.lowercase_fields:
+                matches |= Q(**{f'{field}__gte': term, f'{field}__lt': term + PREFIX_END})
+            else:
+                matches |= Q(GreaterThanOrEqual(Lower(field), term), LessThan(Lower(field), term + PREFIX_END))
+        return matches
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip().lower()
+        if not term:
+            return queryset, False
+        return queryset.filter(self.search_matches(term)), False
+
+
 class TreatmentFAQInline(admin.TabularInline):
     model = TreatmentFAQ
     extra = 1
@@ -12,9 +148,13 @@ class BeforeAfterImageInline(admin.TabularInline):
     model = BeforeAfterImage
     extra = 1
 
+class WorkingHoursInline(admin.TabularInline):
+    model = WorkingHours
+    extra = 1
+
 @admin.register(Treatment)
 class TreatmentAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price_range', 'duration', 'featured')
+    list_display = ('name', 'category', 'price_range', 'duration', 'duration_minutes', 'featured')
     list_filter = ('category', 'featured')
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
@@ -25,26 +165,91 @@ class TeamMemberAdmin(admin.ModelAdmin):
     list_display = ('name', 'role', 'order')
     list_editable = ('order',)
     search_fields = ('name', 'role', 'bio')
+    filter_horizontal = ('treatments',)
+    inlines = [WorkingHoursInline]
 
 @admin.register(Testimonial)
 class TestimonialAdmin(admin.ModelAdmin):
     list_display = ('name', 'treatment', 'date', 'featured')
     list_filter = ('featured', 'treatment')
+    list_select_related = ('treatment',)
+    autocomplete_fields = ('treatment',)
     search_fields = ('name', 'quote')
+    actions = (export_csv, export_jsonl)
     date_hierarchy = 'date'
 
 @admin.register(BlogPost)
 class BlogPostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'published_date')
+    list_display = ('title', 'author', 'published_date', 'reading_time')
+    readonly_fields = ('word_count', 'reading_time')
     list_filter = ('author', 'published_date')
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
     search_fields = ('title', 'content')
+    actions = (export_csv, export_jsonl)
     prepopulated_fields = {'slug': ('title',)}
     date_hierarchy = 'published_date'
 
 @admin.register(Contact)
-class ContactAdmin(admin.ModelAdmin):
+class ContactAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'email', 'phone', 'created_at', 'responded')
-    list_filter = ('responded', 'created_at')
-    search_fields = ('name', 'email', 'message')
-    date_hierarchy = 'created_at'
+    list_filter = ('responded', MonthListFilter)
+    search_fields = ('name', 'email')
+    search_help_text = "Start of the name or email address, or words in the message."
     readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
+    actions = ('mark_responded', 'mark_not_responded', export_csv, export_jsonl)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip().lower()
+        by_message = search.contact_matches(term)
+        if by_message is None:
+            return super().get_search_results(request, queryset, search_term)
+        # IN over a UNION: each part reads its own index, where an OR scans the table
+        found = Contact.objects.filter(self.search_matches(term)).values('pk').union(
+            Contact.objects.filter(pk__in=by_message).values('pk'))
+        return queryset.filter(pk__in=found), False
+
+    @admin.action(description="Mark selected contacts as responded")
+    def mark_responded(self, request, queryset):
+        # One UPDATE for the whole selection, also with "select all" across pages
+        updated = queryset.update(responded=True)
+        self.message_user(request, f"Marked {updated} contacts as responded.", messages.SUCCESS)
+
+    @admin.action(description="Mark selected contacts as not responded")
+    def mark_not_responded(self, request, queryset):
+        updated = queryset.update(responded=False)
+        self.message_user(request, f"Marked {updated} contacts as not responded.", messages.SUCCESS)
+
+
+@admin.register(Subscriber)
+class SubscriberAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('email', 'source', 'created_at')
+    list_filter = (MonthListFilter,)
+    search_fields = ('email',)
+    lowercase_fields = ('email',)
+    search_help_text = "Start of the email address."
+    actions = (export_csv, export_jsonl)
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
+
+
+@admin.register(Booking)
+class BookingAdmin(admin.ModelAdmin):
+    list_display = ('start', 'treatment', 'member', 'name', 'phone', 'status')
+    list_filter = ('status', 'member')
+    list_select_related = ('treatment', 'member')
+    search_fields = ('name', 'email', 'phone')
+    # Times and practitioners only change through azfi/booking.py, which holds their slots
+    readonly_fields = ('reference', 'treatment', 'member', 'start', 'end', 'status', 'created_at')
+    ordering = ('-start',)
+    date_hierarchy = 'start'
+    actions = ('cancel_bookings',)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Cancel selected bookings and free their times")
+    def cancel_bookings(self, request, queryset):
+        cancelled = booking.cancel(queryset)
+        self.message_user(request, f"Cancelled {cancelled} bookings.", messages.SUCCESS)
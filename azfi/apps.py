@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class AzfiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'azfi'
+
+    def ready(self):
+        from . import cache, freshness, images, intake, minhash, newsletter, prerender, search, similarity
+        images.connect_signals()
+        search.connect_signals()
+        cache.connect_signals()
+        freshness.connect_signals()
+        intake.register_topics()
+        newsletter.connect_signals()
+        newsletter.register_topics()
+        prerender.connect_signals()
+        prerender.register_topics()
+        similarity.connect_signals()
+        similarity.register_topics()
+        minhash.connect_signals()
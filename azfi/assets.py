@@ -0,0 +1,126 @@
+"""
+Static asset bundles: concatenated, minified, fingerprinted and precompressed.
+
+``ASSET_BUNDLES`` in settings maps a bundle name such as ``about.css`` to the
+static source files it is built from. ``collectstatic`` (through
+``azfi.storage.BundledStaticFilesStorage``) writes each bundle to
+``bundles/<name>``, gives it a content hash like every other static file and
+stores ``.gz`` and ``.br`` siblings for the web server to pick from. The
+``.br`` files need the ``brotli`` package (requirements.txt); without it
+``collectstatic`` warns and writes only ``.gz``. Templates reference bundles
+with ``{% bundle 'about.css' %}`` (azfi/templatetags/assets.py).
+
+The minifiers are deliberately conservative: they remove comments and
+whitespace but never rewrite code, so a bundle behaves exactly like its
+sources.
+"""
+import gzip
+import re
+import textwrap
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    # Listed in requirements.txt; BundledStaticFilesStorage warns when it is missing
+    brotli = None
+
+BUNDLE_DIR = 'bundles'
+
+# Text formats worth precompressing; images and fonts are compressed already
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.xml', '.html', '.map')
+MIN_COMPRESS_SIZE = 256
+
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+CSS_SPACE_RE = re.compile(r'\s+')
+CSS_PUNCTUATION_RE = re.compile(r'\s*([{};,>])\s*')
+CSS_COLON_RE = re.compile(r':\s+')
+JS_LINE_COMMENT_RE = re.compile(r'^\s*//.*$', re.M)
+
+# An inline block with no attributes and no template syntax can move to a file as is
+INLINE_RE = re.compile(r'<(style|script)>(?P<body>(?:(?!\{[%{#]).)*?)</\1>', re.S)
+EXTENDS_RE = re.compile(r'{%\s*extends\s[^%]*%}\n?')
+EXTENSIONS = {'style': 'css', 'script': 'js'}
+
+
+def bundles():
+    return getattr(settings, 'ASSET_BUNDLES', {})
+
+
+def bundle_path(name):
+    return f'{BUNDLE_DIR}/{name}'
+
+
+def minify_css(text):
+    text = CSS_COMMENT_RE.sub('', text)
+    text = CSS_SPACE_RE.sub(' ', text)
+    text = CSS_PUNCTUATION_RE.sub(r'\1', text)
+    # Only after a colon: "a :hover" and "a:hover" are different selectors
+    text = CSS_COLON_RE.sub(':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """Drop whole-line comments, indentation and blank lines; statements are left alone."""
+    text = JS_LINE_COMMENT_RE.sub('', text)
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def build_bundle(name, read):
+    """Return the minified contents of bundle ``name``, reading sources with ``read(path)``."""
+    sources = [read(path) for path in bundles()[name]]
+    if name.endswith('.css'):
+        return '\n'.join(minify_css(source) for source in sources)
+    # Separate scripts with ";" so one without a trailing semicolon cannot run into the next
+    return '\n;'.join(minify_js(source) for source in sources)
+
+
+def compressible(name):
+    return name.endswith(COMPRESSIBLE)
+
+
+def precompress(content):
+    """Return ``{'.gz': bytes, '.br': bytes}``; Brotli only if the package is installed."""
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    return variants
+
+
+def extract_inline(template, static_dir):
+    """
+    Move the inline ``<style>``/``<script>`` blocks of ``template`` into
+    ``<static_dir>/{css,js}/pages/<template name>.{css,js}`` and replace each
+    with a ``{% bundle %}`` tag. Return ``{bundle name: source path}``.
+    """
+    template = Path(template)
+    text = template.read_text()
+    found = {}
+
+    def move(match):
+        extension = EXTENSIONS[match.group(1)]
+        name = f'{template.stem}.{extension}'
+        source = f'{extension}/pages/{name}'
+        first = name not in found
+        body = textwrap.dedent(match.group('body')).strip('\n') + '\n'
+        target = Path(static_dir) / source
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # A second block of the same kind in one template is appended to the first
+        with open(target, 'w' if first else 'a') as fh:
+            fh.write(body)
+        found[name] = source
+        return f"{{% bundle '{name}' %}}" if first else ''
+
+    text = INLINE_RE.sub(move, text)
+    if not found:
+        return found
+    if '{% load assets %}' not in text:
+        extends = EXTENDS_RE.search(text)
+        if extends:
+            text = text[:extends.end()] + '{% load assets %}\n' + text[extends.end():]
+        else:
+            text = '{% load assets %}' + text
+    template.write_text(text)
+    return found
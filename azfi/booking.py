@@ -0,0 +1,193 @@
+"""
+Appointment availability and conflict-free booking.
+
+Practitioners (``TeamMember``) can be booked for their ``treatments`` during
+their weekly ``WorkingHours``, in the clinic's time zone. Time is cut into
+``BOOKING_SLOT_MINUTES`` steps. A booking holds one ``BookingSlot`` row per
+step it covers, and the unique (member, start) constraint on those rows
+settles every conflict: two requests for overlapping times insert the same
+step, the database commits one and the other gets an IntegrityError. No
+lock is held while pages render, and no isolation level has to be right.
+
+``open_slots()`` answers "when can I have X this week" with two indexed
+queries: the practitioners' working hours and their held steps in the
+window. Each practitioner's held steps become an ``IntervalIndex`` of
+merged busy intervals, and the free gaps it leaves inside working hours
+are cut into start times.
+"""
+import bisect
+from collections import defaultdict, namedtuple
+from datetime import UTC, datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Booking, BookingSlot, WorkingHours
+
+Slot = namedtuple('Slot', 'start end member_id')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+class SlotUnavailable(Exception):
+    """The time is not open for booking, or another booking took it first."""
+
+
+def step_minutes():
+    return getattr(settings, 'BOOKING_SLOT_MINUTES', 15)
+
+
+def min_notice():
+    return timedelta(minutes=getattr(settings, 'BOOKING_MIN_NOTICE_MINUTES', 120))
+
+
+def horizon():
+    return timedelta(days=getattr(settings, 'BOOKING_HORIZON_DAYS', 60))
+
+
+def to_minutes(moment):
+    return int((moment - EPOCH).total_seconds() // 60)
+
+
+def from_minutes(minutes):
+    return EPOCH + timedelta(minutes=minutes)
+
+
+def round_up(minutes, step):
+    return -(-minutes // step) * step
+
+
+class IntervalIndex:
+    """Sorted, disjoint ``[start, end)`` intervals in minutes; overlapping ones are merged as given."""
+
+    def __init__(self, intervals=()):
+        self.starts, self.ends = [], []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def overlaps(self, start, end):
+        # The first interval ending after ``start`` is the only one that can overlap first
+        i = bisect.bisect_right(self.ends, start)
+        return i < len(self.starts) and self.starts[i] < end
+
+    def gaps(self, start, end):
+        """The free ``(start, end)`` stretches within ``[start, end)``."""
+        cursor = start
+        i = bisect.bisect_right(self.ends, start)
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.starts[i] > cursor:
+                yield cursor, self.starts[i]
+            cursor = max(cursor, self.ends[i])
+            i += 1
+        if cursor < end:
+            yield cursor, end
+
+
+def shifts(hours, first_day, last_day, tz):
+    """``[start, end)`` minutes of each ``(weekday, opens, closes)`` on the days from first to last."""
+    day = first_day
+    while day <= last_day:
+        for weekday, opens, closes in hours:
+            if weekday == day.weekday():
+                yield (to_minutes(timezone.make_aware(datetime.combine(day, opens), tz)),
+                       to_minutes(timezone.make_aware(datetime.combine(day, closes), tz)))
+        day += timedelta(days=1)
+
+
+def open_slots(treatment, start, end, member_id=None, now=None):
+    """
+    Every ``Slot`` for ``treatment`` starting in ``[start, end)``, by start
+    time then practitioner. ``member_id`` keeps one practitioner's.
+    """
+    step = step_minutes()
+    now = now or timezone.now()
+    first = round_up(to_minutes(max(start, now + min_notice())), step)
+    last = to_minutes(min(end, now + horizon()))
+    if first >= last:
+        return []
+    # A booking holds whole steps, so it needs this much free time
+    length = round_up(treatment.duration_minutes, step)
+
+    hours = WorkingHours.objects.filter(member__treatments=treatment)
+    if member_id is not None:
+        hours = hours.filter(member_id=member_id)
+    by_member = defaultdict(set)
+    for member, weekday, opens, closes in hours.values_list('member_id', 'weekday', 'start', 'end'):
+        by_member[member].add((weekday, opens, closes))
+    if not by_member:
+        return []
+
+    held = defaultdict(list)
+    for member, moment in BookingSlot.objects.filter(
+            member_id__in=list(by_member), start__gte=from_minutes(first),
+            start__lt=from_minutes(last + length)).values_list('member_id', 'start'):
+        held[member].append((to_minutes(moment), to_minutes(moment) + step))
+
+    tz = timezone.get_current_timezone()
+    # A day's shift can end after midnight UTC, so start a day early
+    first_day = timezone.localtime(from_minutes(first), tz).date() - timedelta(days=1)
+    last_day = timezone.localtime(from_minutes(last), tz).date()
+    found = set()
+    for member, member_hours in by_member.items():
+        busy = IntervalIndex(held[member])
+        for shift_start, shift_end in shifts(member_hours, first_day, last_day, tz):
+            for gap_start, gap_end in busy.gaps(max(shift_start, first), shift_end):
+                for minute in range(round_up(gap_start, step), min(gap_end - length, last - 1) + 1, step):
+                    found.add((minute, member))
+    return [Slot(from_minutes(minute), from_minutes(minute + treatment.duration_minutes), member)
+            for minute, member in sorted(found)]
+
+
+def book(treatment, member_id, start, **details):
+    """Create the booking and its held steps in one transaction; IntegrityError if a step is taken."""
+    step = step_minutes()
+    with transaction.atomic():
+        booking = Booking.objects.create(
+            treatment=treatment, member_id=member_id, start=start,
+            end=start + timedelta(minutes=treatment.duration_minutes), **details,
+        )
+        BookingSlot.objects.bulk_create([
+            BookingSlot(booking=booking, member_id=member_id, start=start + timedelta(minutes=offset))
+            for offset in range(0, treatment.duration_minutes, step)
+        ])
+    return booking
+
+
+def reserve(treatment, start, member_id=None, now=None, **details):
+    """
+    Book ``treatment`` at ``start`` with ``member_id``, or with the first
+    practitioner free then. Raises ``SlotUnavailable`` when nobody is.
+    """
+    candidates = [slot.member_id for slot in open_slots(
+        treatment, start, start + timedelta(minutes=step_minutes()), member_id=member_id, now=now,
+    ) if slot.start == start]
+    for candidate in candidates:
+        try:
+            return book(treatment, candidate, start, **details)
+        except IntegrityError:
+            # Booked by a concurrent request since open_slots() read it
+            continue
+    raise SlotUnavailable(f"{treatment.name} is not available at {timezone.localtime(start):%Y-%m-%d %H:%M}")
+
+
+def cancel(bookings):
+    """Cancel ``bookings`` (a queryset) and free their time; return how many were confirmed."""
+    with transaction.atomic():
+        ids = list(bookings.filter(status=Booking.CONFIRMED).values_list('pk', flat=True))
+        BookingSlot.objects.filter(booking_id__in=ids).delete()
+        Booking.objects.filter(pk__in=ids).update(status=Booking.CANCELLED)
+    return len(ids)
+
+
+def overlapping():
+    """Confirmed bookings that share practitioner time with another; empty unless slots were bypassed."""
+    confirmed = Booking.objects.filter(status=Booking.CONFIRMED)
+    return confirmed.filter(Exists(confirmed.filter(
+        member=OuterRef('member'), start__lt=OuterRef('end'), end__gt=OuterRef('start'),
+    ).exclude(pk=OuterRef('pk'))))
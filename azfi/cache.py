@@ -0,0 +1,239 @@
+"""
+Full-page response cache for the public views, invalidated by model tags.
+
+Each cached page is tagged with the models it renders. Every tag has a
+version number stored in the cache and the page key embeds the current
+versions, so a ``post_save``/``post_delete`` on a tagged model only has to
+bump one counter to orphan every page that depends on it. Nothing needs to
+enumerate or delete keys, which keeps this working on the local-memory and
+file-based backends.
+
+Pages are stored with the CSRF token punched out and a fresh token is filled
+in for every visitor, so forms on cached pages keep working. In shell mode
+(azfi/shell.py) pages hold nothing per-visitor at all: they are served from
+the cache to visitors with a session too, and marked public for proxies.
+"""
+import hashlib
+import re
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control
+
+from . import routers, shell
+
+TAG_KEY = 'pagecache:tag:{}'
+PAGE_KEY = 'pagecache:page:{}'
+
+# Query parameters that never change the rendered page (ad campaign tracking)
+IGNORED_PARAMS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+                  'gclid', 'fbclid', 'msclkid')
+
+CSRF_INPUT_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = b'__PAGE_CACHE_CSRF_TOKEN__'
+
+# Models whose changes invalidate cached pages
+TAGGED_MODELS = (
+    'azfi.Treatment', 'azfi.TreatmentFAQ', 'azfi.BeforeAfterImage', 'azfi.TeamMember',
+    'azfi.Testimonial', 'azfi.BlogPost', 'auth.User',
+)
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def is_enabled():
+    return getattr(settings, 'PAGE_CACHE_ENABLED', True)
+
+
+def tag_for(model):
+    return model._meta.label_lower
+
+
+def tag_versions(tags, cache=None):
+    """Return ``{tag: version}``, seeding missing tags with a time-based version."""
+    cache = cache or get_cache()
+    keys = {TAG_KEY.format(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    versions = {}
+    for key, tag in keys.items():
+        if key not in found:
+            # Start from the clock so an evicted counter never reuses an old version
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+        versions[tag] = found[key]
+    return versions
+
+
+def invalidate(*models):
+    """Orphan every cached page tagged with any of ``models``."""
+    cache = get_cache()
+    for model in models:
+        key = TAG_KEY.format(tag_for(model) if not isinstance(model, str) else model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def page_key(request, tags, cache=None):
+    params = sorted(
+        (name, value) for name, values in request.GET.lists()
+        if name not in IGNORED_PARAMS for value in values
+    )
+    versions = tag_versions(tags, cache)
+    raw = '|'.join([
+        request.get_host(), request.path, repr(params),
+        ','.join(f'{tag}={versions[tag]}' for tag in sorted(versions)),
+    ])
+    return PAGE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def validators_key(request, tags, cache=None):
+    """Key for a page's conditional GET validators (azfi/freshness.py), orphaned along with the page."""
+    return page_key(request, tags, cache) + ':validators'
+
+
+def timeout():
+    seconds = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+    if routers.current_replica():
+        # A lagging replica can render a page from before the write that invalidated it
+        seconds = min(seconds, getattr(settings, 'REPLICA_PAGE_CACHE_TIMEOUT', 60))
+    return seconds
+
+
+def bypass(request):
+    """Requests that may see per-user content always go to the view."""
+    if request.method not in ('GET', 'HEAD'):
+        return True
+    if shell.is_prerender(request):
+        # Pre-rendering records the queries of each page, so it always renders
+        return True
+    # A shell leaves the visitor's messages and toolbar to /fragments/
+    return not shell.is_enabled() and (
+        settings.SESSION_COOKIE_NAME in request.COOKIES
+        or 'messages' in request.COOKIES
+    )
+
+
+def cacheable(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not response.has_header('Vary')
+        and 'private' not in response.get('Cache-Control', '')
+        and not (hasattr(request, 'session') and request.session.accessed)
+    )
+
+
+def share(request, response):
+    """In shell mode, let shared caches keep a page rendered without anything per-visitor."""
+    if (shell.is_enabled() and request.method in ('GET', 'HEAD') and cacheable(request, response)
+            # A template still used {% csrf_token %}
+            and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+        # Browsers revalidate; the proxy serves its copy for the shell's lifetime
+        patch_cache_control(response, public=True, max_age=0, s_maxage=shell.max_age())
+    return response
+
+
+def when_rendered(response, callback):
+    """Call ``callback(response)`` now, or once a template response is rendered."""
+    if getattr(response, 'is_rendered', True):
+        callback(response)
+    else:
+        response.add_post_render_callback(callback)
+    return response
+
+
+def _store(request, response, key, cache):
+    share(request, response)
+    if not cacheable(request, response):
+        return
+    content = CSRF_INPUT_RE.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content)
+    headers = [(name, value) for name, value in response.items()
+               if name.lower() not in ('set-cookie', 'x-page-cache')]
+    cache.set(key, (response.status_code, headers, content), timeout())
+
+
+def _restore(request, cached):
+    status, headers, content = cached
+    if CSRF_PLACEHOLDER in content:
+        content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+    response = HttpResponse(content, status=status)
+    for name, value in headers:
+        response[name] = value
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def serve(request, view_func, tags):
+    """Return a cached page for ``request`` or render it with ``view_func`` and cache it."""
+    if not is_enabled() or bypass(request):
+        return when_rendered(view_func(), lambda r: share(request, r))
+
+    cache = get_cache()
+    key = page_key(request, tags, cache)
+    cached = cache.get(key)
+    if cached is not None:
+        return _restore(request, cached)
+
+    response = view_func()
+    response['X-Page-Cache'] = 'miss'
+    return when_rendered(response, lambda r: _store(request, r, key, cache))
+
+
+async def aserve(request, view_func, tags):
+    """``serve()`` for async views; ``view_func()`` returns an awaitable."""
+    if not is_enabled() or bypass(request):
+        return when_rendered(await view_func(), lambda r: share(request, r))
+
+    cache = get_cache()
+    key = await sync_to_async(page_key)(request, tags, cache)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return _restore(request, cached)
+
+    response = await view_func()
+    response['X-Page-Cache'] = 'miss'
+    if getattr(response, 'is_rendered', True):
+        await sync_to_async(_store)(request, response, key, cache)
+    else:
+        # Async handlers render in a thread, so the callback may use the cache directly
+        response.add_post_render_callback(lambda r: _store(request, r, key, cache))
+    return response
+
+
+class CachedPageMixin:
+    """
+    Serve a class-based view through the page cache.
+
+    ``cache_models`` lists every model the rendered page depends on.
+    """
+    cache_models = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        parent = super().dispatch
+        tags = [tag_for(model) for model in self.cache_models]
+        if self.view_is_async:
+            return aserve(request, lambda: parent(request, *args, **kwargs), tags)
+        return serve(request, lambda: parent(request, *args, **kwargs), tags)
+
+
+def invalidate_sender(sender, **kwargs):
+    invalidate(sender)
+
+
+def connect_signals():
+    from django.apps import apps
+
+    for label in TAGGED_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(invalidate_sender, sender=model, dispatch_uid=f'page_cache_save_{label}')
+        post_delete.connect(invalidate_sender, sender=model, dispatch_uid=f'page_cache_delete_{label}')
@@ -0,0 +1,533 @@
+"""
+Content bundles: move site content between databases as JSON Lines or CSV.
+
+A bundle is a directory holding a ``manifest.json`` and one file per section
+(``treatments.jsonl``, ``faqs.jsonl``, ...), plus the referenced uploads
+under ``media/`` when exported with ``--media``. Rows point at each other by
+natural key (treatment slug, author username) instead of database ids, so a
+bundle exported from staging imports cleanly into production.
+
+Imports stream each file in batches. Sections keyed by a unique column are
+upserted with ``bulk_create(update_conflicts=True)``, the others are matched
+on their key with one lookup per batch, and the child rows of each parent
+(a treatment's FAQs and before/after cases, a practitioner's treatments and
+working hours) are replaced as a set. Every row is compared against the
+database first, so unchanged rows cost nothing and a dry run can print the
+same diff without writing.
+"""
+import csv
+import json
+import shutil
+import time
+from collections import Counter
+from contextlib import nullcontext
+from datetime import date, datetime, time as time_of_day
+from itertools import groupby, islice
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.utils import timezone
+
+from . import freshness
+from .models import Treatment, TreatmentFAQ, BeforeAfterImage, TeamMember, Testimonial, BlogPost, WorkingHours
+
+FORMATS = ('jsonl', 'csv')
+MANIFEST_NAME = 'manifest.json'
+MEDIA_DIR = 'media'
+BATCH_SIZE = 1000
+
+# How rows are matched against existing ones
+UPSERT = 'upsert'    # ``key`` is a unique column: INSERT ... ON CONFLICT DO UPDATE
+MATCH = 'match'      # ``key`` is not unique: look up ids, then bulk_update/bulk_create
+REPLACE = 'replace'  # child rows: the set belonging to each parent is replaced
+
+# Stands in for the id of a parent that a dry run would have created
+PENDING = object()
+
+
+class Section:
+    """How one model is written to and read back from a bundle."""
+
+    def __init__(self, name, model, fields, key, mode, refs=None, ordering=('pk',),
+                 queryset=None, defaults=None, compiled=()):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.key = key
+        self.mode = mode
+        # {foreign key: (related model, natural key field)}
+        self.refs = refs or {}
+        self.ordering = ordering
+        self._queryset = queryset
+        self._defaults = defaults
+        # Fields the model's compile_content() derives on save, which bulk writes skip
+        self.compiled = list(compiled)
+
+    def __repr__(self):
+        return f'<Section {self.name}>'
+
+    def field(self, name):
+        return self.model._meta.get_field(name)
+
+    def attname(self, name):
+        return self.field(name).attname
+
+    @property
+    def media_fields(self):
+        return [name for name in self.fields if isinstance(self.field(name), models.FileField)]
+
+    @property
+    def auto_now_fields(self):
+        return [field.attname for field in self.model._meta.concrete_fields
+                if getattr(field, 'auto_now', False)]
+
+    def queryset(self):
+        queryset = self._queryset() if self._queryset else self.model._default_manager.all()
+        return queryset.select_related(*self.refs).order_by(*self.ordering)
+
+    def defaults(self):
+        """Extra values for newly created rows only."""
+        return self._defaults() if self._defaults else {}
+
+    def build(self, **values):
+        obj = self.model(**values)
+        if self.compiled:
+            obj.compile_content()
+        return obj
+
+
+SECTIONS = [
+    Section('treatments', Treatment,
+            ['slug', 'name', 'category', 'description', 'what_to_expect', 'price_range',
+             'duration', 'duration_minutes', 'image', 'featured'],
+            key=('slug',), mode=UPSERT),
+    Section('faqs', TreatmentFAQ, ['treatment', 'order', 'question', 'answer'],
+            key=('treatment',), mode=REPLACE, refs={'treatment': (Treatment, 'slug')},
+            ordering=('treatment_id', 'order', 'pk')),
+    Section('cases', BeforeAfterImage, ['treatment', 'title', 'before_image', 'after_image'],
+            key=('treatment',), mode=REPLACE, refs={'treatment': (Treatment, 'slug')},
+            ordering=('treatment_id', 'pk')),
+    Section('team', TeamMember, ['name', 'role', 'bio', 'image', 'order'],
+            key=('name',), mode=MATCH),
+    # What each practitioner can be booked for, and when (azfi/booking.py)
+    Section('practitioners', TeamMember.treatments.through, ['teammember', 'treatment'],
+            key=('teammember',), mode=REPLACE,
+            refs={'teammember': (TeamMember, 'name'), 'treatment': (Treatment, 'slug')},
+            ordering=('teammember_id', 'treatment_id')),
+    Section('hours', WorkingHours, ['member', 'weekday', 'start', 'end'],
+            key=('member',), mode=REPLACE, refs={'member': (TeamMember, 'name')},
+            ordering=('member_id', 'weekday', 'start')),
+    Section('testimonials', Testimonial, ['name', 'treatment', 'quote', 'image', 'date', 'featured'],
+            key=('name', 'treatment', 'date'), mode=MATCH, refs={'treatment': (Treatment, 'slug')}),
+    # Only users who wrote a post; new ones get an unusable password
+    Section('authors', User, ['username', 'first_name', 'last_name', 'email'],
+            key=('username',), mode=UPSERT,
+            queryset=lambda: User.objects.filter(blog_posts__isnull=False).distinct(),
+            defaults=lambda: {'password': make_password(None)}),
+    Section('posts', BlogPost,
+            ['slug', 'title', 'author', 'published_date', 'excerpt', 'content', 'featured_image'],
+            key=('slug',), mode=UPSERT, refs={'author': (User, 'username')},
+            compiled=BlogPost.COMPILED_FIELDS),
+]
+
+
+def get_section(name):
+    for section in SECTIONS:
+        if section.name == name:
+            return section
+    raise KeyError(name)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Export
+
+def dump_row(section, obj):
+    """Plain JSON-compatible values for one object."""
+    row = {}
+    for name in section.fields:
+        if name in section.refs:
+            related = getattr(obj, name)
+            row[name] = getattr(related, section.refs[name][1]) if related else None
+            continue
+        field = section.field(name)
+        value = field.value_from_object(obj)
+        if isinstance(field, models.FileField):
+            value = value.name or ''
+        elif isinstance(value, (date, time_of_day)):
+            value = value.isoformat()
+        row[name] = value
+    return row
+
+
+def write_section(bundle, section, fmt, media):
+    """Stream ``section`` to ``<bundle>/<name>.<fmt>``; return the row count."""
+    path = Path(bundle) / f'{section.name}.{fmt}'
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as fh:
+        if fmt == 'csv':
+            writer = csv.DictWriter(fh, fieldnames=section.fields)
+            writer.writeheader()
+        for obj in section.queryset().iterator(chunk_size=BATCH_SIZE):
+            row = dump_row(section, obj)
+            media.update(row[name] for name in section.media_fields if row[name])
+            if fmt == 'csv':
+                writer.writerow({name: '' if value is None else value for name, value in row.items()})
+            else:
+                fh.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def copy_media(bundle, names):
+    """Copy uploads into ``<bundle>/media``; return the names that do not exist."""
+    missing = []
+    for name in sorted(names):
+        if not default_storage.exists(name):
+            missing.append(name)
+            continue
+        target = Path(bundle) / MEDIA_DIR / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with default_storage.open(name) as source, open(target, 'wb') as dest:
+            shutil.copyfileobj(source, dest)
+    return missing
+
+
+def export_bundle(bundle, fmt='jsonl', sections=None, include_media=False, log=None):
+    """Write every section (or only ``sections``) to ``bundle``; return the manifest."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}.")
+    bundle = Path(bundle)
+    bundle.mkdir(parents=True, exist_ok=True)
+
+    counts, media = {}, set()
+    for section in SECTIONS:
+        if sections and section.name not in sections:
+            continue
+        started = time.perf_counter()
+        counts[section.name] = write_section(bundle, section, fmt, media)
+        if log:
+            elapsed = time.perf_counter() - started
+            log(f"{section.name}: {counts[section.name]} rows in {elapsed:.2f}s")
+
+    missing = copy_media(bundle, media) if include_media else []
+    manifest = {
+        'version': 1,
+        'format': fmt,
+        'exported_at': timezone.now().isoformat(timespec='seconds'),
+        'sections': counts,
+        'media': {'included': include_media, 'files': len(media), 'missing': missing},
+    }
+    (bundle / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+# Import
+
+def read_section(bundle, section):
+    """Yield the raw rows of ``section``, or return ``None`` if the bundle has none."""
+    for fmt in FORMATS:
+        path = Path(bundle) / f'{section.name}.{fmt}'
+        if path.exists():
+            return _read(path, fmt)
+    return None
+
+
+def _read(path, fmt):
+    with open(path, newline='', encoding='utf-8') as fh:
+        if fmt == 'csv':
+            yield from csv.DictReader(fh)
+        else:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_value(section, name, raw):
+    if name in section.refs:
+        return raw or None
+    field = section.field(name)
+    if raw is None and not field.null and field.has_default():
+        # A bundle exported before the field existed
+        return field.get_default()
+    if raw is None or (raw == '' and field.null):
+        return None
+    if isinstance(field, models.FileField):
+        return raw
+    value = field.to_python(raw)
+    if isinstance(value, datetime) and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+class Importer:
+    """Apply the rows of a bundle to the database, recording a diff and timings."""
+
+    def __init__(self, dry_run=False, batch_size=BATCH_SIZE, log=None):
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.stats = {}
+        # Natural keys a dry run would have created, so children can refer to them
+        self.pending = {}
+        # Treatments whose FAQs, cases or testimonials changed (see azfi/freshness.py)
+        self.touched = set()
+
+    def import_section(self, section, rows):
+        stats = self.stats[section.name] = Counter()
+        started = time.perf_counter()
+        if section.mode == REPLACE:
+            # Keep every child of a parent in the same batch so its set is compared whole
+            groups = groupby(rows, key=lambda row: row.get(section.key[0]))
+            for batch in self.grouped_batches(groups):
+                self.apply(section, batch, stats)
+        else:
+            for batch in batched(rows, self.batch_size):
+                self.apply(section, batch, stats)
+        stats['seconds'] = time.perf_counter() - started
+        return stats
+
+    def grouped_batches(self, groups):
+        batch = []
+        for _key, group in groups:
+            batch.extend(group)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def apply(self, section, batch, stats):
+        stats['read'] += len(batch)
+        rows = self.resolve(section, batch, stats)
+        with transaction.atomic():
+            if section.mode == UPSERT:
+                self.upsert(section, rows, stats)
+            elif section.mode == MATCH:
+                self.match(section, rows, stats)
+            else:
+                self.replace(section, rows, stats)
+
+    def resolve(self, section, batch, stats):
+        """Parse values and turn natural-key references into ids, one query per reference."""
+        ids = {}
+        for name, (model, natural_key) in section.refs.items():
+            values = {row.get(name) for row in batch if row.get(name)}
+            found = dict(model._default_manager.filter(**{f'{natural_key}__in': values})
+                         .values_list(natural_key, 'pk'))
+            for value in self.pending.get(model, set()) & (values - found.keys()):
+                found[value] = PENDING
+            ids[name] = found
+
+        rows = []
+        for number, raw in enumerate(batch, start=stats['read'] - len(batch) + 1):
+            try:
+                row = {}
+                for name in section.fields:
+                    value = parse_value(section, name, raw.get(name))
+                    if name in section.refs and value is not None:
+                        if value not in ids[name]:
+                            raise ValidationError(f"unknown {name} {value!r}")
+                        value = ids[name][value]
+                    row[section.attname(name)] = value
+                for name in section.key:
+                    if row[section.attname(name)] in (None, '') and not section.field(name).null:
+                        raise ValidationError(f"missing {name}")
+                row['_label'] = '/'.join(str(raw.get(name) or '-') for name in section.key)
+            except (ValidationError, ValueError, TypeError) as exc:
+                stats['skipped'] += 1
+                message = '; '.join(exc.messages) if isinstance(exc, ValidationError) else str(exc)
+                self.log(f"! {section.name} row {number}: {message}")
+                continue
+            rows.append(row)
+        return rows
+
+    def key_of(self, section, row):
+        return tuple(row[section.attname(name)] for name in section.key)
+
+    def diff(self, section, rows, stats):
+        """Split ``rows`` into new and changed ones against the database."""
+        columns = [section.attname(name) for name in section.fields]
+        unique = {}
+        for row in rows:
+            key = self.key_of(section, row)
+            if key in unique:
+                stats['skipped'] += 1
+                self.log(f"! {section.name}/{row['_label']}: duplicate key, the last row wins")
+            unique[key] = row
+
+        lookup = {}
+        first = section.attname(section.key[0])
+        for existing in section.model._default_manager.filter(
+                **{f'{first}__in': {key[0] for key in unique}}).order_by().values('pk', *columns):
+            lookup[tuple(existing[section.attname(name)] for name in section.key)] = existing
+
+        created, changed = [], []
+        for key, row in unique.items():
+            existing = lookup.get(key)
+            if existing is None:
+                created.append(row)
+                stats['created'] += 1
+                self.log(f"+ {section.name}/{row['_label']}")
+                continue
+            fields = [column for column in columns if _normalise(existing[column]) != _normalise(row[column])]
+            if fields:
+                changed.append(dict(row, pk=existing['pk']))
+                stats['updated'] += 1
+                self.log(f"~ {section.name}/{row['_label']} ({', '.join(fields)})")
+            else:
+                stats['unchanged'] += 1
+        return created, changed
+
+    def upsert(self, section, rows, stats):
+        created, changed = self.diff(section, rows, stats)
+        if self.dry_run:
+            self.pending.setdefault(section.model, set()).update(
+                row[section.attname(section.key[0])] for row in created)
+            return
+        if not created and not changed:
+            return
+        defaults = section.defaults()
+        objs = [section.build(**fields_of(row), **defaults) for row in created]
+        objs += [section.build(**fields_of(row)) for row in changed]
+        update_fields = [section.attname(name) for name in section.fields
+                         if name not in section.key] + section.auto_now_fields + section.compiled
+        section.model._default_manager.bulk_create(
+            objs, batch_size=self.batch_size, update_conflicts=True,
+            unique_fields=list(section.key), update_fields=update_fields,
+        )
+
+    def match(self, section, rows, stats):
+        if any(value is PENDING for row in rows for value in row.values()):
+            # Only happens in dry runs: the referenced parent does not exist yet
+            for row in rows:
+                stats['created'] += 1
+                self.log(f"+ {section.name}/{row['_label']}")
+            return
+        created, changed = self.diff(section, rows, stats)
+        if self.dry_run:
+            self.pending.setdefault(section.model, set()).update(
+                row[section.attname(section.key[0])] for row in created)
+            return
+        manager = section.model._default_manager
+        manager.bulk_create([section.build(**fields_of(row)) for row in created], batch_size=self.batch_size)
+        manager.bulk_update([section.build(pk=row['pk'], **fields_of(row)) for row in changed],
+                            [section.attname(name) for name in section.fields] + section.compiled,
+                            batch_size=self.batch_size)
+        if section.model in freshness.PARENTS:
+            self.touched.update(row[freshness.PARENTS[section.model]] for row in created + changed)
+
+    def replace(self, section, rows, stats):
+        parent = section.attname(section.key[0])
+        columns = [section.attname(name) for name in section.fields if name != section.key[0]]
+        incoming = {}
+        for row in rows:
+            incoming.setdefault(row[parent], []).append(row)
+
+        existing = {}
+        parent_ids = [pk for pk in incoming if pk is not PENDING]
+        current = section.model._default_manager.filter(**{f'{parent}__in': parent_ids})
+        for row in current.order_by().values(parent, *columns):
+            existing.setdefault(row[parent], []).append(row)
+
+        replace_ids, new_rows = [], []
+        for parent_id, children in incoming.items():
+            before = Counter(_signature(row, columns) for row in existing.get(parent_id, []))
+            after = Counter(_signature(row, columns) for row in children)
+            if before == after:
+                stats['unchanged'] += len(children)
+                continue
+            added, removed = sum((after - before).values()), sum((before - after).values())
+            stats['created'] += added
+            stats['deleted'] += removed
+            stats['unchanged'] += len(children) - added
+            self.log(f"~ {section.name}/{children[0]['_label']} (+{added} -{removed})")
+            replace_ids.append(parent_id)
+            new_rows.extend(children)
+
+        if self.dry_run or not replace_ids:
+            return
+        manager = section.model._default_manager
+        manager.filter(**{f'{parent}__in': replace_ids}).delete()
+        manager.bulk_create([section.build(**fields_of(row)) for row in new_rows], batch_size=self.batch_size)
+        if section.model in freshness.PARENTS:
+            self.touched.update(replace_ids)
+
+
+def fields_of(row):
+    return {name: value for name, value in row.items() if name != 'pk' and not name.startswith('_')}
+
+
+def _normalise(value):
+    # FileFields come back as '' or None depending on the column's nullability
+    return '' if value is None else value
+
+
+def _signature(row, columns):
+    return tuple(_normalise(row[column]) for column in columns)
+
+
+def copy_media_in(bundle, dry_run=False):
+    """Copy bundled uploads that are not in storage yet; return how many."""
+    root = Path(bundle) / MEDIA_DIR
+    if not root.is_dir():
+        return 0
+    copied = 0
+    for path in sorted(root.rglob('*')):
+        name = path.relative_to(root).as_posix()
+        if path.is_file() and not default_storage.exists(name):
+            copied += 1
+            if not dry_run:
+                with open(path, 'rb') as fh:
+                    default_storage.save(name, File(fh))
+    return copied
+
+
+def import_bundle(bundle, dry_run=False, batch_size=BATCH_SIZE, sections=None,
+                  atomic=False, media=True, log=None):
+    """
+    Import ``bundle`` and return ``(stats, media_copied)``.
+
+    Each batch commits on its own unless ``atomic`` is set, in which case the
+    whole import is one transaction. Afterwards the search index is rebuilt
+    and the page cache invalidated, treatments whose children changed are
+    touched and pre-rendered pages of the changed models are queued for
+    rebuilding, since bulk writes bypass their signals.
+    """
+    from . import cache, minhash, prerender, search, similarity
+
+    bundle = Path(bundle)
+    if not bundle.is_dir():
+        raise FileNotFoundError(f"{bundle} is not a content bundle directory.")
+
+    importer = Importer(dry_run=dry_run, batch_size=batch_size, log=log)
+    with transaction.atomic() if atomic else nullcontext():
+        for section in SECTIONS:
+            if sections and section.name not in sections:
+                continue
+            rows = read_section(bundle, section)
+            if rows is not None:
+                importer.import_section(section, rows)
+        media_copied = copy_media_in(bundle, dry_run) if media else 0
+
+    changed = [get_section(name).model for name, stats in importer.stats.items()
+               if stats['created'] or stats['updated'] or stats['deleted']]
+    if changed and not dry_run:
+        search.rebuild()
+        if Treatment in changed or TreatmentFAQ in changed:
+            similarity.rebuild()
+        if BlogPost in changed:
+            minhash.rebuild()
+        cache.invalidate(*changed)
+        freshness.touch_treatments(importer.touched)
+        prerender.enqueue_changes(changed)
+    return importer.stats, media_copied
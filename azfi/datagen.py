@@ -0,0 +1,260 @@
+"""
+Synthetic, internally consistent content for load testing and benchmarks.
+
+``generate(scale)`` bulk-creates rows for every model in ``azfi/models.py``.
+Counts grow linearly with ``scale``; at ``scale=10`` that is 200 treatments
+with two dozen FAQs each, 5,000 blog posts and a million contact leads.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import time as clock, timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import (
+    Treatment, TreatmentFAQ, BeforeAfterImage,
+    TeamMember, Testimonial, BlogPost, Contact, WorkingHours, Booking
+)
+
+MODELS = (Treatment, TreatmentFAQ, BeforeAfterImage, TeamMember, WorkingHours, Testimonial, BlogPost, Contact)
+
+BATCH_SIZE = 5000
+
+# Rows per unit of scale
+PER_SCALE = {
+    'treatments': 20,
+    'testimonials': 30,
+    'posts': 500,
+    'contacts': 100_000,
+}
+FAQS_PER_TREATMENT = 24
+CASES_PER_TREATMENT = 4
+TEAM_MEMBERS = 8
+PRACTITIONERS_PER_TREATMENT = 2
+# (weekday, opens, closes) of every practitioner; Saturdays for some
+WEEKDAY_HOURS = [(day, clock(9), clock(17)) for day in range(5)]
+SATURDAY_HOURS = (5, clock(10), clock(14))
+AUTHORS = 5
+
+ADJECTIVES = ['Advanced', 'Signature', 'Express', 'Deluxe', 'Gentle', 'Intensive', 'Radiance',
+              'Restorative', 'Luminous', 'Precision', 'Hydrating', 'Sculpting']
+PROCEDURES = {
+    'FACE': ['Facial', 'Chemical Peel', 'Microneedling', 'HydraFacial', 'LED Therapy', 'Dermaplaning'],
+    'BODY': ['Body Contouring', 'Laser Hair Removal', 'Cellulite Treatment', 'Skin Tightening'],
+    'INJECTABLES': ['Dermal Fillers', 'Anti-Wrinkle Injections', 'Lip Enhancement', 'Skin Boosters'],
+}
+WORDS = ('skin collagen elastin texture tone hydration peel laser filler volume contour '
+         'downtime recovery session results natural radiant smooth firm glow consultation '
+         'treatment clinic practitioner sensitive pigmentation wrinkles lines scarring acne '
+         'sun damage rejuvenation appointment aftercare comfortable numbing cream minutes '
+         'weeks months lasting visible improvement gentle safe effective').split()
+FIRST_NAMES = ['Sarah', 'James', 'Michelle', 'David', 'Amara', 'Robert', 'Sophia', 'Emma',
+               'Michael', 'Jessica', 'Olivia', 'Liam', 'Noah', 'Ava', 'Mia', 'Lucas']
+LAST_NAMES = ['Williams', 'Johnson', 'Chen', 'Martinez', 'Taylor', 'Brown', 'Lee', 'Patel',
+              'Garcia', 'Nguyen', 'Kim', 'Smith']
+
+
+class TextFactory:
+    """Deterministic filler text built from a small aesthetics vocabulary."""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def sentence(self, low=8, high=18):
+        text = self.words(self.rng.randint(low, high))
+        return text[0].upper() + text[1:] + '.'
+
+    def paragraph(self, sentences=4):
+        return ' '.join(self.sentence() for _ in range(sentences))
+
+    def article(self, sections=4):
+        parts = []
+        for _ in range(sections):
+            parts.append(f"**{self.words(3).title()}**")
+            parts.append(self.paragraph(self.rng.randint(3, 6)))
+        return '\n\n'.join(parts)
+
+    def name(self):
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+
+@contextmanager
+def explicit_timestamps(model, field_name='created_at'):
+    """Let bulk_create keep the ``auto_now_add`` values we set, so history can be backdated."""
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def counts_for(scale):
+    counts = {key: max(1, int(per * scale)) for key, per in PER_SCALE.items()}
+    counts['faqs'] = counts['treatments'] * FAQS_PER_TREATMENT
+    counts['cases'] = counts['treatments'] * CASES_PER_TREATMENT
+    counts['team'] = TEAM_MEMBERS
+    counts['authors'] = AUTHORS
+    return counts
+
+
+def flush():
+    """Delete all content rows (users other than superusers included)."""
+    Contact.objects.all().delete()
+    Booking.objects.all().delete()
+    BlogPost.objects.all().delete()
+    Testimonial.objects.all().delete()
+    TeamMember.objects.all().delete()
+    Treatment.objects.all().delete()
+    User.objects.filter(username__startswith='author-').delete()
+
+
+def create_treatments(rng, text, count):
+    rows = []
+    for i in range(count):
+        category = list(PROCEDURES)[i % len(PROCEDURES)]
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(PROCEDURES[category])} {i + 1}"
+        low = rng.randrange(100, 600, 50)
+        minutes = rng.choice([15, 20, 30, 45, 60, 90])
+        rows.append(Treatment(
+            name=name,
+            slug=slugify(name),
+            description=text.paragraph(5),
+            what_to_expect=text.paragraph(4),
+            price_range=f"${low} - ${low + rng.randrange(100, 800, 50)}",
+            duration=f"{minutes} minutes",
+            duration_minutes=minutes,
+            image='treatments/placeholder.jpg',
+            category=category,
+            featured=rng.random() < 0.15,
+        ))
+    return Treatment.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+def create_faqs(rng, text, treatments):
+    rows = [
+        TreatmentFAQ(treatment=treatment, question=text.sentence(5, 10)[:-1] + '?',
+                     answer=text.paragraph(2), order=order)
+        for treatment in treatments for order in range(FAQS_PER_TREATMENT)
+    ]
+    return TreatmentFAQ.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+def create_cases(rng, text, treatments, now):
+    rows = [
+        BeforeAfterImage(treatment=treatment, title=f"Case {n + 1}: {text.words(3).title()}",
+                         before_image='before_after/before/placeholder.jpg',
+                         after_image='before_after/after/placeholder.jpg',
+                         created_at=now - timedelta(days=rng.randint(0, 2 * 365)))
+        for treatment in treatments for n in range(CASES_PER_TREATMENT)
+    ]
+    with explicit_timestamps(BeforeAfterImage):
+        return BeforeAfterImage.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+def create_team(rng, text, treatments):
+    roles = ['Aesthetician', 'Nurse Injector', 'Laser Technician', 'Medical Director']
+    rows = [
+        TeamMember(name=text.name(), role=rng.choice(roles), bio=text.paragraph(3),
+                   image='team/placeholder.jpg', order=order)
+        for order in range(TEAM_MEMBERS)
+    ]
+    team = TeamMember.objects.bulk_create(rows)
+    WorkingHours.objects.bulk_create([
+        WorkingHours(member=member, weekday=weekday, start=opens, end=closes)
+        for member in team
+        for weekday, opens, closes in WEEKDAY_HOURS + ([SATURDAY_HOURS] if rng.random() < 0.5 else [])
+    ])
+    Offered = TeamMember.treatments.through
+    Offered.objects.bulk_create([
+        Offered(teammember_id=member.pk, treatment_id=treatment.pk)
+        for treatment in treatments for member in rng.sample(team, PRACTITIONERS_PER_TREATMENT)
+    ], batch_size=BATCH_SIZE)
+    return team
+
+
+def create_testimonials(rng, text, treatments, count, now):
+    rows = [
+        Testimonial(name=text.name(), treatment=rng.choice(treatments), quote=text.paragraph(2),
+                    date=(now - timedelta(days=rng.randint(0, 3 * 365))).date(),
+                    featured=rng.random() < 0.2)
+        for _ in range(count)
+    ]
+    return Testimonial.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+def create_posts(rng, text, count, now):
+    authors = []
+    for i in range(AUTHORS):
+        first, last = text.name().split()
+        author, _created = User.objects.get_or_create(
+            username=f'author-{i}', defaults={'first_name': first, 'last_name': last})
+        authors.append(author)
+
+    rows = []
+    for i in range(count):
+        words = text.words(rng.randint(4, 8))
+        published = now - timedelta(minutes=rng.randint(0, 5 * 365 * 24 * 60))
+        rows.append(BlogPost(
+            title=f"{words.title()} {i + 1}", slug=f"{slugify(words)[:40]}-{i + 1}",
+            author=rng.choice(authors), content=text.article(rng.randint(3, 6)),
+            excerpt=text.sentence(15, 25), featured_image='blog/placeholder.jpg',
+            published_date=published, created_at=published,
+        ))
+        rows[-1].compile_content()
+    with explicit_timestamps(BlogPost):
+        return BlogPost.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+def create_contacts(rng, text, count, now):
+    """Leads arrive in order over the last two years; older ones are mostly answered."""
+    span = timedelta(days=2 * 365)
+    step = span / count
+    with explicit_timestamps(Contact):
+        for start in range(0, count, BATCH_SIZE):
+            rows = []
+            for n in range(start, min(start + BATCH_SIZE, count)):
+                name = text.name()
+                rows.append(Contact(
+                    name=name, email=f"{slugify(name)}.{rng.randrange(10 ** 6)}@example.com",
+                    phone=f"+1 555 {rng.randrange(10 ** 7):07d}", message=text.paragraph(2),
+                    created_at=now - span + step * n,
+                    responded=rng.random() < (0.95 if n < count * 0.9 else 0.2),
+                ))
+            Contact.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return count
+
+
+def generate(scale=1, seed=0, log=None):
+    """Bulk-create a synthetic dataset and return ``{label: rows created}``."""
+    rng = random.Random(seed)
+    text = TextFactory(rng)
+    counts = counts_for(scale)
+    now = timezone.now()
+    created = {}
+
+    def step(label, func, *args):
+        started = time.perf_counter()
+        result = func(rng, text, *args)
+        created[label] = result if isinstance(result, int) else len(result)
+        if log:
+            log(f"{label}: {created[label]} rows in {time.perf_counter() - started:.1f}s")
+        return result
+
+    with transaction.atomic():
+        treatments = step('treatments', create_treatments, counts['treatments'])
+        step('faqs', create_faqs, treatments)
+        step('cases', create_cases, treatments, now)
+        step('team', create_team, treatments)
+        step('testimonials', create_testimonials, treatments, counts['testimonials'], now)
+        step('posts', create_posts, counts['posts'], now)
+        step('contacts', create_contacts, counts['contacts'], now)
+
+    return created
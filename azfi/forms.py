@@ -2,12 +2,18 @@ from django import forms
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, Row, Column
 
-from .models import Contact
+from .models import Contact, TeamMember, Treatment
 
 class ContactForm(forms.ModelForm):
+    # contact.html collects the name in two parts plus an optional subject and booking flag
+    first_name = forms.CharField(max_length=50)
+    last_name = forms.CharField(max_length=50)
+    subject = forms.CharField(max_length=100, required=False)
+    booking = forms.BooleanField(required=False)
+    
     class Meta:
         model = Contact
-        fields = ['name', 'email', 'phone', 'message']
+        fields = ['email', 'phone', 'message']
         widgets = {
             'message': forms.Textarea(attrs={'rows': 5}),
         }
@@ -18,14 +24,62 @@ class ContactForm(forms.ModelForm):
         self.helper.form_method = 'post'
         self.helper.layout = Layout(
             Row(
-                Column('name', css_class='form-group col-md-6 mb-3'),
-                Column('email', css_class='form-group col-md-6 mb-3'),
+                Column('first_name', css_class='form-group col-md-6 mb-3'),
+                Column('last_name', css_class='form-group col-md-6 mb-3'),
                 css_class='row'
             ),
             Row(
+                Column('email', css_class='form-group col-md-6 mb-3'),
                 Column('phone', css_class='form-group col-md-6 mb-3'),
                 css_class='row'
             ),
+            'subject',
             'message',
+            'booking',
             Submit('submit', 'Send Message', css_class='btn btn-primary mt-4')
-        ) 
\ No newline at end of file
+        )
+    
+    def contact_fields(self):
+        """Return the ``Contact`` field values for this submission."""
+        data = self.cleaned_data
+        header = []
+        if data.get('booking'):
+            header.append("Booking request")
+        if data.get('subject'):
+            header.append(f"Subject: {data['subject']}")
+        message = data['message']
+        if header:
+            message = "\n".join(header) + "\n\n" + message
+        return {
+            'name': f"{data['first_name']} {data['last_name']}".strip()[:100],
+            'email': data['email'],
+            'phone': data['phone'],
+            'message': message,
+        }
+    
+    def save(self, commit=True):
+        contact = super().save(commit=False)
+        for field, value in self.contact_fields().items():
+            setattr(contact, field, value)
+        if commit:
+            contact.save()
+        return contact
+
+
+class NewsletterForm(forms.Form):
+    email = forms.EmailField()
+
+
+class BookingForm(forms.Form):
+    # booking.html posts the chosen slot's start and, when one was picked, its practitioner
+    treatment = forms.ModelChoiceField(Treatment.objects.all(), to_field_name='slug')
+    start = forms.DateTimeField()
+    member = forms.ModelChoiceField(TeamMember.objects.all(), required=False)
+    name = forms.CharField(max_length=100)
+    email = forms.EmailField()
+    phone = forms.CharField(max_length=20)
+    notes = forms.CharField(widget=forms.Textarea(attrs={'rows': 3}), required=False)
+
+    def booking_details(self):
+        """Return the ``Booking`` field values describing the client."""
+        return {name: self.cleaned_data[name] for name in ('name', 'email', 'phone', 'notes')}
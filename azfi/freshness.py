@@ -0,0 +1,190 @@
+"""
+Conditional GET for the treatment and blog pages.
+
+``ConditionalGetMixin`` works out a page's freshness with one aggregate query
+(the newest ``updated_at`` and the row count of the models it renders)
+before the view runs. It answers ``If-None-Match`` and ``If-Modified-Since``
+with 304 Not Modified, and otherwise adds ``ETag`` and ``Last-Modified`` to
+the full response. The page cache keeps the result next to the page, under
+the same tag versions (azfi/cache.py), so a page served from the cache is
+validated without touching the database either.
+
+FAQs, before/after cases and testimonials have no ``updated_at`` of their
+own, so saving or deleting one touches its treatment's instead, and the
+treatment's timestamp stands for the whole page. Moving one to another
+treatment touches both. Likewise, saving a user touches their blog posts,
+whose pages show the author's name.
+"""
+import hashlib
+from calendar import timegm
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import cached_property
+from django.utils.http import http_date
+
+from . import cache, shell
+from .models import Treatment, TreatmentFAQ, BeforeAfterImage, Testimonial, BlogPost
+
+# Stands for "not cached"; a page with no rows caches None
+MISSING = object()
+
+# Child model -> foreign key to the Treatment whose updated_at it bumps
+PARENTS = {
+    TreatmentFAQ: 'treatment_id',
+    BeforeAfterImage: 'treatment_id',
+    Testimonial: 'treatment_id',
+}
+
+
+def is_enabled():
+    return getattr(settings, 'CONDITIONAL_GET_ENABLED', True)
+
+
+def touch_treatments(ids):
+    ids = {pk for pk in ids if pk is not None}
+    if ids:
+        Treatment.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+
+
+def remember_parent(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._freshness_previous_parent = sender._default_manager.filter(pk=instance.pk).values_list(
+            PARENTS[sender], flat=True).first()
+
+
+def touch_parent(sender, instance, **kwargs):
+    # The treatment it was moved from no longer shows it either
+    touch_treatments([getattr(instance, PARENTS[sender]), getattr(instance, '_freshness_previous_parent', None)])
+
+
+def touch_authored(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        # Logging in does not change anything a page shows
+        return
+    BlogPost.objects.filter(author=instance).update(updated_at=timezone.now())
+
+
+def connect_signals():
+    for model in PARENTS:
+        label = model._meta.label_lower
+        pre_save.connect(remember_parent, sender=model, dispatch_uid=f'freshness_pre_save_{label}')
+        post_save.connect(touch_parent, sender=model, dispatch_uid=f'freshness_save_{label}')
+        post_delete.connect(touch_parent, sender=model, dispatch_uid=f'freshness_delete_{label}')
+    post_save.connect(touch_authored, sender=User, dispatch_uid='freshness_save_auth.user')
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GETs with 304 before anything is rendered.
+
+    Subclasses return the queryset the page depends on from
+    ``get_freshness_queryset()``; its newest ``updated_at`` and its row count
+    (so deletions show up too) validate the page. Put the mixin before
+    ``CachedPageMixin`` so a 304 skips the page cache as well; the validators
+    are cached under the view's ``cache_models`` tags. Async views run the
+    aggregate with the async ORM.
+    """
+    freshness_field = 'updated_at'
+
+    def get_freshness_queryset(self):
+        raise NotImplementedError
+
+    def freshness_aggregate(self):
+        return {'latest': Max(self.freshness_field), 'rows': Count('pk')}
+
+    def validators(self, state):
+        """``(last_modified, etag)`` from the aggregate, or None if there is nothing to validate."""
+        if not state['rows']:
+            return None
+        raw = '|'.join([
+            getattr(settings, 'CONDITIONAL_GET_VERSION', ''), self.request.get_full_path(),
+            state['latest'].isoformat(), str(state['rows']),
+        ])
+        return timegm(state['latest'].utctimetuple()), f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+    def validators_key(self):
+        """Where the page cache keeps this page's validators, or None when it would not serve the page."""
+        models = getattr(self, 'cache_models', ())
+        if not models or not cache.is_enabled() or cache.bypass(self.request):
+            return None
+        return cache.validators_key(self.request, [cache.tag_for(model) for model in models])
+
+    @cached_property
+    def freshness(self):
+        key = self.validators_key()
+        if key is not None:
+            stored = cache.get_cache().get(key, MISSING)
+            if stored is not MISSING:
+                return stored
+        found = self.validators(self.get_freshness_queryset().order_by().aggregate(**self.freshness_aggregate()))
+        if key is not None:
+            cache.get_cache().set(key, found, cache.timeout())
+        return found
+
+    async def afreshness(self):
+        key = await sync_to_async(self.validators_key)()
+        if key is not None:
+            stored = await cache.get_cache().aget(key, MISSING)
+            if stored is not MISSING:
+                return stored
+        found = self.validators(
+            await self.get_freshness_queryset().order_by().aaggregate(**self.freshness_aggregate()))
+        if key is not None:
+            await cache.get_cache().aset(key, found, cache.timeout())
+        return found
+
+    def skip_validation(self, request):
+        # A pending flash message must reach the browser, so always render
+        return (not is_enabled() or request.method not in ('GET', 'HEAD') or 'messages' in request.COOKIES
+                or shell.is_prerender(request))
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.adispatch(request, *args, **kwargs)
+        if self.skip_validation(request) or self.freshness is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        last_modified, etag = self.freshness
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        return self.add_validators(response, last_modified, etag)
+
+    async def adispatch(self, request, *args, **kwargs):
+        if self.skip_validation(request):
+            return await super().dispatch(request, *args, **kwargs)
+        freshness = await self.afreshness()
+        if freshness is None:
+            return await super().dispatch(request, *args, **kwargs)
+
+        last_modified, etag = freshness
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await super().dispatch(request, *args, **kwargs)
+        return self.add_validators(response, last_modified, etag)
+
+    def add_validators(self, response, last_modified, etag):
+        if response.status_code not in (200, 304):
+            return response
+
+        def add(response):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # A page shell marked public holds nothing per-visitor (azfi/cache.py share())
+            if shell.is_enabled() and 'public' in response.get('Cache-Control', ''):
+                return
+            # Revalidate every time; private because pages embed a per-visitor CSRF token
+            patch_cache_control(response, private=True, no_cache=True)
+
+        # After rendering, so the page cache stores the page before it is marked private
+        if getattr(response, 'is_rendered', True):
+            add(response)
+        else:
+            response.add_post_render_callback(add)
+        return response
@@ -0,0 +1,284 @@
+"""
+Responsive image derivatives for uploaded media.
+
+Every registered ImageField gets resized WebP and JPEG copies at the widths in
+``IMAGE_DERIVATIVE_WIDTHS`` plus a tiny blurred placeholder. Derivatives live
+under ``MEDIA_ROOT/derivatives/<original name without extension>/`` next to a
+``manifest.json`` that the ``responsive_images`` template tags read.
+"""
+import base64
+import io
+import json
+import logging
+import multiprocessing
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'derivatives'
+MANIFEST_NAME = 'manifest.json'
+
+# (app_label.ModelName, image field names) for every field we serve responsively
+IMAGE_FIELDS = [
+    ('azfi.Treatment', ('image',)),
+    ('azfi.BeforeAfterImage', ('before_image', 'after_image')),
+    ('azfi.TeamMember', ('image',)),
+    ('azfi.Testimonial', ('image',)),
+    ('azfi.BlogPost', ('featured_image',)),
+]
+
+DEFAULT_WIDTHS = (320, 640, 960, 1280, 1920)
+PLACEHOLDER_WIDTH = 24
+
+_executor = None
+_executor_lock = threading.Lock()
+_manifest_cache = {}
+_registry = {}
+
+
+def get_widths():
+    return tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DEFAULT_WIDTHS))
+
+
+def derivative_dir(name):
+    """Return the media-relative directory holding the derivatives of ``name``."""
+    root, _ext = posixpath.splitext(name)
+    return posixpath.join(DERIVATIVES_DIR, root)
+
+
+def derivative_name(name, width, fmt):
+    return posixpath.join(derivative_dir(name), f'{width}.{fmt}')
+
+
+def generate_derivatives(source_path, output_dir, widths, quality=80):
+    """
+    Write resized WebP/JPEG copies of ``source_path`` into ``output_dir``.
+
+    Runs inside a worker process, so it only deals with plain filesystem paths
+    and returns the manifest it wrote.
+    """
+    from PIL import Image, ImageFilter, ImageOps
+
+    os.makedirs(output_dir, exist_ok=True)
+    stat = os.stat(source_path)
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            # JPEG has no alpha channel, flatten onto white like a browser would
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        else:
+            image = image.convert('RGB')
+
+        source_width, source_height = image.size
+        # Never upscale; always keep at least one derivative
+        targets = sorted({w for w in widths if w < source_width} or {min(source_width, max(widths))})
+
+        written = []
+        for width in targets:
+            height = max(1, round(source_height * width / source_width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            resized.save(os.path.join(output_dir, f'{width}.webp'), 'WEBP', quality=quality, method=4)
+            resized.save(os.path.join(output_dir, f'{width}.jpg'), 'JPEG', quality=quality,
+                         optimize=True, progressive=True)
+            written.append(width)
+
+        placeholder_height = max(1, round(source_height * PLACEHOLDER_WIDTH / source_width))
+        placeholder = image.resize((PLACEHOLDER_WIDTH, placeholder_height), Image.BILINEAR)
+        placeholder = placeholder.filter(ImageFilter.GaussianBlur(2))
+        buffer = io.BytesIO()
+        placeholder.save(buffer, 'JPEG', quality=40)
+
+    manifest = {
+        'source_size': stat.st_size,
+        'source_mtime': int(stat.st_mtime),
+        'width': source_width,
+        'height': source_height,
+        'widths': written,
+        'placeholder': 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii'),
+    }
+    tmp_path = os.path.join(output_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w') as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST_NAME))
+    return manifest
+
+
+def load_manifest(name):
+    """Return the derivative manifest for media file ``name`` or ``None``."""
+    if not name:
+        return None
+    path = os.path.join(settings.MEDIA_ROOT, derivative_dir(name), MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        _manifest_cache.pop(name, None)
+        return None
+
+    cached = _manifest_cache.get(name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    _manifest_cache[name] = (mtime, manifest)
+    return manifest
+
+
+def srcset(name, manifest, fmt):
+    return ', '.join(
+        f"{default_storage.url(derivative_name(name, width, fmt))} {width}w"
+        for width in manifest['widths']
+    )
+
+
+def url_for_width(image, width, fmt='jpg'):
+    """The smallest derivative of ``image`` at least ``width`` pixels wide, or the original."""
+    if not image:
+        return ''
+    manifest = load_manifest(image.name)
+    if manifest is None:
+        return image.url
+    candidates = [w for w in manifest['widths'] if w >= int(width)] or manifest['widths'][-1:]
+    return default_storage.url(derivative_name(image.name, candidates[0], fmt))
+
+
+def describe(image, width):
+    """
+    What a script needs to build ``<picture>`` markup for ``image``: a
+    thumbnail at least ``width`` pixels wide, both ``srcset`` lists, the
+    intrinsic size and the blurred placeholder. Until the derivatives exist
+    only ``src``, the original upload, is filled in.
+    """
+    if not image:
+        return None
+    manifest = load_manifest(image.name)
+    if manifest is None:
+        return {'src': image.url, 'srcset': '', 'webp_srcset': '', 'width': None, 'height': None,
+                'placeholder': None}
+    largest = manifest['widths'][-1]
+    return {
+        'src': url_for_width(image, width),
+        'srcset': srcset(image.name, manifest, 'jpg'),
+        'webp_srcset': srcset(image.name, manifest, 'webp'),
+        'width': largest,
+        'height': round(manifest['height'] * largest / manifest['width']),
+        'placeholder': manifest['placeholder'],
+    }
+
+
+def is_current(name):
+    """True when derivatives exist for the current contents of ``name``."""
+    manifest = load_manifest(name)
+    if manifest is None:
+        return False
+    try:
+        stat = os.stat(os.path.join(settings.MEDIA_ROOT, name))
+    except OSError:
+        # Missing originals cannot be regenerated, keep whatever we have
+        return True
+    return (manifest.get('source_size') == stat.st_size
+            and manifest.get('source_mtime') == int(stat.st_mtime))
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def job_args(name):
+    return (
+        os.path.join(settings.MEDIA_ROOT, name),
+        os.path.join(settings.MEDIA_ROOT, derivative_dir(name)),
+        get_widths(),
+        getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80),
+    )
+
+
+def _log_failure(name):
+    def callback(future):
+        exc = future.exception()
+        if exc is not None:
+            logger.error("Could not build derivatives for %s: %s", name, exc)
+    return callback
+
+
+def submit(name, on_done=None):
+    """Queue derivative generation for ``name`` on the process pool."""
+    future = get_executor().submit(generate_derivatives, *job_args(name))
+    future.add_done_callback(_log_failure(name))
+    if on_done is not None:
+        future.add_done_callback(lambda future: on_done())
+    return future
+
+
+def build(name):
+    """Generate derivatives for ``name`` in the current process."""
+    return generate_derivatives(*job_args(name))
+
+
+def schedule(name, on_done=None):
+    if not os.path.exists(os.path.join(settings.MEDIA_ROOT, name)):
+        return
+    if getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+        submit(name, on_done)
+        return
+    try:
+        build(name)
+    except Exception as exc:
+        logger.error("Could not build derivatives for %s: %s", name, exc)
+    if on_done is not None:
+        on_done()
+
+
+def iter_image_names(model, field_names):
+    """Yield every stored file name for ``field_names`` on ``model``."""
+    for values in model.objects.values_list(*field_names).iterator(chunk_size=500):
+        for name in values:
+            if name:
+                yield name
+
+
+def refresh_derivatives(sender, instance, **kwargs):
+    """post_save handler: rebuild derivatives for new or replaced uploads."""
+    if kwargs.get('raw'):
+        return
+    from . import cache
+
+    # Cached pages still point at the original upload until the derivatives exist
+    def on_done():
+        cache.invalidate(sender)
+
+    for field_name in _registry.get(sender, ()):
+        name = getattr(instance, field_name).name
+        if name and not is_current(name):
+            transaction.on_commit(lambda name=name: schedule(name, on_done))
+
+
+def connect_signals():
+    from django.apps import apps
+
+    for label, field_names in IMAGE_FIELDS:
+        model = apps.get_model(label)
+        _registry[model] = field_names
+        post_save.connect(refresh_derivatives, sender=model,
+                          dispatch_uid=f'responsive_images_{label}')
@@ -0,0 +1,94 @@
+"""
+Write-behind intake for contact form submissions.
+
+``ContactView`` validates the form, spools the submission (see
+azfi/spool.py) and redirects straight away, so a burst of visitors never
+queues up behind SQLite's single writer. The queue worker stores spooled
+submissions as ``Contact`` rows in batches and then emails the clinic.
+
+Each submission carries an ``intake_id`` that is unique on ``Contact``, so a
+batch that is replayed after a crash does not store anything twice. A replay
+queues the emails again too; ``Contact.notified_at`` makes sure each
+submission is emailed once.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import spool
+from .models import Contact
+
+CONTACT_TOPIC = 'contact'
+NOTIFY_TOPIC = 'contact.notify'
+
+
+def is_async():
+    return getattr(settings, 'CONTACT_INTAKE_ASYNC', True)
+
+
+def submit_contact(fields):
+    """Accept a validated submission; stored by the worker unless intake is synchronous."""
+    if not is_async():
+        contact = Contact.objects.create(**fields)
+        notify([contact])
+        return contact
+    spool.enqueue(CONTACT_TOPIC, dict(
+        fields, intake_id=uuid.uuid4().hex, submitted_at=timezone.now().isoformat(),
+    ))
+
+
+def store_contacts(jobs):
+    """Insert a batch of spooled submissions in one transaction, then queue their emails."""
+    payloads = [job.payload for job in jobs]
+    contacts = [
+        Contact(name=p['name'], email=p['email'], phone=p['phone'], message=p['message'],
+                intake_id=uuid.UUID(p['intake_id']))
+        for p in payloads
+    ]
+    with transaction.atomic():
+        Contact.objects.bulk_create(contacts, ignore_conflicts=True)
+        # created_at is auto_now_add; keep the time the visitor submitted, not the flush time
+        Contact.objects.filter(intake_id__in=[c.intake_id for c in contacts]).update(
+            created_at=Case(
+                *[When(intake_id=uuid.UUID(p['intake_id']), then=Value(parse_datetime(p['submitted_at'])))
+                  for p in payloads],
+                output_field=DateTimeField(),
+            )
+        )
+    spool.get_spool().enqueue_many(NOTIFY_TOPIC, [{'intake_id': p['intake_id']} for p in payloads])
+
+
+def notify(contacts):
+    recipients = getattr(settings, 'CONTACT_NOTIFICATION_EMAILS', [])
+    if not recipients or not contacts:
+        return
+    messages = [
+        EmailMessage(
+            subject=f"New enquiry from {contact.name}",
+            body=render_to_string('emails/contact_notification.txt', {'contact': contact}),
+            to=recipients,
+            reply_to=[contact.email],
+        )
+        for contact in contacts
+    ]
+    with get_connection() as connection:
+        connection.send_messages(messages)
+    Contact.objects.filter(pk__in=[contact.pk for contact in contacts]).update(notified_at=timezone.now())
+
+
+def notify_contacts(jobs):
+    """Email the clinic about stored submissions, one connection per batch."""
+    ids = [uuid.UUID(job.payload['intake_id']) for job in jobs]
+    notify(list(Contact.objects.filter(intake_id__in=ids, notified_at__isnull=True)))
+
+
+def register_topics():
+    spool.register(CONTACT_TOPIC, store_contacts,
+                   batch_size=getattr(settings, 'CONTACT_INTAKE_BATCH_SIZE', 200))
+    spool.register(NOTIFY_TOPIC, notify_contacts, batch_size=50)
@@ -0,0 +1,221 @@
+import asyncio
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import override_settings
+
+from azfi import cache, datagen, minhash, search, similarity
+
+from .benchmark_views import git_commit, percentile, routes
+
+MODES = ('wsgi', 'asgi')
+DEFAULT_ROUTES = ('home', 'treatment_detail', 'blog_list')
+
+
+def wsgi_get(application, url):
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': parts.path, 'QUERY_STRING': parts.query,
+        'SCRIPT_NAME': '', 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+        'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    status = []
+    body = application(environ, lambda line, headers: status.append(int(line.split()[0])))
+    try:
+        for _chunk in body:
+            pass
+    finally:
+        # Fires request_finished, which closes the thread's database connection
+        body.close()
+    return status[0]
+
+
+async def asgi_get(application, url):
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': parts.path, 'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    sent_body = False
+    disconnected = asyncio.Event()
+    status = []
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    disconnected.set()
+    return status[0]
+
+
+def summarize(samples, statuses, wall):
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for status in statuses if status != 200),
+        'req_per_s': round(len(samples) / wall, 1),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = ("Compare throughput and tail latency of the WSGI and ASGI handlers (with the async views) "
+            "under concurrent load, in-process and on the same database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Timed requests per route and mode.")
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help="WSGI worker threads, and concurrent requests on the ASGI event loop.")
+        parser.add_argument('--route', action='append', dest='only',
+                            help=f"Route to load (repeatable; default: {', '.join(DEFAULT_ROUTES)}).")
+        parser.add_argument('--scale', type=float,
+                            help="Regenerate the dataset at this scale first. Deletes existing content.")
+        parser.add_argument('--page-cache', action='store_true',
+                            help="Leave the page cache on (default measures the views themselves).")
+        parser.add_argument('--mode', choices=MODES,
+                            help="Measure one handler in this process and print JSON (used internally).")
+        parser.add_argument('--output-dir', default=str(settings.BASE_DIR / 'benchmarks'))
+
+    def targets(self, options):
+        wanted = options['only'] or DEFAULT_ROUTES
+        found = [(name, url) for name, method, url, _data in routes() if method == 'get' and name in wanted]
+        if not found:
+            raise CommandError("No matching routes; is the database populated?")
+        return found
+
+    def run_wsgi(self, url, options):
+        application = get_wsgi_application()
+        for _ in range(options['concurrency']):
+            wsgi_get(application, url)
+
+        def timed(_n):
+            started = time.perf_counter()
+            status = wsgi_get(application, url)
+            return status, (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(timed, range(options['requests'])))
+        wall = time.perf_counter() - started
+        return summarize([ms for _status, ms in results], [status for status, _ms in results], wall)
+
+    def run_asgi(self, url, options):
+        application = get_asgi_application()
+
+        async def load():
+            for _ in range(options['concurrency']):
+                await asgi_get(application, url)
+            remaining = iter(range(options['requests']))
+            results = []
+
+            async def client():
+                for _n in remaining:
+                    started = time.perf_counter()
+                    status = await asgi_get(application, url)
+                    results.append((status, (time.perf_counter() - started) * 1000))
+
+            started = time.perf_counter()
+            await asyncio.gather(*[client() for _ in range(options['concurrency'])])
+            return results, time.perf_counter() - started
+
+        results, wall = asyncio.run(load())
+        return summarize([ms for _status, ms in results], [status for status, _ms in results], wall)
+
+    def measure(self, mode, options):
+        overrides = {'QUERY_INSTRUMENTATION': False, 'ALLOWED_HOSTS': ['localhost']}
+        if not options['page_cache']:
+            overrides['PAGE_CACHE_ENABLED'] = False
+        results = {}
+        with override_settings(**overrides):
+            for name, url in self.targets(options):
+                run = self.run_wsgi if mode == 'wsgi' else self.run_asgi
+                results[name] = dict(run(url, options), url=url)
+        return results
+
+    def spawn(self, mode, options):
+        """Run one mode in a fresh process; ASYNC_VIEWS is read when settings load."""
+        command = [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'benchmark_asgi', '--mode', mode,
+                   '--requests', str(options['requests']), '--concurrency', str(options['concurrency'])]
+        for name in options['only'] or []:
+            command += ['--route', name]
+        if options['page_cache']:
+            command.append('--page-cache')
+        env = dict(os.environ, AZFI_ASYNC_VIEWS='1' if mode == 'asgi' else '0')
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f"{mode} run failed:\n{completed.stderr}")
+        return json.loads(completed.stdout)
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            self.stdout.write(json.dumps(self.measure(options['mode'], options)))
+            return
+
+        if options['scale'] is not None:
+            self.stdout.write(f"Generating scale {options['scale']:g}...")
+            datagen.flush()
+            datagen.generate(options['scale'])
+            search.rebuild()
+            similarity.rebuild()
+            minhash.rebuild()
+            cache.invalidate(*cache.TAGGED_MODELS)
+
+        results = {mode: self.spawn(mode, options) for mode in MODES}
+        self.stdout.write(f"{'route':<18}{'mode':<6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for name in results['wsgi']:
+            for mode in MODES:
+                result = results[mode][name]
+                self.stdout.write(
+                    f"{name:<18}{mode:<6}{result['req_per_s']:>9.1f}{result['p50_ms']:>9.2f}"
+                    f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['errors']:>8}"
+                )
+
+        commit = git_commit()
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        path = output_dir / f'{stamp}-{commit}-asgi.json'
+        path.write_text(json.dumps({
+            'commit': commit,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'page_cache': options['page_cache'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'rows': {model.__name__: model.objects.count() for model in datagen.MODELS},
+            'modes': results,
+        }, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"\nWrote {path}"))
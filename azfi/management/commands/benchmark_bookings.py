@@ -0,0 +1,178 @@
+import json
+import logging
+import platform
+import random
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from azfi import booking
+from azfi.models import Booking, Treatment
+
+from .benchmark_views import git_commit, percentile
+
+# Bookings made here carry this address, so they can be removed afterwards
+EMAIL = 'load-test@example.com'
+
+
+class Command(BaseCommand):
+    help = ("Measure open-slot lookups and race concurrent booking requests for the same few times, "
+            "then check that no practitioner was booked twice. Run on a generated dataset "
+            "(manage.py generate_dataset); the bookings it makes are cancelled and removed at the end.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefill', type=int, default=300, help="Random bookings made first, to fill calendars.")
+        parser.add_argument('--queries', type=int, default=200, help="Timed week-of-slots lookups.")
+        parser.add_argument('--contested', type=int, default=4, help="Start times every request competes for.")
+        parser.add_argument('--attempts', type=int, default=200, help="Concurrent booking requests.")
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Keep the bookings made.")
+        parser.add_argument('--output-dir', default=str(settings.BASE_DIR / 'benchmarks'))
+
+    def details(self, n):
+        return {'name': f"Load Test {n}", 'email': EMAIL, 'phone': '555 0100'}
+
+    def contested(self, treatment, start, count):
+        """The first ``count`` open times far enough apart that no two bookings of them can overlap."""
+        offered = Counter(slot.start for slot in booking.open_slots(treatment, start, start + timedelta(days=7)))
+        length = timedelta(minutes=booking.round_up(treatment.duration_minutes, booking.step_minutes()))
+        times = []
+        for moment in sorted(offered):
+            if len(times) < count and (not times or moment >= times[-1] + length):
+                times.append(moment)
+        # Each time can be booked once with every practitioner offering it
+        return times, sum(offered[moment] for moment in times)
+
+    def prefill(self, rng, treatments, count, start):
+        made = 0
+        for n in range(count):
+            treatment = rng.choice(treatments)
+            day = start + timedelta(days=rng.randrange(28))
+            slots = booking.open_slots(treatment, day, day + timedelta(days=1))
+            if slots:
+                slot = rng.choice(slots)
+                booking.book(treatment, slot.member_id, slot.start, **self.details(n))
+                made += 1
+        return made
+
+    def lookups(self, rng, treatments, count, start):
+        samples, found = [], []
+        for _ in range(count):
+            treatment = rng.choice(treatments)
+            week = start + timedelta(days=rng.randrange(28))
+            started = time.perf_counter()
+            slots = booking.open_slots(treatment, week, week + timedelta(days=7))
+            samples.append((time.perf_counter() - started) * 1000)
+            found.append(len(slots))
+        return samples, found
+
+    def race(self, treatment, times, attempts, threads):
+        """POST ``attempts`` bookings spread over ``times`` from ``threads`` clients at once."""
+        url = reverse('booking')
+
+        def attempt(n):
+            client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+            try:
+                started = time.perf_counter()
+                response = client.post(url, dict(self.details(n), treatment=treatment.slug,
+                                                 start=times[n % len(times)].isoformat()))
+                return response.status_code, (time.perf_counter() - started) * 1000
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(attempt, range(attempts)))
+        return results, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        treatments = list(Treatment.objects.filter(practitioners__isnull=False).distinct())
+        if not treatments:
+            raise CommandError("No treatment has a practitioner; run manage.py generate_dataset first.")
+        start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time()))
+
+        started = time.perf_counter()
+        prefilled = self.prefill(rng, treatments, options['prefill'], start)
+        prefill_s = time.perf_counter() - started
+        samples, found = self.lookups(rng, treatments, options['queries'], start)
+        self.stdout.write(f"Prefilled {prefilled} bookings in {prefill_s:.2f}s")
+        self.stdout.write(f"Week of open slots: p50 {percentile(samples, 50):.2f} ms, "
+                          f"p95 {percentile(samples, 95):.2f} ms, {statistics.mean(found):.0f} slots on average")
+
+        treatment = rng.choice(treatments)
+        times, capacity = self.contested(treatment, start, options['contested'])
+        if not times:
+            raise CommandError(f"{treatment.name} has no open times next week.")
+
+        race_started = timezone.now()
+        request_log = logging.getLogger('django.request')
+        level = request_log.level
+        # Every losing request is a 409, which Django logs as a warning
+        request_log.setLevel(logging.ERROR)
+        try:
+            # The race is for the database constraint, not the per-client rate limits
+            with override_settings(ALLOWED_HOSTS=['localhost'], QUERY_INSTRUMENTATION=False, RATE_LIMIT_ENABLED=False):
+                results, wall = self.race(treatment, times, options['attempts'], options['threads'])
+        finally:
+            request_log.setLevel(level)
+        statuses = Counter(status for status, _ms in results)
+        race_ms = [ms for _status, ms in results]
+        booked = Booking.objects.filter(treatment=treatment, start__in=times, email=EMAIL,
+                                        created_at__gte=race_started, status=Booking.CONFIRMED).count()
+        double = booking.overlapping().filter(email=EMAIL).count()
+        self.stdout.write(
+            f"{options['attempts']} requests from {options['threads']} threads for {len(times)} times "
+            f"({capacity} practitioner slots) in {wall:.2f}s: "
+            + ', '.join(f"{count} x {status}" for status, count in sorted(statuses.items()))
+        )
+        self.stdout.write(f"Booked {booked} of {capacity}, overlapping bookings: {double}")
+
+        if not options['keep']:
+            mine = Booking.objects.filter(email=EMAIL)
+            booking.cancel(mine)
+            mine.delete()
+
+        commit = git_commit()
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        path = output_dir / f'{stamp}-{commit}-bookings.json'
+        path.write_text(json.dumps({
+            'commit': commit,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'slot_minutes': booking.step_minutes(),
+            'prefilled': prefilled,
+            'prefill_s': round(prefill_s, 3),
+            'lookup_p50_ms': round(percentile(samples, 50), 3),
+            'lookup_p95_ms': round(percentile(samples, 95), 3),
+            'lookup_slots_avg': round(statistics.mean(found), 1),
+            'race': {
+                'attempts': options['attempts'],
+                'threads': options['threads'],
+                'times': len(times),
+                'capacity': capacity,
+                'statuses': {str(status): count for status, count in sorted(statuses.items())},
+                'p50_ms': round(percentile(race_ms, 50), 3),
+                'p95_ms': round(percentile(race_ms, 95), 3),
+                'wall_s': round(wall, 3),
+                'booked': booked,
+                'overlapping': double,
+            },
+        }, indent=2))
+        if double or booked != statuses[302] or booked > capacity:
+            raise CommandError(f"Double bookings found; results in {path}")
+        self.stdout.write(self.style.SUCCESS(f"\nWrote {path}"))
@@ -0,0 +1,137 @@
+import json
+import platform
+import random
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from azfi import minhash
+
+from .benchmark_views import git_commit, percentile
+
+# Each synthetic post draws from its topic's words and from the whole vocabulary
+TOPIC_SIZE = 25
+TOPIC_WORDS = 80
+TOPIC_DRAW = 45
+COMMON_DRAW = 35
+VOCABULARY = 50000
+
+
+def synthetic_posts(count, seed):
+    """Shingle sets of ``count`` posts in topics of about ``TOPIC_SIZE``, like a blog's recurring subjects."""
+    rng = random.Random(seed)
+    vocabulary = [f"word{i:05d}" for i in range(VOCABULARY)]
+    topics = [rng.sample(vocabulary, TOPIC_WORDS) for _ in range(max(1, count // TOPIC_SIZE))]
+    return [set(rng.sample(rng.choice(topics), TOPIC_DRAW)) | set(rng.sample(vocabulary, COMMON_DRAW))
+            for _ in range(count)]
+
+
+def exact_neighbours(posts, row, k=minhash.TOP_K):
+    """The true top ``k`` by Jaccard similarity, comparing every pair of sets."""
+    target = posts[row]
+    scores = np.array([len(target & other) / len(target | other) if i != row else -1
+                       for i, other in enumerate(posts)])
+    return [int(i) for i in np.lexsort((np.arange(len(posts)), -scores))[:k] if scores[i] >= minhash.MIN_SIMILARITY]
+
+
+def brute_force(index, row, k=minhash.TOP_K):
+    """Every signature scored against ``row``, the lookup the LSH buckets avoid."""
+    scores = minhash.estimate(index.signatures[row], index.signatures)
+    scores[row] = -1
+    return minhash.best(index.ids, scores, k)
+
+
+def recall(found, truth):
+    """Share of ``truth`` in ``found``; MinHash estimates cap it below 1 when true scores are close."""
+    return len(set(found) & set(truth)) / len(truth) if truth else 1.0
+
+
+class Command(BaseCommand):
+    help = ("Measure MinHash signing, LSH index building and related-post lookups against a brute-force "
+            "scan on synthetic corpora of increasing size, with recall against exact Jaccard similarity.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, nargs='+', default=[1000, 10000, 50000])
+        parser.add_argument('--queries', type=int, default=200, help="Posts looked up per corpus.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output-dir', default=str(settings.BASE_DIR / 'benchmarks'))
+
+    def timed(self, func, rows):
+        results, samples = [], []
+        for row in rows:
+            started = time.perf_counter()
+            results.append(func(row))
+            samples.append((time.perf_counter() - started) * 1000)
+        return results, samples
+
+    def run(self, count, options):
+        posts = synthetic_posts(count, options['seed'])
+        started = time.perf_counter()
+        known = {}
+        signatures = [minhash.signature(minhash.hash_shingles(list(words), known)) for words in posts]
+        signed = time.perf_counter() - started
+        started = time.perf_counter()
+        index = minhash.Index(range(count), signatures)
+        indexed = time.perf_counter() - started
+
+        rows = random.Random(options['seed']).sample(range(count), min(options['queries'], count))
+        lsh, lsh_ms = self.timed(index.neighbours, rows)
+        scan, scan_ms = self.timed(lambda row: brute_force(index, row), rows)
+        truth = [exact_neighbours(posts, row) for row in rows]
+        return {
+            'posts': count,
+            'sign_s': round(signed, 3),
+            'index_s': round(indexed, 3),
+            'buckets': len(index.members),
+            'candidates_avg': round(statistics.mean(len(index.candidates(row)) for row in rows), 1),
+            'lsh_p50_ms': round(percentile(lsh_ms, 50), 3),
+            'lsh_p95_ms': round(percentile(lsh_ms, 95), 3),
+            'scan_p50_ms': round(percentile(scan_ms, 50), 3),
+            'scan_p95_ms': round(percentile(scan_ms, 95), 3),
+            'lsh_recall': round(statistics.mean(
+                recall([pk for pk, _score in found], exact) for found, exact in zip(lsh, truth)), 3),
+            'scan_recall': round(statistics.mean(
+                recall([pk for pk, _score in found], exact) for found, exact in zip(scan, truth)), 3),
+            # What the buckets lose: the scan's answers that LSH did not find
+            'lsh_vs_scan': round(statistics.mean(
+                recall([pk for pk, _score in found], [pk for pk, _score in full]) for found, full in zip(lsh, scan)), 3),
+        }
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{minhash.NUM_PERM} hashes in {minhash.BANDS} bands of {minhash.ROWS}, "
+                          f"top {minhash.TOP_K}\n")
+        self.stdout.write(f"{'posts':>7}{'sign s':>9}{'index s':>9}{'cands':>8}{'lsh ms':>9}{'scan ms':>9}"
+                          f"{'speedup':>9}{'lsh recall':>12}{'scan recall':>13}{'lsh/scan':>10}")
+        runs = []
+        for count in options['posts']:
+            result = self.run(count, options)
+            runs.append(result)
+            self.stdout.write(
+                f"{count:>7}{result['sign_s']:>9.2f}{result['index_s']:>9.2f}{result['candidates_avg']:>8.0f}"
+                f"{result['lsh_p50_ms']:>9.3f}{result['scan_p50_ms']:>9.3f}"
+                f"{result['scan_p50_ms'] / max(result['lsh_p50_ms'], 1e-6):>8.1f}x"
+                f"{result['lsh_recall']:>12.3f}{result['scan_recall']:>13.3f}{result['lsh_vs_scan']:>10.3f}"
+            )
+
+        commit = git_commit()
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        path = output_dir / f'{stamp}-{commit}-related-posts.json'
+        path.write_text(json.dumps({
+            'commit': commit,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'num_perm': minhash.NUM_PERM,
+            'bands': minhash.BANDS,
+            'top_k': minhash.TOP_K,
+            'queries': options['queries'],
+            'runs': runs,
+        }, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"\nWrote {path}"))
@@ -0,0 +1,53 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from azfi.models import BlogPost, Treatment
+from azfi.search import search
+
+DEFAULT_QUERIES = ['peel', 'collagen', 'laser hair', 'filler', 'downtime', 'microneedling results']
+
+
+def icontains_search(query):
+    """The original search_view implementation, kept for comparison."""
+    treatments = Treatment.objects.filter(
+        Q(name__icontains=query) | Q(description__icontains=query)
+    )
+    posts = BlogPost.objects.filter(
+        Q(title__icontains=query) | Q(content__icontains=query)
+    )
+    return len(treatments) + len(posts)
+
+
+def index_search(query, per_page=10):
+    results = search(query)
+    return results.count(), results[:per_page]
+
+
+class Command(BaseCommand):
+    help = "Compare the search index against the old icontains scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def timed(self, func, query, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(query)
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{Treatment.objects.count()} treatments, {BlogPost.objects.count()} posts\n")
+        self.stdout.write(f"{'query':<24}{'icontains ms':>14}{'index ms':>12}{'speedup':>10}{'hits':>8}")
+        for query in options['queries']:
+            baseline = self.timed(icontains_search, query, options['repeat'])
+            indexed = self.timed(index_search, query, options['repeat'])
+            hits = index_search(query)[0]
+            self.stdout.write(
+                f"{query:<24}{baseline:>14.2f}{indexed:>12.2f}{baseline / max(indexed, 1e-6):>9.1f}x{hits:>8}"
+            )
@@ -0,0 +1,124 @@
+import json
+import logging
+import platform
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from azfi import newsletter, ratelimit, spool
+from azfi.models import Subscriber
+
+from .benchmark_views import git_commit, percentile
+
+
+class Command(BaseCommand):
+    help = ("Post newsletter signups from concurrent clients and report signups per second, "
+            "spooled and written inline, and how much of a flood from a few addresses the rate "
+            "limits refuse. Adds subscribers; use a scratch database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signups', type=int, default=2000, help="Signups per mode.")
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--repeat-ratio', type=float, default=0.3,
+                            help="Fraction of signups that reuse an earlier address.")
+        parser.add_argument('--mode', choices=['spool', 'inline', 'limited'], action='append', dest='modes',
+                            help="Only run the named mode (repeatable). 'limited' writes inline with "
+                                 "the rate limits on.")
+        parser.add_argument('--clients', type=int, default=4,
+                            help="Client addresses the 'limited' flood comes from.")
+        parser.add_argument('--output-dir', default=str(settings.BASE_DIR / 'benchmarks'))
+
+    def addresses(self, mode, count, repeat_ratio):
+        stamp = int(time.time())
+        unique = max(1, int(count * (1 - repeat_ratio)))
+        return [f"Bench.{mode}.{stamp}.{n % unique}@Example.com " for n in range(count)]
+
+    def run_mode(self, mode, options):
+        url = reverse('newsletter_signup')
+        emails = self.addresses(mode, options['signups'], options['repeat_ratio'])
+        before = Subscriber.objects.count()
+
+        def post(n_email):
+            n, email = n_email
+            client = Client(HTTP_HOST='localhost', raise_request_exception=False,
+                            REMOTE_ADDR=f"10.0.0.{n % options['clients'] + 1}")
+            started = time.perf_counter()
+            response = client.post(url, {'email': email})
+            elapsed = (time.perf_counter() - started) * 1000
+            connections.close_all()
+            return response.status_code, elapsed
+
+        newsletter.seen.reset()
+        ratelimit.get_cache().clear()
+        request_log = logging.getLogger('django.request')
+        level = request_log.level
+        # Django logs every refused request as a warning
+        request_log.setLevel(logging.ERROR)
+        try:
+            with override_settings(NEWSLETTER_INTAKE_ASYNC=mode == 'spool', RATE_LIMIT_ENABLED=mode == 'limited'):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(options['concurrency']) as executor:
+                    results = list(executor.map(post, enumerate(emails)))
+                wall = time.perf_counter() - started
+        finally:
+            request_log.setLevel(level)
+
+        flush = 0.0
+        if mode == 'spool':
+            started = time.perf_counter()
+            spool.drain(topics=[newsletter.SUBSCRIBE_TOPIC])
+            flush = time.perf_counter() - started
+
+        samples = [elapsed for _status, elapsed in results]
+        return {
+            'signups': len(results),
+            'errors': sum(1 for status, _elapsed in results if status not in (302, 429)),
+            'limited': sum(1 for status, _elapsed in results if status == 429),
+            'stored': Subscriber.objects.count() - before,
+            'signups_per_s': round(len(results) / wall, 1),
+            'p50_ms': round(percentile(samples, 50), 3),
+            'p99_ms': round(percentile(samples, 99), 3),
+            'mean_ms': round(statistics.fmean(samples), 3),
+            'flush_s': round(flush, 3),
+        }
+
+    def handle(self, *args, **options):
+        results = {}
+        self.stdout.write(f"{'mode':<8}{'signups/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}"
+                          f"{'limited':>9}{'stored':>8}{'flush s':>9}")
+        with override_settings(QUERY_INSTRUMENTATION=False, ALLOWED_HOSTS=['localhost']):
+            for mode in options['modes'] or ['inline', 'spool', 'limited']:
+                result = results[mode] = self.run_mode(mode, options)
+                self.stdout.write(
+                    f"{mode:<8}{result['signups_per_s']:>11.1f}{result['p50_ms']:>9.2f}"
+                    f"{result['p99_ms']:>9.2f}{result['errors']:>8}{result['limited']:>9}{result['stored']:>8}"
+                    f"{result['flush_s']:>9.2f}"
+                )
+
+        commit = git_commit()
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        path = output_dir / f'{stamp}-{commit}-signups.json'
+        path.write_text(json.dumps({
+            'commit': commit,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'concurrency': options['concurrency'],
+            'clients': options['clients'],
+            'rate_limits': ratelimit.stats(),
+            'repeat_ratio': options['repeat_ratio'],
+            'modes': results,
+        }, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"\nWrote {path}"))
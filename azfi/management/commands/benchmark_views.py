@@ -0,0 +1,168 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from azfi import cache, datagen, minhash, search, similarity
+from azfi.middleware import QueryRecorder
+from azfi.models import BlogPost, Treatment
+from azfi.pagination import NEXT, CursorPaginator
+from azfi.views import BlogListView
+
+
+def routes():
+    """``(name, method, url, data)`` for every URL in azfi/urls.py."""
+    treatment = Treatment.objects.order_by('id').first()
+    post = BlogPost.objects.order_by('-published_date').first()
+    # A cursor into the oldest posts, to show deep pages cost the same as the first
+    oldest = BlogPost.objects.order_by('published_date', 'id')[BlogListView.paginate_by:].first()
+    found = [
+        ('home', 'get', reverse('home'), None),
+        ('treatment_list', 'get', reverse('treatment_list'), None),
+        ('treatment_list_category', 'get', reverse('treatment_list'), {'category': 'FACE'}),
+        ('about', 'get', reverse('about'), None),
+        ('gallery', 'get', reverse('gallery'), None),
+        ('gallery_images', 'get', reverse('gallery_images'), None),
+        ('testimonial_list', 'get', reverse('testimonial_list'), None),
+        ('blog_list', 'get', reverse('blog_list'), None),
+        ('blog_search', 'get', reverse('blog_search'), {'q': 'collagen'}),
+        ('search', 'get', reverse('search'), {'q': 'laser'}),
+        ('contact', 'get', reverse('contact'), None),
+        ('contact_submit', 'post', reverse('contact'), {
+            'first_name': 'Jane', 'last_name': 'Doe', 'email': 'jane@example.com',
+            'phone': '555 0100', 'message': 'Benchmark enquiry.',
+        }),
+        ('contact_success', 'get', reverse('contact_success'), None),
+        ('newsletter_signup', 'post', reverse('newsletter_signup'), {'email': 'jane@example.com'}),
+        ('user_fragments', 'get', reverse('user_fragments'), None),
+    ]
+    if treatment:
+        found.append(('treatment_detail', 'get', reverse('treatment_detail', args=[treatment.slug]), None))
+        found.append(('booking', 'get', reverse('booking'), {'treatment': treatment.slug}))
+        found.append(('booking_slots', 'get', reverse('booking_slots'), {'treatment': treatment.slug}))
+    if post:
+        found.append(('blog_detail', 'get', reverse('blog_detail', args=[post.slug]), None))
+    if oldest:
+        paginator = CursorPaginator(BlogPost.objects.all(), BlogListView.paginate_by, BlogListView.cursor_ordering)
+        found.append(('blog_list_deep_page', 'get', reverse('blog_list'),
+                      {'cursor': paginator.encode(NEXT, oldest)}))
+    return found
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Command(BaseCommand):
+    help = "Measure p50/p95/p99 latency and queries per request for every route."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Timed requests per route.")
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--scales', type=float, nargs='+',
+                            help="Regenerate the dataset at each scale before measuring. "
+                                 "Deletes existing content.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--page-cache', action='store_true',
+                            help="Leave the page cache on (default measures the views themselves).")
+        parser.add_argument('--route', action='append', dest='only',
+                            help="Only benchmark the named route (repeatable).")
+        parser.add_argument('--output-dir', default=str(settings.BASE_DIR / 'benchmarks'))
+
+    def measure(self, client, method, url, data, requests, warmup):
+        for _ in range(warmup):
+            getattr(client, method)(url, data or {})
+
+        samples, queries = [], []
+        for _ in range(requests):
+            recorder = QueryRecorder()
+            with recorder.record():
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data or {})
+                samples.append((time.perf_counter() - started) * 1000)
+            queries.append(recorder.count)
+
+        return {
+            'status': response.status_code,
+            'p50_ms': round(percentile(samples, 50), 3),
+            'p95_ms': round(percentile(samples, 95), 3),
+            'p99_ms': round(percentile(samples, 99), 3),
+            'mean_ms': round(statistics.fmean(samples), 3),
+            'queries': max(queries),
+        }
+
+    def run_scale(self, options):
+        client = Client(HTTP_HOST='localhost')
+        results = {}
+        self.stdout.write(f"{'route':<26}{'status':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}")
+        for name, method, url, data in routes():
+            if options['only'] and name not in options['only']:
+                continue
+            result = self.measure(client, method, url, data, options['requests'], options['warmup'])
+            results[name] = dict(result, method=method.upper(), url=url, data=data)
+            self.stdout.write(
+                f"{name:<26}{result['status']:>7}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}{result['queries']:>9}"
+            )
+        return results
+
+    def handle(self, *args, **options):
+        runs = []
+        # Every request comes from one address, which the rate limits would soon refuse
+        overrides = {'QUERY_INSTRUMENTATION': False, 'ALLOWED_HOSTS': ['localhost'], 'RATE_LIMIT_ENABLED': False}
+        if not options['page_cache']:
+            overrides['PAGE_CACHE_ENABLED'] = False
+
+        with override_settings(**overrides):
+            for scale in options['scales'] or [None]:
+                if scale is not None:
+                    self.stdout.write(f"\nGenerating scale {scale:g}...")
+                    datagen.flush()
+                    datagen.generate(scale, options['seed'])
+                    search.rebuild()
+                    similarity.rebuild()
+                    minhash.rebuild()
+                    cache.invalidate(*cache.TAGGED_MODELS)
+                rows = {model.__name__: model.objects.count() for model in datagen.MODELS}
+                self.stdout.write(f"\nScale {scale if scale is not None else 'current'}: "
+                                  + ', '.join(f"{count} {name}" for name, count in rows.items()))
+                runs.append({'scale': scale, 'rows': rows, 'routes': self.run_scale(options)})
+
+        commit = git_commit()
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        path = output_dir / f'{stamp}-{commit}.json'
+        path.write_text(json.dumps({
+            'commit': commit,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'page_cache': options['page_cache'],
+            'requests': options['requests'],
+            'runs': runs,
+        }, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"\nWrote {path}"))
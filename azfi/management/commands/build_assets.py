@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from azfi import assets
+
+
+class Command(BaseCommand):
+    help = ("Build the minified, fingerprinted and precompressed static bundles (runs collectstatic), "
+            "or with --extract move inline <style>/<script> blocks out of the templates.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--extract', nargs='*', metavar='TEMPLATE',
+                            help="Move inline blocks of these templates (default: all) into "
+                                 "static/{css,js}/pages/ and replace them with {% bundle %} tags.")
+
+    def extract(self, templates):
+        template_dir = Path(settings.BASE_DIR) / 'templates'
+        static_dir = Path(settings.STATICFILES_DIRS[0])
+        paths = [Path(name) for name in templates] if templates else sorted(template_dir.rglob('*.html'))
+        missing = {}
+        for path in paths:
+            for name, source in assets.extract_inline(path, static_dir).items():
+                self.stdout.write(f"{path} -> static/{source}")
+                if assets.bundles().get(name) != [source]:
+                    missing[name] = source
+        if missing:
+            self.stdout.write("\nAdd to ASSET_BUNDLES in settings/settings.py:")
+            for name, source in missing.items():
+                self.stdout.write(f"    {name!r}: [{source!r}],")
+
+    def handle(self, *args, **options):
+        if options['extract'] is not None:
+            self.extract(options['extract'])
+            return
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.stdout.write(f"{'bundle':<24}{'sources':>9}{'minified':>10}{'gzip':>8}{'brotli':>8}  file")
+        for name, sources in assets.bundles().items():
+            hashed = staticfiles_storage.stored_name(assets.bundle_path(name))
+            sizes = [sum(staticfiles_storage.size(source) for source in sources),
+                     staticfiles_storage.size(hashed)]
+            for suffix in ('.gz', '.br'):
+                exists = staticfiles_storage.exists(hashed + suffix)
+                sizes.append(staticfiles_storage.size(hashed + suffix) if exists else None)
+            self.stdout.write(f"{name:<24}" + ''.join(
+                f"{'-' if size is None else size:>{width}}" for size, width in zip(sizes, (9, 10, 8, 8))
+            ) + f"  {hashed}")
+        self.stdout.write(self.style.SUCCESS(f"\nStatic files collected in {settings.STATIC_ROOT}"))
@@ -0,0 +1,50 @@
+import os
+from concurrent.futures import as_completed
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from azfi import images
+
+
+class Command(BaseCommand):
+    help = "Generate responsive WebP/JPEG derivatives for every uploaded image."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Rebuild derivatives even when they are up to date.")
+
+    def handle(self, *args, **options):
+        names = set()
+        for label, field_names in images.IMAGE_FIELDS:
+            names.update(images.iter_image_names(apps.get_model(label), field_names))
+
+        pending = []
+        missing = 0
+        for name in sorted(names):
+            if not os.path.exists(os.path.join(settings.MEDIA_ROOT, name)):
+                missing += 1
+                continue
+            if options['force'] or not images.is_current(name):
+                pending.append(name)
+
+        self.stdout.write(f"{len(pending)} image(s) to process, "
+                          f"{len(names) - len(pending) - missing} up to date, {missing} missing.")
+
+        executor = images.get_executor()
+        futures = {executor.submit(images.generate_derivatives, *images.job_args(name)): name
+                   for name in pending}
+        failed = 0
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                manifest = future.result()
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"Failed {name}: {exc}")
+            else:
+                self.stdout.write(f"Built {name} ({', '.join(map(str, manifest['widths']))})")
+
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(f"Done: {len(pending) - failed} built, {failed} failed."))
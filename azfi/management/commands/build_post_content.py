@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from azfi import cache, prerender
+from azfi.models import BlogPost
+
+
+class Command(BaseCommand):
+    help = ("Compile every blog post's content into its stored HTML, table of contents, word count, "
+            "reading time and summary. Saves do this already; run it after changing azfi/markup.py "
+            "or writing posts in bulk.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Count the posts that would change.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        batch_size = options['batch_size']
+        fields = ['pk', 'content', 'excerpt', *BlogPost.COMPILED_FIELDS]
+        now = timezone.now()
+        seen = changed = 0
+        last = 0
+        while True:
+            batch = list(BlogPost.objects.filter(pk__gt=last).order_by('pk').only(*fields)[:batch_size])
+            if not batch:
+                break
+            last = batch[-1].pk
+            seen += len(batch)
+            dirty = []
+            for post in batch:
+                before = [getattr(post, name) for name in BlogPost.COMPILED_FIELDS]
+                post.compile_content()
+                if [getattr(post, name) for name in BlogPost.COMPILED_FIELDS] != before:
+                    # Conditional GETs of the post's pages must not answer 304
+                    post.updated_at = now
+                    dirty.append(post)
+            changed += len(dirty)
+            if dirty and not options['dry_run']:
+                with transaction.atomic():
+                    BlogPost.objects.bulk_update(dirty, [*BlogPost.COMPILED_FIELDS, 'updated_at'])
+
+        if changed and not options['dry_run']:
+            cache.invalidate(BlogPost)
+            prerender.enqueue_changes([BlogPost])
+        verb = "would change" if options['dry_run'] else "changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled {seen} posts, {changed} {verb}, in {time.perf_counter() - started:.2f}s."
+        ))
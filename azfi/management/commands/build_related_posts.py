@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from azfi import minhash
+from azfi.models import RelatedPost
+
+
+class Command(BaseCommand):
+    help = ("Re-sign every blog post and recompute all related posts. Saves update them as they happen; "
+            "run this after bulk imports or a change to the MinHash parameters.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        posts = minhash.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Signed {posts} posts, {RelatedPost.objects.count()} links stored "
+            f"in {time.perf_counter() - started:.2f}s."
+        ))
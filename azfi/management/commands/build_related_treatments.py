@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from azfi import similarity
+from azfi.models import RelatedTreatment
+
+
+class Command(BaseCommand):
+    help = ("Recompute every treatment's related treatments from scratch. Saves are refreshed "
+            "incrementally by the queue worker; run this after bulk changes or to renew the IDF weights.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        changed = similarity.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"{changed} related lists changed, {RelatedTreatment.objects.count()} links stored "
+            f"in {time.perf_counter() - started:.2f}s."
+        ))
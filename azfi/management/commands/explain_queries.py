@@ -0,0 +1,47 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from azfi import queryplan
+from azfi.management.commands.benchmark_views import routes
+
+
+class Command(BaseCommand):
+    help = ("Request every page against the current database, EXPLAIN each query and fail "
+            "on full table scans. Run it after generate_dataset at production scale.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true',
+                            help="Run ANALYZE first so the planner sees the real table sizes.")
+        parser.add_argument('--all', action='store_true', help="Print every plan, not only scans.")
+
+    def handle(self, *args, **options):
+        if not queryplan.supported():
+            raise CommandError("Query plans can only be checked on SQLite.")
+        if options['analyze']:
+            queryplan.analyze()
+
+        client = Client()
+        checked = [route for route in routes() if route[1] == 'get']
+        staff = User.objects.filter(is_superuser=True).first()
+        if staff:
+            client.force_login(staff)
+            checked += queryplan.admin_routes()
+        else:
+            self.stderr.write("No superuser; skipping the admin pages.")
+
+        with override_settings(PAGE_CACHE_ENABLED=False, QUERY_INSTRUMENTATION=False, ALLOWED_HOSTS=['*']):
+            found = queryplan.plans(client, checked)
+
+        problems = queryplan.problems(found)
+        flagged = {sql for _name, _table, sql in problems}
+        for name, sql, plan in found:
+            if options['all'] or sql in flagged:
+                self.stdout.write(f"{name}: {' '.join(sql.split())[:160]}")
+                for step in plan:
+                    self.stdout.write(f"    {step}")
+        if problems:
+            raise CommandError("Full table scans: " + ', '.join(
+                sorted({f'{name} ({table})' for name, table, _sql in problems})))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(found)} queries on {len(checked)} pages, no full table scans."))
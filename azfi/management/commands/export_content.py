@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from azfi import content
+
+
+class Command(BaseCommand):
+    help = "Export treatments, FAQs, cases, team, testimonials and blog posts to a content bundle."
+
+    def add_arguments(self, parser):
+        parser.add_argument('bundle', help="Directory to write the bundle to.")
+        parser.add_argument('--format', choices=content.FORMATS, default='jsonl')
+        parser.add_argument('--media', action='store_true',
+                            help="Copy the referenced uploads into <bundle>/media.")
+        parser.add_argument('--section', action='append', dest='sections',
+                            choices=[section.name for section in content.SECTIONS],
+                            help="Only export the named section (repeatable).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        manifest = content.export_bundle(
+            options['bundle'], fmt=options['format'], sections=options['sections'],
+            include_media=options['media'], log=self.stdout.write,
+        )
+        for name in manifest['media']['missing']:
+            self.stderr.write(f"Missing upload: {name}")
+
+        rows = sum(manifest['sections'].values())
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {rows} rows and {manifest['media']['files']} media references to "
+            f"{options['bundle']} in {elapsed:.2f}s ({rows / max(elapsed, 1e-6):,.0f} rows/s)."
+        ))
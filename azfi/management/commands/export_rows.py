@@ -0,0 +1,63 @@
+import json
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from azfi import exports
+
+
+class Command(BaseCommand):
+    help = ("Stream contacts, subscribers, testimonials or blog posts to CSV or JSON Lines with flat "
+            "memory use. With --state, each run exports only the rows added since the previous one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=list(exports.EXPORTS))
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--output', default='-', help="File to write (default: stdout).")
+        parser.add_argument('--since', help="Only rows after this watermark, printed by the previous export.")
+        parser.add_argument('--state', help="JSON file holding the watermark of each export; read for "
+                                            "--since and updated once the export is complete.")
+
+    def parse_since(self, export, value):
+        try:
+            return exports.parse_watermark(export, str(value))
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+    def handle(self, *args, **options):
+        export = exports.get_export(options['export'])
+        state_path = Path(options['state']) if options['state'] else None
+        state = json.loads(state_path.read_text()) if state_path and state_path.exists() else {}
+        since = options['since'] or state.get(export.name)
+        since = self.parse_since(export, since) if since else None
+
+        started = time.perf_counter()
+        until = export.latest(since=since)
+        count = 0
+
+        def tally(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        rows = tally(export.rows(since=since, until=until)) if until is not None else iter(())
+        out = sys.stdout if options['output'] == '-' else open(options['output'], 'w', newline='', encoding='utf-8')
+        try:
+            for chunk in exports.lines(export, rows, options['format']):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        watermark = until or since
+        if until is not None and state_path:
+            state[export.name] = until
+            state_path.write_text(json.dumps(state, indent=2))
+        elapsed = time.perf_counter() - started
+        self.stderr.write(self.style.SUCCESS(
+            f"Exported {count} {export.name} in {elapsed:.2f}s. "
+            f"Watermark: {watermark or 'none'} (pass it as --since next time)."
+        ))
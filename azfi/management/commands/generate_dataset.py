@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from azfi import cache, datagen, minhash, search, similarity
+from azfi.models import Treatment
+
+
+class Command(BaseCommand):
+    help = "Bulk-create a synthetic dataset for load testing (see azfi/datagen.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1,
+                            help="Multiplier for row counts; 1 is 500 posts and 100,000 contacts.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--flush', action='store_true',
+                            help="Delete existing content before generating.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['flush']:
+            datagen.flush()
+            self.stdout.write("Deleted existing content.")
+        elif Treatment.objects.exists():
+            raise CommandError("The database already has content; pass --flush to replace it.")
+
+        created = datagen.generate(options['scale'], options['seed'], log=self.stdout.write)
+
+        # bulk_create skips post_save, so refresh what the signals would have
+        indexed = search.rebuild()
+        similarity.rebuild()
+        minhash.rebuild()
+        cache.invalidate(*cache.TAGGED_MODELS)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {sum(created.values())} rows and indexed {indexed} documents "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
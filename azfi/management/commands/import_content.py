@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from azfi import content
+
+
+class Command(BaseCommand):
+    help = "Upsert a content bundle written by export_content."
+
+    def add_arguments(self, parser):
+        parser.add_argument('bundle', help="Bundle directory.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Print what would change without writing anything.")
+        parser.add_argument('--batch-size', type=int, default=content.BATCH_SIZE)
+        parser.add_argument('--atomic', action='store_true',
+                            help="Run the whole import in one transaction instead of one per batch.")
+        parser.add_argument('--no-media', action='store_false', dest='media',
+                            help="Do not copy bundled uploads into MEDIA_ROOT.")
+        parser.add_argument('--section', action='append', dest='sections',
+                            choices=[section.name for section in content.SECTIONS],
+                            help="Only import the named section (repeatable).")
+
+    def handle(self, *args, **options):
+        # The per-row diff is the point of a dry run; otherwise only show it at -v 2
+        show_diff = options['dry_run'] or options['verbosity'] > 1
+        log = self.stdout.write if show_diff else None
+
+        started = time.perf_counter()
+        try:
+            stats, media_copied = content.import_bundle(
+                options['bundle'], dry_run=options['dry_run'], batch_size=options['batch_size'],
+                sections=options['sections'], atomic=options['atomic'], media=options['media'],
+                log=log,
+            )
+        except FileNotFoundError as exc:
+            raise CommandError(exc)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"\n{'section':<14}{'read':>8}{'created':>9}{'updated':>9}{'deleted':>9}"
+            f"{'same':>8}{'skipped':>9}{'seconds':>9}{'rows/s':>10}"
+        )
+        for name, counts in stats.items():
+            rate = counts['read'] / max(counts['seconds'], 1e-6)
+            self.stdout.write(
+                f"{name:<14}{counts['read']:>8}{counts['created']:>9}{counts['updated']:>9}"
+                f"{counts['deleted']:>9}{counts['unchanged']:>8}{counts['skipped']:>9}"
+                f"{counts['seconds']:>9.2f}{rate:>10,.0f}"
+            )
+
+        total = sum(counts['read'] for counts in stats.values())
+        verb = "Would import" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{verb} {total} rows and {media_copied} media files in {elapsed:.2f}s "
+            f"({total / max(elapsed, 1e-6):,.0f} rows/s)."
+        ))
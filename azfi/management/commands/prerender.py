@@ -0,0 +1,47 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from azfi import prerender, spool
+
+
+class Command(BaseCommand):
+    help = ("Render the cacheable public pages to static HTML files for the web server, "
+            "or with --changed only the pages affected by queued content changes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--changed', action='store_true',
+                            help="Apply queued changes instead of rendering everything "
+                                 "(what the queue worker does with PRERENDER_ENABLED).")
+        parser.add_argument('--root', help="Output directory (default: PRERENDER_ROOT).")
+        parser.add_argument('--deps', action='store_true',
+                            help="Print the dependency map of the last build as JSON and exit.")
+
+    def handle(self, *args, **options):
+        root = Path(options['root']) if options['root'] else prerender.get_root()
+
+        if options['deps']:
+            manifest = prerender.load_manifest(root)
+            self.stdout.write(json.dumps({url: entry['models'] for url, entry in manifest.items()}, indent=2))
+            return
+
+        started = time.perf_counter()
+        if options['changed']:
+            queue = spool.get_spool()
+            jobs = queue.claim(prerender.CHANGE_TOPIC, limit=100000)
+            rendered, removed = prerender.update([job.payload for job in jobs], root)
+            queue.ack(jobs, time.perf_counter() - started)
+        else:
+            rendered, removed = prerender.build(root)
+        elapsed = time.perf_counter() - started
+
+        if options['verbosity'] > 1:
+            for url in rendered:
+                self.stdout.write(f"rendered {url}")
+        for url in removed:
+            self.stdout.write(f"removed  {url}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {len(rendered)} page(s), removed {len(removed)} in {elapsed:.1f}s to {root}"
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from azfi import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for treatments, blog posts and FAQs."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            count = search.rebuild()
+        backend = 'FTS5' if search.fts5_enabled() else 'inverted index'
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} documents ({backend}) in {time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,59 @@
+import json
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from azfi import spool
+
+
+class Command(BaseCommand):
+    help = "Flush the write-behind queue: store spooled submissions and send their emails."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit.")
+        parser.add_argument('--topic', action='append', dest='topics',
+                            help="Only process the named topic (repeatable).")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--stats', action='store_true', help="Print queue statistics as JSON and exit.")
+        parser.add_argument('--dead', action='store_true', help="List dead letters and exit.")
+        parser.add_argument('--requeue-dead', action='store_true',
+                            help="Give dead letters a fresh set of attempts and exit.")
+
+    def handle(self, *args, **options):
+        queue = spool.get_spool()
+        topics = options['topics']
+
+        if options['stats']:
+            self.stdout.write(json.dumps(queue.stats(), indent=2))
+            return
+        if options['dead']:
+            for job_id, topic, payload, attempts, error, _dead_at in queue.dead_letters(
+                    topic=topics[0] if topics else None):
+                self.stdout.write(f"{job_id} {topic} attempts={attempts} {error}\n    {payload}")
+            return
+        if options['requeue_dead']:
+            count = sum(queue.requeue_dead(topic) for topic in topics) if topics else queue.requeue_dead()
+            self.stdout.write(self.style.SUCCESS(f"Requeued {count} dead letter(s)."))
+            return
+
+        if options['once']:
+            handled = spool.drain(queue, topics)
+            self.stdout.write(self.style.SUCCESS(f"Processed {handled} job(s)."))
+            return
+
+        stopping = []
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stopping.append(True))
+
+        self.stdout.write(f"Worker polling {queue.path} (Ctrl-C to stop).")
+        while not stopping:
+            close_old_connections()
+            handled = spool.drain(queue, topics)
+            if handled:
+                self.stdout.write(f"Processed {handled} job(s).")
+            else:
+                time.sleep(options['interval'])
+        self.stdout.write("Worker stopped.")
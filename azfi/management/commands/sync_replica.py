@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from azfi import routers
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary SQLite database over the local replica files, to try read replicas "
+            "without a replication setup. Repeat it (e.g. from cron) to simulate replication lag.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', metavar='ALIAS',
+                            help="Replica aliases to refresh (default: DATABASE_REPLICAS, else 'replica').")
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or routers.replicas() or ['replica']
+        primary = settings.DATABASES[routers.PRIMARY]
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("sync_replica only copies SQLite databases.")
+
+        for alias in aliases:
+            if alias not in settings.DATABASES:
+                raise CommandError(f"No database alias {alias!r} in DATABASES.")
+            target = str(settings.DATABASES[alias]['NAME'])
+            started = time.perf_counter()
+            connections[alias].close()
+            # Copy to a new file and swap it in: readers keep the old copy until they reconnect
+            tmp = f'{target}.tmp'
+            source = sqlite3.connect(str(primary['NAME']))
+            copy = sqlite3.connect(tmp)
+            try:
+                source.backup(copy)
+            finally:
+                copy.close()
+                source.close()
+            os.replace(tmp, target)
+            self.stdout.write(self.style.SUCCESS(
+                f"{alias}: copied {primary['NAME']} to {target} in {time.perf_counter() - started:.2f}s"
+            ))
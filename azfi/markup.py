@@ -0,0 +1,251 @@
+"""
+Blog post bodies compiled once, on save, into sanitised HTML and metadata.
+
+Authors write ``BlogPost.content`` as light markup: blank lines between
+paragraphs, ``#``/``##``/``###`` headings (a line that is only
+``**bold**`` counts as a heading too), ``-``/``*`` and ``1.`` list items,
+``**bold**``, ``*italic*``, ```code``` and ``[links](https://...)``. HTML
+they paste is kept.
+
+``compile_post()`` turns that into HTML, then runs the result through an
+allow-list sanitiser. The sanitiser drops scripts, event handlers and
+``javascript:`` URLs, closes open tags and gives every heading an id. While
+doing so it collects the table of contents, the word count and the lead
+text for the automatic excerpt. ``BlogPost.save()`` stores all of it, so
+the blog pages print stored fields instead of parsing or truncating the
+article on every request.
+"""
+import math
+import re
+from html import escape
+from html.parser import HTMLParser
+
+from django.utils.text import Truncator, slugify
+
+WORDS_PER_MINUTE = 200
+SUMMARY_WORDS = 20
+
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'code', 'em', 'figcaption', 'figure', 'h2', 'h3', 'h4', 'hr', 'i',
+    'img', 'li', 'ol', 'p', 'pre', 'strong', 'sub', 'sup', 'u', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+}
+URL_ATTRIBUTES = {'href', 'src'}
+SAFE_SCHEMES = {'http', 'https', 'mailto', 'tel'}
+VOID_TAGS = {'br', 'hr', 'img'}
+# Opening one of these ends an open paragraph, as browsers do; closing one ends a run of words
+BLOCK_TAGS = {'blockquote', 'figure', 'figcaption', 'h2', 'h3', 'h4', 'hr', 'li', 'ol', 'p', 'pre', 'ul'}
+# Removed together with everything inside them
+DROPPED_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript', 'svg', 'math'}
+# The page title is the h1; headings in the body start one level below
+RENAMED_TAGS = {'h1': 'h2', 'h5': 'h4', 'h6': 'h4'}
+TOC_LEVELS = {'h2': 2, 'h3': 3}
+# Text of these feeds the automatic excerpt
+LEAD_TAGS = {'p', 'li'}
+
+# A chunk starting with one of these tags is HTML already
+BLOCK_HTML_RE = re.compile(r'<(?:div|h[1-6]|table|img|%s)\b' % '|'.join(sorted(BLOCK_TAGS | DROPPED_TAGS)),
+                           re.IGNORECASE)
+HEADING_RE = re.compile(r'^(#{1,4})\s+(.+?)\s*#*$')
+BOLD_HEADING_RE = re.compile(r'^\*\*([^*]+)\*\*:?$')
+BULLET_RE = re.compile(r'^\s*[-*+]\s+(.*)$')
+NUMBERED_RE = re.compile(r'^\s*\d+[.)]\s+(.*)$')
+SCHEME_RE = re.compile(r'^([a-zA-Z][a-zA-Z0-9+.-]*):')
+INLINE_RULES = [
+    (re.compile(r'`([^`]+)`'), r'<code>\1</code>'),
+    (re.compile(r'\*\*(.+?)\*\*'), r'<strong>\1</strong>'),
+    (re.compile(r'(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])'), r'<em>\1</em>'),
+    (re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)'), r'<a href="\2">\1</a>'),
+]
+
+
+def inline(text):
+    for pattern, replacement in INLINE_RULES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def to_html(text):
+    """Convert light markup to (unsanitised) HTML, one block per blank-line-separated chunk."""
+    html = []
+    for block in re.split(r'\n\s*\n', (text or '').replace('\r\n', '\n').strip()):
+        block = block.strip()
+        if not block:
+            continue
+        if BLOCK_HTML_RE.match(block):
+            html.append(block)
+            continue
+        paragraph, items, list_tag = [], [], None
+
+        def flush():
+            nonlocal list_tag
+            if paragraph:
+                html.append(f"<p>{inline(' '.join(paragraph))}</p>")
+                paragraph.clear()
+            if items:
+                html.append(f"<{list_tag}>" + ''.join(f"<li>{inline(item)}</li>" for item in items)
+                            + f"</{list_tag}>")
+                items.clear()
+            list_tag = None
+
+        for line in block.split('\n'):
+            line = line.strip()
+            heading = HEADING_RE.match(line) or BOLD_HEADING_RE.match(line)
+            bullet, numbered = BULLET_RE.match(line), NUMBERED_RE.match(line)
+            if heading:
+                flush()
+                level = max(2, len(heading.group(1))) if heading.re is HEADING_RE else 2
+                title = heading.group(2) if heading.re is HEADING_RE else heading.group(1)
+                html.append(f"<h{level}>{inline(title)}</h{level}>")
+            elif bullet or numbered:
+                tag = 'ul' if bullet else 'ol'
+                if paragraph or list_tag != tag:
+                    flush()
+                list_tag = tag
+                items.append((bullet or numbered).group(1))
+            elif items:
+                # A continuation of the list item above
+                items[-1] += ' ' + line
+            else:
+                paragraph.append(line)
+        flush()
+    return '\n'.join(html)
+
+
+def safe_url(value):
+    # Browsers ignore control characters and spaces inside a scheme ("java\tscript:")
+    scheme = SCHEME_RE.match(re.sub(r'[\x00-\x20]', '', value))
+    return scheme is None or scheme.group(1).lower() in SAFE_SCHEMES
+
+
+class Sanitizer(HTMLParser):
+    """
+    Re-serialise HTML keeping only ``ALLOWED_TAGS`` and ``ALLOWED_ATTRIBUTES``;
+    everything else is dropped, the text of unknown tags kept.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open = []
+        self.dropping = 0
+        self.text = []
+        self.lead = []
+        self.in_lead = 0
+        self.toc = []
+        self.ids = set()
+        self.heading = None
+
+    def handle_starttag(self, tag, attrs):
+        tag = RENAMED_TAGS.get(tag, tag)
+        if tag in DROPPED_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        if tag in BLOCK_TAGS and 'p' in self.open:
+            self.handle_endtag('p')
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set())
+        kept = [(name, value) for name, value in attrs
+                if name in allowed and value is not None and (name not in URL_ATTRIBUTES or safe_url(value))]
+        if tag == 'a':
+            kept.append(('rel', 'noopener nofollow'))
+        self.out.append(f"<{tag}" + ''.join(f' {name}="{escape(value)}"' for name, value in kept) + '>')
+        if tag in VOID_TAGS:
+            self.text.append(' ')
+            return
+        self.open.append(tag)
+        if tag in LEAD_TAGS:
+            self.in_lead += 1
+        if tag in TOC_LEVELS and self.heading is None:
+            # The id is added at the end tag, once the heading's text is known
+            self.heading = (tag, len(self.out) - 1, [])
+
+    def handle_endtag(self, tag):
+        tag = RENAMED_TAGS.get(tag, tag)
+        if tag in DROPPED_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.open:
+            return
+        while self.open:
+            closing = self.open.pop()
+            self.end(closing)
+            if closing == tag:
+                break
+
+    def end(self, tag):
+        self.out.append(f"</{tag}>")
+        if tag in BLOCK_TAGS:
+            self.text.append(' ')
+            if self.in_lead:
+                self.lead.append(' ')
+        if tag in LEAD_TAGS:
+            self.in_lead -= 1
+        if self.heading is not None and self.heading[0] == tag:
+            _tag, index, words = self.heading
+            self.heading = None
+            title = ' '.join(''.join(words).split())
+            anchor = self.unique_id(slugify(title) or 'section')
+            self.out[index] = self.out[index][:-1] + f' id="{anchor}">'
+            self.toc.append({'level': TOC_LEVELS[tag], 'id': anchor, 'title': title})
+
+    def unique_id(self, anchor):
+        candidate, number = anchor, 1
+        while candidate in self.ids:
+            number += 1
+            candidate = f"{anchor}-{number}"
+        self.ids.add(candidate)
+        return candidate
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.out.append(escape(data, quote=False))
+        self.text.append(data)
+        if self.in_lead:
+            self.lead.append(data)
+        if self.heading is not None:
+            self.heading[2].append(data)
+
+    def result(self):
+        while self.open:
+            self.end(self.open.pop())
+        return ''.join(self.out)
+
+
+def sanitize(html):
+    """Return ``(html, sanitizer)``; the sanitizer holds the collected text and headings."""
+    sanitizer = Sanitizer()
+    sanitizer.feed(html)
+    sanitizer.close()
+    return sanitizer.result(), sanitizer
+
+
+def words_of(parts):
+    return ''.join(parts).split()
+
+
+def summarize(text, words=SUMMARY_WORDS):
+    return Truncator(' '.join(text.split())).words(words)
+
+
+def compile_post(content, excerpt=''):
+    """The stored fields derived from a post's ``content`` and ``excerpt``, by ``BlogPost`` field name."""
+    html, sanitizer = sanitize(to_html(content))
+    words = words_of(sanitizer.text)
+    if excerpt and excerpt.strip():
+        _html, plain = sanitize(excerpt)
+        summary = summarize(''.join(plain.text))
+    else:
+        summary = summarize(' '.join(words_of(sanitizer.lead) or words))
+    return {
+        'content_html': html,
+        'toc': sanitizer.toc,
+        'word_count': len(words),
+        'reading_time': max(1, math.ceil(len(words) / WORDS_PER_MINUTE)),
+        'summary': summary,
+    }
@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+
+from . import profiling, ratelimit, routers
+
+logger = logging.getLogger('azfi.queries')
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that records the SQL, params and duration of every query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((context['connection'].alias, sql, params,
+                                 time.perf_counter() - started))
+
+    def record(self):
+        """Context manager installing the recorder on every configured database."""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(duration for *_rest, duration in self.queries)
+
+    @property
+    def duplicates(self):
+        """Queries repeated with identical SQL and parameters."""
+        counts = Counter((sql, repr(params)) for _alias, sql, params, _duration in self.queries)
+        return sum(count - 1 for count in counts.values() if count > 1)
+
+    @property
+    def similar(self):
+        """Queries repeated with the same SQL but different parameters, the usual N+1 shape."""
+        counts = Counter(sql for _alias, sql, _params, _duration in self.queries)
+        return sum(count - 1 for count in counts.values() if count > 1)
+
+
+class QueryCountMiddleware:
+    """
+    Report the query count, total SQL time and repeated queries of each request.
+
+    Adds ``X-Query-Count``, ``X-Query-Time`` (milliseconds) and
+    ``X-Query-Duplicates`` headers and logs one line per request to the
+    ``azfi.queries`` logger. Enabled by ``QUERY_INSTRUMENTATION``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.enabled = getattr(settings, 'QUERY_INSTRUMENTATION', settings.DEBUG)
+        self.warn_threshold = getattr(settings, 'QUERY_COUNT_WARNING', 20)
+        self.similar_threshold = getattr(settings, 'QUERY_SIMILAR_WARNING', 3)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        return self.report(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        # Database connections belong to the thread the request's ORM calls run on
+        recording = await sync_to_async(recorder.record)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        return self.report(request, response, recorder)
+
+    def report(self, request, response, recorder):
+        total_ms = recorder.total_time * 1000
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time'] = f'{total_ms:.2f}'
+        response['X-Query-Duplicates'] = str(recorder.duplicates)
+
+        over_budget = (recorder.count > self.warn_threshold
+                       or recorder.similar >= self.similar_threshold)
+        level = logging.WARNING if over_budget else logging.INFO
+        logger.log(
+            level, "%s %s queries=%d time=%.2fms duplicates=%d similar=%d",
+            request.method, request.path, recorder.count, total_ms,
+            recorder.duplicates, recorder.similar,
+        )
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve the read-only pages from a read replica (see azfi/routers.py).
+
+    Safe requests to one of ``REPLICA_VIEWS`` read from a replica unless the
+    browser carries the sticky cookie that every other request sets, so a
+    visitor always sees their own writes.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.use_replica(None)
+        return self.make_sticky(request, response)
+
+    async def __acall__(self, request):
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.use_replica(None)
+        return self.make_sticky(request, response)
+
+    def make_sticky(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and routers.replicas():
+            response.set_cookie(routers.sticky_cookie(), '1', max_age=routers.sticky_seconds(),
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method in ('GET', 'HEAD')
+                and request.resolver_match.url_name in routers.replica_views()
+                and routers.sticky_cookie() not in request.COOKIES):
+            routers.use_replica(routers.choose_replica())
+
+
+class RateLimitMiddleware:
+    """
+    Refuse bursts of POSTs to the views in ``RATE_LIMITS`` with 429 and
+    ``Retry-After`` (see azfi/ratelimit.py). It is listed before
+    ``CsrfViewMiddleware``, so a refused request costs a few cache calls and
+    nothing else.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method != 'POST' or not ratelimit.is_enabled():
+            return None
+        policy = ratelimit.policies().get(request.resolver_match.url_name)
+        if policy is None:
+            return None
+        wait = ratelimit.check(request, policy)
+        if not wait:
+            return None
+        response = HttpResponse("Too many requests. Please try again shortly.\n", status=429,
+                                content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(wait)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile the requests that ask for it with a staff token, or a sample of
+    all requests (see azfi/profiling.py). Listed first, so the profile covers
+    every other middleware too. Without ``PROFILING_ENABLED`` it is dropped
+    from the stack at startup and costs nothing.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not profiling.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        profiling.install()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not profiling.requested(request):
+            return self.get_response(request)
+
+        profile = profiling.Profile(request, {threading.get_ident()})
+        profile.start()
+        try:
+            with profile.record_queries():
+                response = self.get_response(request)
+        finally:
+            profile.stop()
+        return profile.save(response)
+
+    async def __acall__(self, request):
+        if not profiling.requested(request):
+            return await self.get_response(request)
+
+        # Sync views and the ORM run on asgiref's shared thread, the rest on the event loop's
+        worker = await sync_to_async(threading.get_ident)()
+        profile = profiling.Profile(request, {threading.get_ident(), worker})
+        profile.start()
+        try:
+            recording = await sync_to_async(profile.record_queries)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(recording.close)()
+        finally:
+            profile.stop()
+        return await sync_to_async(profile.save)(response)
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 10:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('azfi', '0002_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='beforeafterimage',
+            index=models.Index(fields=['created_at', 'id'], name='beforeafter_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['published_date', 'id'], name='blogpost_published_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testimonial',
+            index=models.Index(fields=['date', 'id'], name='testimonial_date_id_idx'),
+        ),
+    ]
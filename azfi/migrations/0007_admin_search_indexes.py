@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 17:05
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('azfi', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='contact_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='contact_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='subscriber_email_lower_idx'),
+        ),
+    ]
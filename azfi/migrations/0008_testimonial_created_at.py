@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 18:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('azfi', '0007_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testimonial',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='testimonial',
+            index=models.Index(fields=['created_at', 'id'], name='testimonial_created_id_idx'),
+        ),
+    ]
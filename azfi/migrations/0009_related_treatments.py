@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('azfi', '0008_testimonial_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedTreatment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_from', to='azfi.treatment')),
+                ('treatment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar', to='azfi.treatment')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('treatment', 'rank'), name='unique_related_treatment_rank')],
+            },
+        ),
+    ]
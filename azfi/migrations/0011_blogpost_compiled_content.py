@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-18 20:45
+
+from django.db import migrations, models
+
+from azfi import markup
+
+
+def compile_existing_posts(apps, schema_editor):
+    # Historical models have no save() override, so compile here; build_post_content does the same later
+    BlogPost = apps.get_model('azfi', 'BlogPost')
+    posts = list(BlogPost.objects.only('pk', 'content', 'excerpt'))
+    for post in posts:
+        for name, value in markup.compile_post(post.content, post.excerpt).items():
+            setattr(post, name, value)
+    BlogPost.objects.bulk_update(posts, ['content_html', 'toc', 'word_count', 'reading_time', 'summary'],
+                                 batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('azfi', '0010_related_posts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='reading_time',
+            field=models.PositiveSmallIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='summary',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='toc',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(compile_existing_posts, migrations.RunPython.noop),
+    ]
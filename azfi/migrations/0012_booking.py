@@ -0,0 +1,99 @@
+# Generated by Django 5.2 on 2026-10-18 21:10
+
+import re
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def parse_durations(apps, schema_editor):
+    # "30 minutes", "45-60 minutes", "1 hour", "1.5 hours": book the longest length mentioned
+    Treatment = apps.get_model('azfi', 'Treatment')
+    for treatment in Treatment.objects.only('pk', 'duration'):
+        numbers = [float(number) for number in re.findall(r'\d+(?:\.\d+)?', treatment.duration)]
+        if not numbers:
+            continue
+        minutes = max(numbers) * (60 if 'hour' in treatment.duration.lower() else 1)
+        Treatment.objects.filter(pk=treatment.pk).update(duration_minutes=max(5, min(int(minutes), 480)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('azfi', '0011_blogpost_compiled_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teammember',
+            name='treatments',
+            field=models.ManyToManyField(blank=True, related_name='practitioners', to='azfi.treatment'),
+        ),
+        migrations.AddField(
+            model_name='treatment',
+            name='duration_minutes',
+            field=models.PositiveSmallIntegerField(default=60),
+        ),
+        migrations.CreateModel(
+            name='Booking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('name', models.CharField(max_length=100)),
+                ('email', models.EmailField(max_length=254)),
+                ('phone', models.CharField(max_length=20)),
+                ('notes', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('confirmed', 'Confirmed'), ('cancelled', 'Cancelled')], default='confirmed', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='bookings', to='azfi.teammember')),
+                ('treatment', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='bookings', to='azfi.treatment')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookingSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='azfi.booking')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_slots', to='azfi.teammember')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WorkingHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start', models.TimeField()),
+                ('end', models.TimeField()),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='working_hours', to='azfi.teammember')),
+            ],
+            options={
+                'verbose_name_plural': 'working hours',
+                'ordering': ['weekday', 'start'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['member', 'start'], name='booking_member_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['start', 'id'], name='booking_start_id_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookingslot',
+            constraint=models.UniqueConstraint(fields=('member', 'start'), name='unique_booking_slot'),
+        ),
+        migrations.AddIndex(
+            model_name='workinghours',
+            index=models.Index(fields=['member', 'weekday'], name='workinghours_member_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='workinghours',
+            constraint=models.CheckConstraint(condition=models.Q(('start__lt', models.F('end'))), name='working_hours_start_before_end'),
+        ),
+        migrations.RunPython(parse_durations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2 on 2026-10-18 12:07
+
+from django.db import migrations
+
+
+# Only message edits reach the index; marking contacts responded does not rewrite it
+FTS_STATEMENTS = [
+    """
+    CREATE VIRTUAL TABLE azfi_contact_fts USING fts5(
+        message,
+        content='azfi_contact', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER azfi_contact_ai AFTER INSERT ON azfi_contact BEGIN
+        INSERT INTO azfi_contact_fts(rowid, message) VALUES (new.id, new.message);
+    END
+    """,
+    """
+    CREATE TRIGGER azfi_contact_ad AFTER DELETE ON azfi_contact BEGIN
+        INSERT INTO azfi_contact_fts(azfi_contact_fts, rowid, message) VALUES ('delete', old.id, old.message);
+    END
+    """,
+    """
+    CREATE TRIGGER azfi_contact_au AFTER UPDATE OF message ON azfi_contact BEGIN
+        INSERT INTO azfi_contact_fts(azfi_contact_fts, rowid, message) VALUES ('delete', old.id, old.message);
+        INSERT INTO azfi_contact_fts(rowid, message) VALUES (new.id, new.message);
+    END
+    """,
+    "INSERT INTO azfi_contact_fts(azfi_contact_fts) VALUES ('rebuild')",
+]
+
+
+def fts5_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_fts_index(apps, schema_editor):
+    # Without FTS5 the admin searches names and email addresses only
+    if not fts5_available(schema_editor.connection):
+        return
+    for statement in FTS_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('ai', 'ad', 'au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS azfi_contact_{trigger}')
+    schema_editor.execute('DROP TABLE IF EXISTS azfi_contact_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('azfi', '0012_booking'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='subscriber',
+            name='subscriber_email_lower_idx',
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
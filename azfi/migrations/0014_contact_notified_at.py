@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 22:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_notified(apps, schema_editor):
+    # Their emails went out before notifications were tracked
+    Contact = apps.get_model('azfi', 'Contact')
+    Contact.objects.update(notified_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('azfi', '0013_contact_message_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_existing_notified, migrations.RunPython.noop),
+    ]
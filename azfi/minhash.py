@@ -0,0 +1,264 @@
+"""
+Related blog posts from MinHash signatures and locality-sensitive hashing.
+
+A post's title, excerpt and content are reduced to a set of shingles (its
+words of ``MIN_WORD_LENGTH`` letters or more). ``NUM_PERM`` random hash
+functions map the set to a signature of minimum hash values. The share of
+positions where two signatures agree estimates the Jaccard similarity of
+the sets.
+
+The signature is cut into ``BANDS`` bands of ``ROWS`` values. Each band is
+hashed to a ``PostBucket`` row, and two posts become candidates when they
+share any bucket. Pairs above roughly (1/BANDS)^(1/ROWS) Jaccard almost
+always collide and unrelated pairs rarely do, so finding neighbours is one
+indexed ``bucket IN (...)`` lookup instead of a comparison with every post.
+Candidates are ranked by their signature estimate, and the best ``TOP_K``
+are stored in ``RelatedPost`` for the detail page.
+
+Saving a post re-signs it and refreshes its list, the lists that showed it
+and the lists of candidates it now outranks. ``rebuild()`` does every post
+in memory.
+"""
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from . import cache, prerender
+from .models import BlogPost, PostBucket, PostSignature, RelatedPost
+from .search import tokenize
+
+NUM_PERM = 64
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+TOP_K = 3
+# Estimated Jaccard similarity below which posts are not shown as related
+MIN_SIMILARITY = 0.1
+# Shorter words are mostly stop words that every post shares
+MIN_WORD_LENGTH = 4
+SEED = 1
+BATCH_SIZE = 1000
+
+# Saves that touch none of these leave the signature as it was
+TEXT_FIELDS = {'title', 'excerpt', 'content'}
+
+_PRIME = np.uint64((1 << 61) - 1)
+_MASK = np.uint64(0xFFFFFFFF)
+_random = np.random.RandomState(SEED)
+_A = _random.randint(1, (1 << 61) - 1, NUM_PERM, dtype=np.uint64)
+_B = _random.randint(0, (1 << 61) - 1, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(*texts):
+    return {token for text in texts for token in tokenize(strip_tags(text or '')) if len(token) >= MIN_WORD_LENGTH}
+
+
+def hash_shingles(words, known=None):
+    """32-bit hashes of ``words``; ``known`` caches them across a batch of posts."""
+    if known is None:
+        return np.fromiter((zlib.crc32(word.encode()) for word in words), dtype=np.uint64, count=len(words))
+    return np.fromiter((known[word] if word in known else known.setdefault(word, zlib.crc32(word.encode()))
+                        for word in words), dtype=np.uint64, count=len(words))
+
+
+def signature(hashes):
+    """The MinHash signature (``NUM_PERM`` uint32) of a set of shingle hashes; None when it is empty."""
+    if not len(hashes):
+        return None
+    # (a * x + b) mod p for every hash function at once; the uint64 products wrap, which is still a fixed hash
+    return (((np.outer(hashes, _A) + _B) % _PRIME) & _MASK).min(axis=0).astype(np.uint32)
+
+
+def signature_of(post):
+    return signature(hash_shingles(list(shingles(post.title, post.excerpt, post.content))))
+
+
+def band_hashes(signatures):
+    """``(posts, BANDS)`` bucket ids; the band number is mixed in so bands never share buckets."""
+    parts = np.asarray(signatures, dtype=np.uint32).reshape(-1, BANDS, ROWS).astype(np.uint64)
+    hashed = np.broadcast_to(np.arange(1, BANDS + 1, dtype=np.uint64), parts.shape[:2]).copy()
+    for row in range(ROWS):
+        hashed = hashed * np.uint64(1000003) ^ parts[:, :, row]
+    return hashed.view(np.int64)
+
+
+def estimate(target, signatures):
+    """Estimated Jaccard similarity of ``target`` with each row of ``signatures``."""
+    return (signatures == target).mean(axis=1)
+
+
+def best(ids, scores, k=TOP_K):
+    """The ``k`` highest scoring ``(id, score)`` pairs above ``MIN_SIMILARITY``, ties by id."""
+    order = np.lexsort((ids, -scores))[:k]
+    return [(int(ids[i]), round(float(scores[i]), 4)) for i in order if scores[i] >= MIN_SIMILARITY]
+
+
+class Index:
+    """
+    Signatures of many posts with their buckets in memory, for ``rebuild()``
+    and the benchmark. ``signatures`` rows of None are posts without words.
+    """
+
+    def __init__(self, ids, signatures):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.signed = np.array([sig is not None for sig in signatures], dtype=bool)
+        self.signatures = np.vstack([sig if sig is not None else np.zeros(NUM_PERM, dtype=np.uint32)
+                                     for sig in signatures]) if len(signatures) else np.zeros((0, NUM_PERM), np.uint32)
+        self.buckets = band_hashes(self.signatures)
+        # bucket -> rows in it, from one sort of every (bucket, row) pair
+        signed = np.flatnonzero(self.signed)
+        flat = self.buckets[signed].ravel()
+        rows = np.repeat(signed, BANDS)
+        order = np.argsort(flat, kind='stable')
+        keys, starts = np.unique(flat[order], return_index=True)
+        self.members = dict(zip(keys.tolist(), np.split(rows[order], starts[1:])))
+
+    def candidates(self, row):
+        if not self.signed[row]:
+            return np.zeros(0, dtype=np.int64)
+        found = np.zeros(len(self.ids), dtype=bool)
+        for bucket in self.buckets[row].tolist():
+            found[self.members[bucket]] = True
+        found[row] = False
+        return np.flatnonzero(found)
+
+    def neighbours(self, row, k=TOP_K):
+        """``[(post id, score)]`` for the row, from its LSH candidates only."""
+        rows = self.candidates(row)
+        return best(self.ids[rows], estimate(self.signatures[row], self.signatures[rows]), k)
+
+
+# Stored signatures
+
+def load_signatures(ids):
+    """``(ids, signatures)`` of the stored posts among ``ids``."""
+    found, blobs = [], []
+    for post_id, blob in PostSignature.objects.filter(post_id__in=list(ids)).values_list('post_id', 'signature'):
+        found.append(post_id)
+        blobs.append(bytes(blob))
+    return np.array(found, dtype=np.int64), np.frombuffer(b''.join(blobs), dtype=np.uint32).reshape(-1, NUM_PERM)
+
+
+def scored_candidates(post_id, sig, buckets):
+    """``(ids, scores)`` of the posts sharing a bucket with ``post_id``."""
+    others = set(PostBucket.objects.filter(bucket__in=buckets).values_list('post_id', flat=True)) - {post_id}
+    if not others:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    ids, signatures = load_signatures(others)
+    return ids, estimate(sig, signatures)
+
+
+def stored_lists(post_ids):
+    lists = defaultdict(list)
+    for post_id, related_id, score in RelatedPost.objects.filter(post_id__in=list(post_ids)).order_by(
+            'post_id', 'rank').values_list('post_id', 'related_id', 'score'):
+        lists[post_id].append((related_id, score))
+    return lists
+
+
+def write_lists(lists):
+    RelatedPost.objects.filter(post_id__in=list(lists)).delete()
+    RelatedPost.objects.bulk_create([
+        RelatedPost(post_id=post_id, related_id=related, rank=rank, score=score)
+        for post_id, items in lists.items() for rank, (related, score) in enumerate(items)
+    ], batch_size=BATCH_SIZE)
+
+
+def recompute(post_ids):
+    """Rank the stored posts ``post_ids`` again from their stored signatures and buckets."""
+    ids, signatures = load_signatures(post_ids)
+    buckets = defaultdict(list)
+    for post_id, bucket in PostBucket.objects.filter(post_id__in=ids.tolist()).values_list('post_id', 'bucket'):
+        buckets[post_id].append(bucket)
+    lists = {}
+    for post_id, sig in zip(ids.tolist(), signatures):
+        lists[post_id] = best(*scored_candidates(post_id, sig, buckets[post_id]))
+    lists.update({post_id: [] for post_id in set(post_ids) - set(lists)})
+    return lists
+
+
+@transaction.atomic
+def index_post(post):
+    """Store ``post``'s signature and buckets, and refresh every related list it can change."""
+    sig = signature_of(post)
+    showing = set(RelatedPost.objects.filter(related_id=post.pk).values_list('post_id', flat=True))
+    PostBucket.objects.filter(post_id=post.pk).delete()
+    if sig is None:
+        PostSignature.objects.filter(post_id=post.pk).delete()
+        lists = {post.pk: []}
+    else:
+        PostSignature.objects.update_or_create(post_id=post.pk, defaults={'signature': sig.tobytes()})
+        buckets = band_hashes(sig[None])[0].tolist()
+        PostBucket.objects.bulk_create([PostBucket(post_id=post.pk, bucket=bucket) for bucket in buckets])
+        ids, scores = scored_candidates(post.pk, sig, buckets)
+        lists = {post.pk: best(ids, scores)}
+
+        # Candidates whose list the post now enters: insert it into the stored list
+        entering = {int(other): round(float(score), 4) for other, score in zip(ids, scores)
+                    if score >= MIN_SIMILARITY and int(other) not in showing}
+        stored = stored_lists(entering)
+        for other, score in entering.items():
+            items = stored[other]
+            if len(items) < TOP_K or score > items[-1][1]:
+                lists[other] = sorted(items + [(post.pk, score)], key=lambda item: (-item[1], item[0]))[:TOP_K]
+    # Lists that showed the post: its score changed, so rank them again
+    lists.update(recompute(showing - {post.pk}))
+    write_lists(lists)
+
+
+def rebuild():
+    """Sign every post and rank all related lists in memory; return the number of posts."""
+    ids, signatures, known = [], [], {}
+    for post_id, title, excerpt, content in BlogPost.objects.order_by('pk').values_list(
+            'pk', 'title', 'excerpt', 'content').iterator(chunk_size=BATCH_SIZE):
+        ids.append(post_id)
+        signatures.append(signature(hash_shingles(list(shingles(title, excerpt, content)), known)))
+    index = Index(ids, signatures)
+    lists = {post_id: index.neighbours(row) for row, post_id in enumerate(ids)}
+    before = stored_lists(ids)
+    changed = [post_id for post_id in ids if lists[post_id] != before.get(post_id, [])]
+
+    with transaction.atomic():
+        PostSignature.objects.all().delete()
+        PostBucket.objects.all().delete()
+        RelatedPost.objects.all().delete()
+        signed = np.flatnonzero(index.signed)
+        PostSignature.objects.bulk_create([
+            PostSignature(post_id=ids[row], signature=index.signatures[row].tobytes()) for row in signed
+        ], batch_size=BATCH_SIZE)
+        PostBucket.objects.bulk_create([
+            PostBucket(post_id=ids[row], bucket=bucket) for row in signed for bucket in index.buckets[row].tolist()
+        ], batch_size=BATCH_SIZE)
+        write_lists(lists)
+        # Conditional GETs of the pages whose list changed must not answer 304
+        BlogPost.objects.filter(pk__in=changed).update(updated_at=timezone.now())
+    cache.invalidate(RelatedPost)
+    prerender.enqueue_changes([RelatedPost])
+    return len(ids)
+
+
+def update_post(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and not set(update_fields) & TEXT_FIELDS):
+        return
+    index_post(instance)
+
+
+def remember_showing(sender, instance, **kwargs):
+    # Their rows are cascade-deleted with the post, so note them now
+    instance._minhash_showing = set(RelatedPost.objects.filter(related_id=instance.pk).values_list('post_id', flat=True))
+
+
+def remove_post(sender, instance, **kwargs):
+    showing = getattr(instance, '_minhash_showing', set()) - {instance.pk}
+    if showing:
+        write_lists(recompute(showing))
+
+
+def connect_signals():
+    post_save.connect(update_post, sender=BlogPost, dispatch_uid='minhash_post_save')
+    pre_delete.connect(remember_showing, sender=BlogPost, dispatch_uid='minhash_post_pre_delete')
+    post_delete.connect(remove_post, sender=BlogPost, dispatch_uid='minhash_post_delete')
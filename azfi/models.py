@@ -1,8 +1,13 @@
+import uuid
+
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
 
+from . import markup
+
 class Treatment(models.Model):
     CATEGORY_CHOICES = [
         ('FACE', 'Face'),
@@ -16,12 +21,22 @@ class Treatment(models.Model):
     what_to_expect = models.TextField()
     price_range = models.CharField(max_length=100)
     duration = models.CharField(max_length=50)
+    # Appointment length for booking (azfi/booking.py); ``duration`` is the text shown on the site
+    duration_minutes = models.PositiveSmallIntegerField(default=60)
     image = models.ImageField(upload_to='treatments/')
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Category filter, related treatments and the freshness aggregate (azfi/freshness.py)
+            models.Index(fields=['category', 'updated_at'], name='treatment_category_updated_idx'),
+            # Partial: SQLite compiles filter(featured=True) to a bare column test no plain index serves
+            models.Index(fields=['category'], condition=models.Q(featured=True), name='treatment_featured_idx'),
+        ]
+    
     def __str__(self):
         return self.name
     
@@ -36,6 +51,9 @@ class TreatmentFAQ(models.Model):
     
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['treatment', 'order'], name='treatmentfaq_treatment_idx'),
+        ]
         
     def __str__(self):
         return f"{self.treatment.name} - {self.question}"
@@ -47,6 +65,12 @@ class BeforeAfterImage(models.Model):
     after_image = models.ImageField(upload_to='before_after/after/')
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination order for the gallery (azfi/pagination.py)
+            models.Index(fields=['created_at', 'id'], name='beforeafter_created_id_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.treatment.name} - {self.title}"
 
@@ -56,9 +80,14 @@ class TeamMember(models.Model):
     bio = models.TextField()
     image = models.ImageField(upload_to='team/')
     order = models.PositiveIntegerField(default=0)
+    # Treatments this practitioner can be booked for, during their ``working_hours``
+    treatments = models.ManyToManyField(Treatment, blank=True, related_name='practitioners')
     
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['order'], name='teammember_order_idx'),
+        ]
         
     def __str__(self):
         return f"{self.name} - {self.role}"
@@ -70,6 +99,15 @@ class Testimonial(models.Model):
     image = models.ImageField(upload_to='testimonials/', blank=True, null=True)
     date = models.DateField(default=timezone.now)
     featured = models.BooleanField(default=False)
+    # Watermark for incremental exports (azfi/exports.py); ``date`` is the date shown on the site
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='testimonial_date_id_idx'),
+            models.Index(fields=['date', 'id'], condition=models.Q(featured=True), name='testimonial_featured_idx'),
+            models.Index(fields=['created_at', 'id'], name='testimonial_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"Testimonial from {self.name}"
@@ -84,15 +122,44 @@ class BlogPost(models.Model):
     published_date = models.DateTimeField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Compiled from content and excerpt on save (azfi/markup.py)
+    content_html = models.TextField(blank=True, editable=False)
+    toc = models.JSONField(default=list, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=1, editable=False)
+    summary = models.TextField(blank=True, editable=False)
+    
+    SOURCE_FIELDS = {'content', 'excerpt'}
+    COMPILED_FIELDS = ['content_html', 'toc', 'word_count', 'reading_time', 'summary']
     
     class Meta:
         ordering = ['-published_date']
+        indexes = [
+            models.Index(fields=['published_date', 'id'], name='blogpost_published_id_idx'),
+            # Next/previous post links
+            models.Index(fields=['created_at', 'id'], name='blogpost_created_id_idx'),
+            # The freshness aggregate reads this index instead of the posts
+            models.Index(fields=['updated_at'], name='blogpost_updated_idx'),
+        ]
         
     def __str__(self):
         return self.title
     
     def get_absolute_url(self):
         return reverse('blog_detail', kwargs={'slug': self.slug})
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or self.SOURCE_FIELDS & set(update_fields):
+            self.compile_content()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *self.COMPILED_FIELDS}
+        super().save(*args, **kwargs)
+    
+    def compile_content(self):
+        """Set the compiled fields from ``content`` and ``excerpt``; bulk writes call this themselves."""
+        for name, value in markup.compile_post(self.content, self.excerpt).items():
+            setattr(self, name, value)
 
 class Contact(models.Model):
     name = models.CharField(max_length=100)
@@ -101,6 +168,201 @@ class Contact(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     responded = models.BooleanField(default=False)
+    # Set by the contact intake queue so a replayed submission is stored once (see azfi/intake.py)
+    intake_id = models.UUIDField(unique=True, null=True, blank=True, editable=False)
+    # Set once the clinic has been emailed, so a replayed notification is not sent again
+    notified_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    class Meta:
+        indexes = [
+            # The admin's newest-first list and date drill-down, and the unanswered leads
+            models.Index(fields=['created_at', 'id'], name='contact_created_id_idx'),
+            models.Index(fields=['created_at', 'id'], condition=models.Q(responded=False), name='contact_open_idx'),
+            # The admin's case-insensitive prefix search (LargeTableAdminMixin)
+            models.Index(Lower('name'), name='contact_name_lower_idx'),
+            models.Index(Lower('email'), name='contact_email_lower_idx'),
+        ]
     
     def __str__(self):
         return f"Message from {self.name} ({self.created_at.strftime('%Y-%m-%d')})"
+
+class Subscriber(models.Model):
+    """Newsletter subscriber; ``email`` is stored normalised (see azfi/newsletter.py)."""
+    email = models.EmailField(unique=True)
+    source = models.CharField(max_length=200, blank=True)
+    # Not auto_now_add: the queue worker stores the time the visitor signed up
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # ``email`` is stored lowercase, so its unique index serves the admin's prefix search
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='subscriber_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return self.email
+
+class SearchDocument(models.Model):
+    """Denormalised searchable text for one treatment, blog post or FAQ (see azfi/search.py)."""
+    KIND_CHOICES = [
+        ('treatment', 'Treatment'),
+        ('post', 'Blog post'),
+        ('faq', 'FAQ'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    url = models.CharField(max_length=255)
+    length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title}"
+
+class SearchPosting(models.Model):
+    """Inverted index entry used when the database has no FTS5 support."""
+    term = models.CharField(max_length=64)
+    document = models.ForeignKey(SearchDocument, related_name='postings', on_delete=models.CASCADE)
+    frequency = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'document'], name='search_posting_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} ({self.frequency})"
+
+class RelatedTreatment(models.Model):
+    """One of a treatment's nearest neighbours by content similarity (see azfi/similarity.py)."""
+    treatment = models.ForeignKey(Treatment, related_name='similar', on_delete=models.CASCADE)
+    related = models.ForeignKey(Treatment, related_name='related_from', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index the detail page reads its related treatments from, in order
+            models.UniqueConstraint(fields=['treatment', 'rank'], name='unique_related_treatment_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.treatment_id} -> {self.related_id} ({self.score:.3f})"
+
+class PostSignature(models.Model):
+    """MinHash signature of a blog post's words (see azfi/minhash.py)."""
+    post = models.OneToOneField(BlogPost, primary_key=True, related_name='signature', on_delete=models.CASCADE)
+    signature = models.BinaryField()
+
+    def __str__(self):
+        return f"Signature of post {self.post_id}"
+
+class PostBucket(models.Model):
+    """One locality-sensitive hashing bucket a blog post's signature falls into."""
+    post = models.ForeignKey(BlogPost, related_name='buckets', on_delete=models.CASCADE)
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            # Candidate lookup: every post sharing a bucket, without reading the posts
+            models.Index(fields=['bucket', 'post'], name='postbucket_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} in {self.bucket}"
+
+class RelatedPost(models.Model):
+    """One of a blog post's most similar posts by MinHash estimate (see azfi/minhash.py)."""
+    post = models.ForeignKey(BlogPost, related_name='similar', on_delete=models.CASCADE)
+    related = models.ForeignKey(BlogPost, related_name='related_from', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'rank'], name='unique_related_post_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} -> {self.related_id} ({self.score:.2f})"
+
+class WorkingHours(models.Model):
+    """A practitioner's bookable hours on one weekday, in the clinic's time zone (see azfi/booking.py)."""
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'),
+        (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday'),
+    ]
+
+    member = models.ForeignKey(TeamMember, related_name='working_hours', on_delete=models.CASCADE)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start = models.TimeField()
+    end = models.TimeField()
+
+    class Meta:
+        ordering = ['weekday', 'start']
+        verbose_name_plural = 'working hours'
+        indexes = [
+            models.Index(fields=['member', 'weekday'], name='workinghours_member_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(start__lt=models.F('end')), name='working_hours_start_before_end'),
+        ]
+
+    def __str__(self):
+        return f"{self.member.name}: {self.get_weekday_display()} {self.start:%H:%M}-{self.end:%H:%M}"
+
+class Booking(models.Model):
+    """An appointment with one practitioner; its ``BookingSlot`` rows keep it from overlapping another."""
+    CONFIRMED = 'confirmed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (CONFIRMED, 'Confirmed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    reference = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    treatment = models.ForeignKey(Treatment, related_name='bookings', on_delete=models.PROTECT)
+    member = models.ForeignKey(TeamMember, related_name='bookings', on_delete=models.PROTECT)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    name = models.CharField(max_length=100)
+    email = models.EmailField()
+    phone = models.CharField(max_length=20)
+    notes = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=CONFIRMED)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The front desk's day sheet per practitioner
+            models.Index(fields=['member', 'start'], name='booking_member_start_idx'),
+            models.Index(fields=['start', 'id'], name='booking_start_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.treatment.name} with {self.member.name} at {timezone.localtime(self.start):%Y-%m-%d %H:%M}"
+
+class BookingSlot(models.Model):
+    """
+    One ``BOOKING_SLOT_MINUTES`` step of a practitioner's time held by a
+    confirmed booking. The unique constraint is what makes two overlapping
+    bookings impossible, whichever request commits first.
+    """
+    booking = models.ForeignKey(Booking, related_name='slots', on_delete=models.CASCADE)
+    member = models.ForeignKey(TeamMember, related_name='booked_slots', on_delete=models.CASCADE)
+    start = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # Also the index availability reads a practitioner's booked time from
+            models.UniqueConstraint(fields=['member', 'start'], name='unique_booking_slot'),
+        ]
+
+    def __str__(self):
+        return f"{self.member_id} at {self.start:%Y-%m-%d %H:%M}"
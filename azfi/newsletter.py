@@ -0,0 +1,130 @@
+"""
+Newsletter subscriptions with an in-memory duplicate check and batched writes.
+
+``subscribe()`` normalises the address and looks it up in ``seen``, a set of
+64-bit hashes of every stored address that is loaded with one query the
+first time it is needed and refreshed every ``NEWSLETTER_SEEN_TTL`` seconds.
+Repeat signups therefore cost no database work at all. New addresses are
+spooled (see azfi/spool.py) and the queue worker stores them with one
+``INSERT OR IGNORE`` per batch, so a promotion's signup burst never takes
+one write transaction per request.
+
+The set is per process and only a pre-check: the unique constraint on
+``Subscriber.email`` has the final say.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import spool
+from .models import Subscriber
+
+SUBSCRIBE_TOPIC = 'newsletter.subscribe'
+
+
+def normalize_email(email):
+    """Trim and lowercase an address so ``Jane@Example.com `` and ``jane@example.com`` match."""
+    return email.strip().lower()
+
+
+def fingerprint(email):
+    return int.from_bytes(hashlib.blake2b(email.encode(), digest_size=8).digest(), 'big')
+
+
+class SeenSet:
+    """Hashes of stored subscriber addresses, loaded lazily and reloaded after ``ttl`` seconds."""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._hashes = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes or ())
+
+    def warm(self):
+        hashes = {fingerprint(email) for email in
+                  Subscriber.objects.values_list('email', flat=True).iterator(chunk_size=10_000)}
+        with self._lock:
+            self._hashes = hashes
+            self._loaded_at = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._hashes = None
+
+    def add(self, email):
+        """Record ``email``; return False if it was already there."""
+        if self._hashes is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.warm()
+        value = fingerprint(email)
+        with self._lock:
+            if value in self._hashes:
+                return False
+            self._hashes.add(value)
+            return True
+
+    def discard(self, email):
+        with self._lock:
+            if self._hashes is not None:
+                self._hashes.discard(fingerprint(email))
+
+
+seen = SeenSet(ttl=getattr(settings, 'NEWSLETTER_SEEN_TTL', 300))
+
+
+def is_async():
+    return getattr(settings, 'NEWSLETTER_INTAKE_ASYNC', True)
+
+
+def subscribe(email, source=''):
+    """Subscribe ``email``; return False if it is already on the list."""
+    email = normalize_email(email)
+    if not seen.add(email):
+        return False
+    source = source[:200]
+    try:
+        if is_async():
+            spool.enqueue(SUBSCRIBE_TOPIC, {
+                'email': email, 'source': source, 'subscribed_at': timezone.now().isoformat(),
+            })
+        else:
+            Subscriber.objects.get_or_create(email=email, defaults={'source': source})
+    except Exception:
+        # Not stored, so let the visitor try again
+        seen.discard(email)
+        raise
+    return True
+
+
+def store_subscribers(jobs):
+    """Insert a batch of spooled signups with one statement; known addresses are skipped."""
+    rows = {}
+    for job in jobs:
+        payload = job.payload
+        email = normalize_email(payload['email'])
+        rows.setdefault(email, Subscriber(
+            email=email, source=payload.get('source', ''),
+            created_at=parse_datetime(payload['subscribed_at']),
+        ))
+    Subscriber.objects.bulk_create(rows.values(), ignore_conflicts=True)
+
+
+def forget_subscriber(sender, instance, **kwargs):
+    seen.discard(instance.email)
+
+
+def connect_signals():
+    # Let an address removed in the admin sign up again without waiting for the TTL
+    post_delete.connect(forget_subscriber, sender=Subscriber, dispatch_uid='newsletter_forget')
+
+
+def register_topics():
+    spool.register(SUBSCRIBE_TOPIC, store_subscribers,
+                   batch_size=getattr(settings, 'NEWSLETTER_BATCH_SIZE', 500))
@@ -0,0 +1,145 @@
+"""
+Keyset ("cursor") pagination for long, append-mostly listings.
+
+Instead of ``OFFSET``/``LIMIT`` and a ``COUNT(*)``, each page is fetched with
+a ``WHERE`` clause that starts right after the last row of the previous page,
+so page 500 costs the same single indexed query as page one. The position is
+carried in an opaque token holding the ordering values of the boundary row.
+"""
+import base64
+import json
+from collections.abc import Sequence
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class CursorPage(Sequence):
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} rows>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate ``queryset`` by ``ordering``, which must end in a unique field
+    (normally ``id``) so that every row has a distinct position.
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [
+            (queryset.model._meta.get_field(name.lstrip('-')), name.startswith('-'))
+            for name in self.ordering
+        ]
+
+    def encode(self, direction, row):
+        values = [field.value_to_string(row) for field, _descending in self.fields]
+        raw = json.dumps([direction, *values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, *values = json.loads(raw)
+            if direction not in (NEXT, PREVIOUS) or len(values) != len(self.fields):
+                raise ValueError(cursor)
+            return direction, [field.to_python(value) for (field, _d), value in zip(self.fields, values)]
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidPage("Invalid cursor.")
+
+    def after(self, values, reverse=False):
+        """Rows strictly after ``values`` in the pagination order (before, if ``reverse``)."""
+        lexicographic = Q()
+        for index, (field, descending) in enumerate(self.fields):
+            op = 'lt' if descending != reverse else 'gt'
+            ties = {f.name: value for (f, _d), value in zip(self.fields[:index], values)}
+            lexicographic |= Q(**ties, **{f'{field.name}__{op}': values[index]})
+        # Bounding the leading column lets the database seek the index to the cursor
+        field, descending = self.fields[0]
+        bound = Q(**{f"{field.name}__{'lte' if descending != reverse else 'gte'}": values[0]})
+        return bound & lexicographic
+
+    def page(self, cursor=None):
+        """Return the page after (or before) ``cursor``, or the first page."""
+        direction, values = self.decode(cursor) if cursor else (NEXT, None)
+
+        if direction == PREVIOUS:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+            queryset = self.queryset.filter(self.after(values, reverse=True)).order_by(*ordering)
+        else:
+            queryset = self.queryset.order_by(*self.ordering)
+            if values is not None:
+                queryset = queryset.filter(self.after(values))
+
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+        if not rows:
+            return CursorPage(rows, self)
+
+        has_next = more if direction == NEXT else True
+        has_previous = more if direction == PREVIOUS else values is not None
+        return CursorPage(
+            rows, self,
+            next_cursor=self.encode(NEXT, rows[-1]) if has_next else None,
+            previous_cursor=self.encode(PREVIOUS, rows[0]) if has_previous else None,
+        )
+
+
+class CursorPaginationMixin:
+    """
+    ``ListView`` mixin that pages with ``CursorPaginator`` instead of page numbers.
+
+    The page object gains ``next_url`` and ``previous_url`` links that keep the
+    other GET parameters (filters) and replace the cursor.
+    """
+    cursor_ordering = ('-id',)
+    cursor_kwarg = 'cursor'
+
+    def page_url(self, cursor):
+        params = self.request.GET.copy()
+        params.pop(self.cursor_kwarg, None)
+        if cursor:
+            params[self.cursor_kwarg] = cursor
+        return f'{self.request.path}?{params.urlencode()}' if params else self.request.path
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        page.next_url = self.page_url(page.next_cursor) if page.has_next() else None
+        page.previous_url = self.page_url(page.previous_cursor) if page.has_previous() else None
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,124 @@
+"""
+The Porter stemming algorithm, as used by SQLite's ``porter`` tokenizer.
+
+The FTS5 search index (azfi/search.py) stems every word, so "peels",
+"peeled" and "peeling" all match a search for "peel". The ``SearchPosting``
+fallback stems with ``stem()`` so that both indexes find the same documents.
+See https://tartarus.org/martin/PorterStemmer/def.txt for the rules.
+"""
+VOWELS = frozenset('aeiou')
+
+STEP2 = [
+    ('ational', 'ate'), ('tional', 'tion'), ('enci', 'ence'), ('anci', 'ance'), ('izer', 'ize'),
+    ('bli', 'ble'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous'),
+    ('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate'), ('alism', 'al'), ('iveness', 'ive'),
+    ('fulness', 'ful'), ('ousness', 'ous'), ('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble'),
+    ('logi', 'log'),
+]
+STEP3 = [
+    ('icate', 'ic'), ('ative', ''), ('alize', 'al'), ('iciti', 'ic'), ('ical', 'ic'), ('ful', ''), ('ness', ''),
+]
+STEP4 = [
+    'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent', 'ion', 'ou',
+    'ism', 'ate', 'iti', 'ous', 'ive', 'ize',
+]
+
+
+def is_consonant(word, i):
+    if word[i] in VOWELS:
+        return False
+    if word[i] == 'y':
+        return i == 0 or not is_consonant(word, i - 1)
+    return True
+
+
+def measure(stem):
+    """The number of vowel-consonant sequences in ``stem``: m in [C](VC){m}[V]."""
+    m, previous_vowel = 0, False
+    for i in range(len(stem)):
+        vowel = not is_consonant(stem, i)
+        if previous_vowel and not vowel:
+            m += 1
+        previous_vowel = vowel
+    return m
+
+
+def has_vowel(stem):
+    return any(not is_consonant(stem, i) for i in range(len(stem)))
+
+
+def ends_double_consonant(word):
+    return len(word) > 1 and word[-1] == word[-2] and is_consonant(word, len(word) - 1)
+
+
+def ends_cvc(word):
+    """Consonant, vowel, consonant, the last not w, x or y: "hop", not "hoop" or "snow"."""
+    return (len(word) > 2 and is_consonant(word, len(word) - 3) and not is_consonant(word, len(word) - 2)
+            and is_consonant(word, len(word) - 1) and word[-1] not in 'wxy')
+
+
+def replace_suffix(word, rules, min_measure):
+    """Apply the rule for the longest suffix of ``word`` that has one, if the stem is long enough."""
+    for suffix, replacement in sorted(rules, key=lambda rule: -len(rule[0])):
+        if word.endswith(suffix):
+            stem = word[:-len(suffix)]
+            return stem + replacement if measure(stem) > min_measure else word
+    return word
+
+
+def step1(word):
+    if word.endswith('sses') or word.endswith('ies'):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+
+    if word.endswith('eed'):
+        if measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ('ed', 'ing'):
+            if word.endswith(suffix) and has_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word.endswith(('at', 'bl', 'iz')):
+                    word += 'e'
+                elif ends_double_consonant(word) and word[-1] not in 'lsz':
+                    word = word[:-1]
+                elif measure(word) == 1 and ends_cvc(word):
+                    word += 'e'
+                break
+
+    if word.endswith('y') and has_vowel(word[:-1]):
+        word = word[:-1] + 'i'
+    return word
+
+
+def step4(word):
+    for suffix in sorted(STEP4, key=len, reverse=True):
+        if word.endswith(suffix):
+            stem = word[:-len(suffix)]
+            if suffix == 'ion' and not stem.endswith(('s', 't')):
+                return word
+            return stem if measure(stem) > 1 else word
+    return word
+
+
+def step5(word):
+    if word.endswith('e'):
+        stem = word[:-1]
+        m = measure(stem)
+        if m > 1 or (m == 1 and not ends_cvc(stem)):
+            word = stem
+    if measure(word) > 1 and ends_double_consonant(word) and word.endswith('l'):
+        word = word[:-1]
+    return word
+
+
+def stem(word):
+    """The stem of a lowercase word; words with anything but ASCII letters are left alone."""
+    if len(word) <= 2 or not (word.isascii() and word.isalpha()):
+        return word
+    word = step1(word)
+    word = replace_suffix(word, STEP2, 0)
+    word = replace_suffix(word, STEP3, 0)
+    word = step4(word)
+    return step5(word)
@@ -0,0 +1,269 @@
+"""
+Static pre-rendering of the public pages, with incremental rebuilds.
+
+``build()`` walks azfi/urls.py, renders every page-cached view (one file per
+treatment and blog post for the detail views) and writes
+``PRERENDER_ROOT/<path>/index.html`` plus a ``.gz`` sibling, so the web
+server can answer those URLs without Django. Requests with a query string
+(filters, cursors) and the contact and search pages stay dynamic.
+
+Pages are rendered by calling their views directly, without the middleware,
+and always as page shells (azfi/shell.py): their forms carry an empty CSRF
+field and base.js fills in each visitor's token from ``/fragments/``.
+
+While rendering, the tables each page reads are recorded in
+``manifest.json``. That dependency map is what keeps rebuilds incremental:
+with ``PRERENDER_ENABLED`` on, saving or deleting a row queues a change (see
+azfi/spool.py), and the queue worker re-renders only the pages that read
+that model. Detail pages are narrowed further with ``SCOPES``: editing an FAQ
+re-renders its own treatment's page, not every treatment page.
+"""
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from . import assets, cache, shell, spool
+from .middleware import QueryRecorder
+
+logger = logging.getLogger('azfi.prerender')
+
+CHANGE_TOPIC = 'prerender'
+MANIFEST = 'manifest.json'
+
+TABLE_RE = re.compile(r'(?:FROM|JOIN)\s+"(\w+)"')
+
+# Detail pages only read some rows of these models:
+# url name -> {model label: (field of the changed row, attribute of the page's object)}
+SCOPES = {
+    'treatment_detail': {
+        'azfi.treatment': ('id', 'pk'),  # pages listing it as related are queued by azfi/similarity.py
+        'azfi.relatedtreatment': ('treatment_id', 'pk'),
+        'azfi.treatmentfaq': ('treatment_id', 'pk'),
+        'azfi.beforeafterimage': ('treatment_id', 'pk'),
+        'azfi.testimonial': ('treatment_id', 'pk'),
+    },
+}
+
+
+def is_enabled():
+    return getattr(settings, 'PRERENDER_ENABLED', False)
+
+
+def get_root():
+    return Path(getattr(settings, 'PRERENDER_ROOT', settings.BASE_DIR / 'prerendered'))
+
+
+def get_host():
+    """The host in the pages' absolute URLs: ``PRERENDER_HOST`` or the first allowed host."""
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    return getattr(settings, 'PRERENDER_HOST', None) or (hosts[0] if hosts else 'localhost')
+
+
+def scope_fields(label):
+    return sorted({scope[label][0] for scope in SCOPES.values() if label in scope})
+
+
+def pages():
+    """Return ``{url: (url name, scope)}`` for every page that can be pre-rendered."""
+    from .cache import CachedPageMixin
+    from .urls import urlpatterns
+
+    found = {}
+    for pattern in urlpatterns:
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if view_class is None or not issubclass(view_class, CachedPageMixin):
+            continue
+        name = pattern.name
+        if not pattern.pattern.converters:
+            found[reverse(name)] = (name, {})
+            continue
+        scopes = SCOPES.get(name, {})
+        attributes = {attribute for _field, attribute in scopes.values()}
+        for obj in view_class.model._default_manager.order_by('pk').only('slug', *attributes - {'pk'}):
+            scope = {label: [field, getattr(obj, attribute)] for label, (field, attribute) in scopes.items()}
+            found[reverse(name, kwargs={'slug': obj.slug})] = (name, scope)
+    return found
+
+
+def path_for(root, url):
+    return root / url.strip('/') / 'index.html'
+
+
+def load_manifest(root):
+    try:
+        return json.loads((root / MANIFEST).read_text())['pages']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def save_manifest(root, manifest):
+    tmp = root / (MANIFEST + '.tmp')
+    tmp.write_text(json.dumps({'pages': manifest}, indent=1, sort_keys=True))
+    os.replace(tmp, root / MANIFEST)
+
+
+def write_atomic(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def models_read(recorder):
+    tables = {model._meta.db_table: model._meta.label_lower for model in apps.get_models()}
+    return sorted({tables[table] for _alias, sql, _params, _duration in recorder.queries
+                   for table in TABLE_RE.findall(sql) if table in tables})
+
+
+def get_page(request, url):
+    """Call the view ``url`` resolves to and return its rendered response."""
+    match = resolve(url)
+    view = async_to_sync(match.func) if iscoroutinefunction(match.func) else match.func
+    response = view(request, *match.args, **match.kwargs)
+    if not getattr(response, 'is_rendered', True):
+        response.render()
+    return response
+
+
+def render(root, urls):
+    """Render ``urls`` (``{url: (name, scope)}``) into ``root``; return their manifest entries."""
+    factory = RequestFactory(HTTP_HOST=get_host())
+    entries = {}
+    for url, (name, scope) in urls.items():
+        request = factory.get(url)
+        request.META[shell.PRERENDER_KEY] = True
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recorder.record():
+            response = get_page(request, url)
+        if response.status_code != 200:
+            logger.warning("Not pre-rendering %s: status %s", url, response.status_code)
+            continue
+        path = path_for(root, url)
+        write_atomic(path, response.content)
+        write_atomic(path.with_name(path.name + '.gz'), assets.precompress(response.content)['.gz'])
+        entries[url] = {
+            'name': name,
+            'models': models_read(recorder),
+            'scope': scope,
+            'ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+    return entries
+
+
+def remove(root, urls):
+    for url in urls:
+        path = path_for(root, url)
+        for stale in (path, path.with_name(path.name + '.gz')):
+            stale.unlink(missing_ok=True)
+
+
+def affects(entry, change):
+    if change['model'] not in entry['models']:
+        return False
+    scope = entry['scope'].get(change['model'])
+    values = change['values'].get(scope[0]) if scope else None
+    # Without a recorded value (bulk changes) every page reading the model is affected
+    return values is None or scope[1] in values
+
+
+def build(root=None):
+    """Render every page from scratch; return ``(rendered, removed)`` URL lists."""
+    root = root or get_root()
+    root.mkdir(parents=True, exist_ok=True)
+    current = pages()
+    stale = [url for url in load_manifest(root) if url not in current]
+    remove(root, stale)
+    manifest = render(root, current)
+    save_manifest(root, manifest)
+    return sorted(manifest), stale
+
+
+def update(changes, root=None):
+    """
+    Re-render the pages ``changes`` affect, render new pages and delete the
+    files of pages that no longer exist; return ``(rendered, removed)``.
+    """
+    root = root or get_root()
+    manifest = load_manifest(root)
+    if not manifest:
+        return build(root)
+    current = pages()
+    stale = [url for url in manifest if url not in current]
+    dirty = {
+        url: page for url, page in current.items()
+        if url not in manifest or manifest[url]['scope'] != page[1]
+        or any(affects(manifest[url], change) for change in changes)
+    }
+    remove(root, stale)
+    for url in stale:
+        del manifest[url]
+    manifest.update(render(root, dirty))
+    save_manifest(root, manifest)
+    return sorted(dirty), stale
+
+
+def change_for(instance, previous=None):
+    label = instance._meta.label_lower
+    values = {}
+    for field in scope_fields(label):
+        values[field] = [getattr(instance, field)]
+        if previous and previous.get(field) != getattr(instance, field):
+            values[field].append(previous[field])
+    return {'model': label, 'values': values}
+
+
+def enqueue_changes(models):
+    """Queue a change of every row of ``models``, for bulk writes that skip signals."""
+    if is_enabled() and models:
+        spool.get_spool().enqueue_many(CHANGE_TOPIC, [
+            {'model': cache.tag_for(model), 'values': {}} for model in models
+        ])
+
+
+def enqueue_change(model, **values):
+    """Queue a change of the rows of ``model`` whose fields hold ``values`` (lists), for writes that skip signals."""
+    if is_enabled():
+        spool.enqueue(CHANGE_TOPIC, {'model': cache.tag_for(model), 'values': values})
+
+
+def remember_previous(sender, instance, **kwargs):
+    fields = scope_fields(sender._meta.label_lower)
+    if is_enabled() and fields and instance.pk is not None:
+        instance._prerender_previous = sender._default_manager.filter(pk=instance.pk).values(*fields).first()
+
+
+def queue_change(sender, instance, update_fields=None, **kwargs):
+    if not is_enabled():
+        return
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        # Logging in does not change anything a page shows
+        return
+    spool.enqueue(CHANGE_TOPIC, change_for(instance, getattr(instance, '_prerender_previous', None)))
+
+
+def apply_changes(jobs):
+    rendered, removed = update([job.payload for job in jobs])
+    logger.info("Pre-rendered %d page(s), removed %d", len(rendered), len(removed))
+
+
+def connect_signals():
+    for label in cache.TAGGED_MODELS:
+        model = apps.get_model(label)
+        pre_save.connect(remember_previous, sender=model, dispatch_uid=f'prerender_pre_save_{label}')
+        post_save.connect(queue_change, sender=model, dispatch_uid=f'prerender_save_{label}')
+        post_delete.connect(queue_change, sender=model, dispatch_uid=f'prerender_delete_{label}')
+
+
+def register_topics():
+    spool.register(CHANGE_TOPIC, apply_changes, batch_size=500)
@@ -0,0 +1,246 @@
+"""
+Opt-in profiling of single requests.
+
+With ``PROFILING_ENABLED``, ``ProfilingMiddleware`` profiles a request when
+it carries a token from ``/ops/profiling/`` in the ``X-Profile`` header or
+the ``?_profile=`` parameter, and otherwise a ``PROFILING_SAMPLE_RATE``
+fraction of requests at random. Without the setting the middleware removes
+itself from the stack at startup and nothing here runs.
+
+A profiled request leaves three files in ``PROFILING_DIR``, named by the
+``X-Profile`` response header:
+
+- ``<name>.cpu.folded``: Python stacks sampled every ``PROFILING_INTERVAL_MS``
+  from a background thread.
+- ``<name>.folded``: wall time split into the request itself, each template
+  (nested as they include and extend each other) and each SQL query under
+  the template that ran it, in microseconds.
+- ``<name>.json``: per-template and per-query timings.
+
+The ``.folded`` files are collapsed stacks, the input of ``flamegraph.pl``,
+speedscope and inferno. Under ASGI the sampler watches the event loop and
+the thread that runs sync code, so other requests on those threads show up
+in the CPU profile as well.
+"""
+import json
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.template.base import Template
+from django.utils.text import slugify
+
+HEADER = 'X-Profile'
+PARAM = '_profile'
+SALT = 'azfi.profiling'
+
+# The profile of the request running in this context, if it is profiled
+active = ContextVar('azfi_profile', default=None)
+_installed = False
+
+
+def is_enabled():
+    return getattr(settings, 'PROFILING_ENABLED', False)
+
+
+def sample_rate():
+    return getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+
+
+def interval():
+    return getattr(settings, 'PROFILING_INTERVAL_MS', 2) / 1000
+
+
+def output_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def token_max_age():
+    return getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 60 * 60)
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def requested(request):
+    """Whether to profile ``request``: a valid token, or the luck of the sample rate."""
+    token = request.headers.get(HEADER) or request.GET.get(PARAM)
+    if token:
+        try:
+            signing.TimestampSigner(salt=SALT).unsign(token, max_age=token_max_age())
+        except signing.BadSignature:
+            return False
+        return True
+    return random.random() < sample_rate()
+
+
+def install():
+    """Time template rendering for profiled requests; the rest pay one context variable lookup."""
+    global _installed
+    if _installed:
+        return
+    render = Template._render
+
+    @wraps(render)
+    def timed_render(template, context):
+        profile = active.get()
+        if profile is None:
+            return render(template, context)
+        with profile.frame(template.name or '<string>'):
+            return render(template, context)
+
+    Template._render = timed_render
+    _installed = True
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+
+
+def fold(frame):
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class Sampler(threading.Thread):
+    """Count the stacks of ``thread_ids`` every ``interval`` seconds until stopped."""
+
+    def __init__(self, thread_ids, interval):
+        super().__init__(name='azfi-profiler', daemon=True)
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks = Counter()
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in self.thread_ids:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[fold(frame)] += 1
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+class Profile:
+    """
+    Timings of one request. Templates and queries are timed as frames on a
+    stack, so each one's own time excludes what ran inside it.
+    """
+
+    def __init__(self, request, thread_ids):
+        self.request = request
+        self.root = f"{request.method} {request.path}"
+        self.sampler = Sampler(thread_ids, interval())
+        # [label, started, time spent in children]
+        self.stack = []
+        self.folded = Counter()
+        self.templates = {}
+        self.queries = []
+        self.token = None
+
+    def start(self):
+        self.token = active.set(self)
+        self.sampler.start()
+        self.started = time.perf_counter()
+        self.stack.append([self.root, self.started, 0.0])
+
+    def stop(self):
+        self.close_frame()
+        self.sampler.stop()
+        active.reset(self.token)
+
+    def close_frame(self):
+        label, started, children = self.stack[-1]
+        elapsed = time.perf_counter() - started
+        self.folded[';'.join(entry[0] for entry in self.stack)] += elapsed - children
+        self.stack.pop()
+        if self.stack:
+            self.stack[-1][2] += elapsed
+        return elapsed, elapsed - children
+
+    @contextmanager
+    def frame(self, label):
+        self.stack.append([label, time.perf_counter(), 0.0])
+        try:
+            yield
+        finally:
+            elapsed, own = self.close_frame()
+            calls, total, own_total = self.templates.get(label, (0, 0.0, 0.0))
+            self.templates[label] = (calls + 1, total + elapsed, own_total + own)
+
+    def __call__(self, execute, sql, params, many, context):
+        template = self.stack[-1][0] if len(self.stack) > 1 else None
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            if self.stack:
+                self.stack[-1][2] += elapsed
+                path = ';'.join(entry[0] for entry in self.stack)
+                self.folded[f"{path};SQL {' '.join(sql.split())[:120].replace(';', ',')}"] += elapsed
+            self.queries.append({'alias': context['connection'].alias, 'sql': sql,
+                                 'ms': round(elapsed * 1000, 3), 'template': template})
+
+    def record_queries(self):
+        """Context manager installing the profile on every configured database."""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    def save(self, response):
+        """Write the profile's files and name them in the response's ``X-Profile`` header."""
+        total = sum(self.folded.values())
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        name = f"{stamp}-{self.request.method.lower()}-{slugify(self.request.path) or 'root'}-{secrets.token_hex(3)}"
+        directory = output_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+
+        (directory / f'{name}.cpu.folded').write_text(
+            ''.join(f'{stack} {count}\n' for stack, count in self.sampler.stacks.most_common()))
+        (directory / f'{name}.folded').write_text(
+            ''.join(f'{stack} {round(seconds * 1e6)}\n' for stack, seconds in self.folded.most_common()))
+        (directory / f'{name}.json').write_text(json.dumps({
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'status': response.status_code,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'total_ms': round(total * 1000, 3),
+            'sql_ms': round(sum(query['ms'] for query in self.queries), 3),
+            'samples': sum(self.sampler.stacks.values()),
+            'interval_ms': self.sampler.interval * 1000,
+            'templates': [
+                {'name': label, 'calls': calls, 'total_ms': round(spent * 1000, 3), 'self_ms': round(own * 1000, 3)}
+                for label, (calls, spent, own) in sorted(self.templates.items(), key=lambda item: -item[1][1])
+            ],
+            'queries': self.queries,
+        }, indent=2))
+        response[HEADER] = name
+        return response
+
+
+def recent(limit=20):
+    """Names of the latest profiles, newest first."""
+    found = sorted(output_dir().glob('*.json'), reverse=True) if output_dir().is_dir() else []
+    return [path.stem for path in found[:limit]]
@@ -0,0 +1,98 @@
+"""
+Query-plan checks for the pages, so a missing index fails a test instead of
+showing up as a slow page once the tables are large.
+
+``plans(client, routes)`` requests each route while recording its SQL (with
+``QueryRecorder``) and runs ``EXPLAIN QUERY PLAN`` on every statement.
+``full_scans()`` picks out the steps that read a whole table row by row.
+Scans of an index that covers the query are fine: they never touch the
+table, which is how the freshness aggregates and admin counts are meant to
+run. SQLite only; on other databases there is nothing to check.
+"""
+import re
+
+from django.apps import apps
+from django.db import connections
+from django.urls import reverse
+
+from .middleware import QueryRecorder
+
+# "SCAN azfi_contact" (SQLite 3.36+) or "SCAN TABLE azfi_contact" without "USING ... INDEX"
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+# Pages that show every row of a table, where reading all of it is the plan
+WHOLE_TABLE_PAGES = {
+    'treatment_list': {'azfi_treatment'},
+}
+
+
+def supported(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def model_tables():
+    return {model._meta.db_table for model in apps.get_models()}
+
+
+def explain(alias, sql, params):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan, tables=None):
+    """The tables that ``plan`` (a list of EXPLAIN QUERY PLAN steps) scans without an index."""
+    tables = model_tables() if tables is None else tables
+    scanned = []
+    for step in plan:
+        match = FULL_SCAN_RE.match(step)
+        if match and match.group(1) in tables:
+            scanned.append(match.group(1))
+    return scanned
+
+
+def plans(client, routes):
+    """
+    Return ``[(route name, sql, plan)]`` for every query the routes run.
+
+    ``routes`` are ``(name, method, url, data)`` tuples, as produced by
+    ``benchmark_views.routes()``.
+    """
+    found = []
+    for name, method, url, data in routes:
+        recorder = QueryRecorder()
+        with recorder.record():
+            getattr(client, method)(url, data or {})
+        for alias, sql, params, _duration in recorder.queries:
+            if supported(alias) and sql.lstrip().upper().startswith('SELECT'):
+                found.append((name, sql, explain(alias, sql, params)))
+    return found
+
+
+def problems(found):
+    """``[(route name, table, sql)]`` for the unexpected full scans in ``plans()`` output."""
+    tables = model_tables()
+    return [
+        (name, table, sql)
+        for name, sql, plan in found
+        for table in full_scans(plan, tables)
+        if table not in WHOLE_TABLE_PAGES.get(name, ())
+    ]
+
+
+def admin_routes():
+    """The contact and subscriber changelists as staff browse them: newest first, filtered and searched."""
+    url = reverse('admin:azfi_contact_changelist')
+    return [
+        ('admin_contacts', 'get', url, None),
+        ('admin_contacts_open', 'get', url, {'responded__exact': '0'}),
+        ('admin_contacts_month', 'get', url, {'month': '2026-01'}),
+        ('admin_contacts_search', 'get', url, {'q': 'Sam'}),
+        ('admin_subscribers', 'get', reverse('admin:azfi_subscriber_changelist'), {'q': 'a'}),
+    ]
+
+
+def analyze(using='default'):
+    """Collect table statistics so the planner chooses as it would on a long-lived database."""
+    with connections[using].cursor() as cursor:
+        cursor.execute('ANALYZE')
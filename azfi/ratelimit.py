@@ -0,0 +1,152 @@
+"""
+Token-bucket rate limiting for the public form endpoints.
+
+Each policy in ``RATE_LIMITS`` names a URL and allows ``rate`` requests per
+``period`` seconds, of which a client may spend ``burst`` at once. Every
+client IP and every submitted email address gets its own bucket in the
+cache (``RATE_LIMIT_CACHE_ALIAS``). Point that alias at Redis or Memcached
+so all worker processes share the buckets.
+
+A bucket is one number: the time its next token is due (the GCRA form of a
+token bucket). Each request moves that time ``period / rate`` later, and a
+request is refused when it would move more than ``burst`` intervals past
+now. Taking a token is a single ``incr``, so two processes can never spend
+the same token. A refused request hands its token back with ``decr``, along
+with the tokens it already took from its other buckets: a flood from one
+address spends none of its IP's allowance.
+
+``RateLimitMiddleware`` (azfi/middleware.py) runs the policies before CSRF
+checks, form validation and any database work, and answers refused requests
+with 429 and ``Retry-After``. Allowed and refused counts per policy are
+kept in the same cache and served at ``/ops/ratelimits/``.
+"""
+import hashlib
+import math
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .newsletter import normalize_email
+
+Policy = namedtuple('Policy', 'name rate period burst keys')
+
+KEY_PREFIX = 'ratelimit'
+OUTCOMES = ('allowed', 'limited')
+
+
+def is_enabled():
+    return getattr(settings, 'RATE_LIMIT_ENABLED', True)
+
+
+def get_cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE_ALIAS', 'default')]
+
+
+def policies():
+    """``{url name: Policy}`` from ``RATE_LIMITS``."""
+    return {
+        name: Policy(name, config['rate'], config.get('period', 60), config.get('burst', config['rate']),
+                     tuple(config.get('keys', ('ip',))))
+        for name, config in getattr(settings, 'RATE_LIMITS', {}).items()
+    }
+
+
+def client_ip(request):
+    # Behind a proxy, the header it sets; the last address is the one the proxy saw
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', 'REMOTE_ADDR')
+    return request.META.get(header, '').split(',')[-1].strip()
+
+
+def identities(request, policy):
+    """``(kind, digest)`` of each key the request is limited by; a missing email is skipped."""
+    for kind in policy.keys:
+        if kind == 'ip':
+            value = client_ip(request)
+        elif kind == 'email':
+            value = normalize_email(request.POST.get('email', ''))
+        else:
+            raise ValueError(f"Unknown rate limit key {kind!r}; use 'ip' or 'email'")
+        if value:
+            # Addresses never appear in cache keys, and the key is safe for Memcached
+            yield kind, hashlib.blake2b(value.encode(), digest_size=12).hexdigest()
+
+
+def interval_ms(policy):
+    return policy.period * 1000 // policy.rate
+
+
+def give_back(bucket, policy):
+    """Return a token taken from ``bucket``."""
+    try:
+        get_cache().decr(bucket, interval_ms(policy))
+    except ValueError:
+        # Expired, so full anyway
+        pass
+
+
+def take(bucket, policy, now=None):
+    """Spend a token from ``bucket``; return 0 when allowed, else the seconds until a token is due."""
+    store = get_cache()
+    now = int((time.time() if now is None else now) * 1000)
+    interval = interval_ms(policy)
+    # Long enough for a bucket spent by a burst to refill; a missing bucket is a full one
+    timeout = math.ceil(policy.burst * interval / 1000) + 1
+    if store.add(bucket, now + interval, timeout):
+        return 0
+    try:
+        due = store.incr(bucket, interval) - interval
+    except ValueError:
+        # Expired since add()
+        store.set(bucket, now + interval, timeout)
+        return 0
+    if due < now:
+        # Full again: count from now, not from when it was last used
+        store.set(bucket, now + interval, timeout)
+        return 0
+    wait = due - now - (policy.burst - 1) * interval
+    if wait > 0:
+        store.decr(bucket, interval)
+        # Keep the bucket for as long as the client keeps trying
+        store.touch(bucket, timeout)
+        return math.ceil(wait / 1000)
+    return 0
+
+
+def count(policy, outcome):
+    store = get_cache()
+    key = f'{KEY_PREFIX}:count:{policy.name}:{outcome}'
+    try:
+        store.incr(key)
+    except ValueError:
+        if not store.add(key, 1, None):
+            store.incr(key)
+
+
+def check(request, policy):
+    """Take a token from each of the request's buckets; return 0 or the ``Retry-After`` seconds."""
+    taken = []
+    for kind, digest in identities(request, policy):
+        bucket = f'{KEY_PREFIX}:{policy.name}:{kind}:{digest}'
+        wait = take(bucket, policy)
+        if wait:
+            # A refused request costs nothing, in any of its buckets
+            for earlier in taken:
+                give_back(earlier, policy)
+            count(policy, 'limited')
+            return wait
+        taken.append(bucket)
+    count(policy, 'allowed')
+    return 0
+
+
+def stats():
+    """Each policy's settings and its allowed and limited counts."""
+    found = policies()
+    counts = get_cache().get_many([f'{KEY_PREFIX}:count:{name}:{outcome}' for name in found for outcome in OUTCOMES])
+    return {
+        name: dict(policy._asdict(), keys=list(policy.keys),
+                   **{outcome: counts.get(f'{KEY_PREFIX}:count:{name}:{outcome}', 0) for outcome in OUTCOMES})
+        for name, policy in found.items()
+    }
@@ -0,0 +1,83 @@
+"""
+Read replicas for the public pages.
+
+Everything reads and writes the ``default`` (primary) database unless a
+request is being served by one of ``REPLICA_VIEWS``: then
+``ReplicaRoutingMiddleware`` (azfi/middleware.py) picks one of
+``DATABASE_REPLICAS`` for the request and ``PrimaryReplicaRouter`` sends its
+reads there. Writes, the admin, the queue worker and management commands
+always use the primary.
+
+Replicas lag behind the primary, so a visitor who just submitted a form
+would not see their own change. Every non-GET request therefore sets a short
+``REPLICA_STICKY_COOKIE`` and that browser reads from the primary until it
+expires.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+# Read-only pages that can be served from a replica, by URL name
+DEFAULT_REPLICA_VIEWS = (
+    'home', 'treatment_list', 'treatment_detail', 'about', 'gallery', 'gallery_images', 'testimonial_list',
+    'blog_list', 'blog_detail', 'blog_search', 'search',
+)
+
+_read_alias = ContextVar('azfi_read_alias', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def replica_views():
+    return getattr(settings, 'REPLICA_VIEWS', DEFAULT_REPLICA_VIEWS)
+
+
+def sticky_cookie():
+    return getattr(settings, 'REPLICA_STICKY_COOKIE', 'azfi_primary')
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+def choose_replica():
+    available = replicas()
+    return random.choice(available) if available else None
+
+
+def current_replica():
+    """The replica the current request reads from, or None when it reads the primary."""
+    return _read_alias.get()
+
+
+def use_replica(alias):
+    """Send this context's reads to ``alias``, or back to the primary with None."""
+    _read_alias.set(alias)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Follow relations from the database the object came from
+            return instance._state.db
+        return current_replica() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {PRIMARY, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, never migrated on their own
+        return db not in replicas()
@@ -0,0 +1,359 @@
+"""
+Full-text search over treatments, blog posts and treatment FAQs.
+
+Each searchable row is mirrored into a ``SearchDocument`` from model signals.
+On SQLite the documents are indexed by an FTS5 external-content table kept in
+sync by triggers (see migration 0002) and ranked with ``bm25()``. Other
+databases fall back to the ``SearchPosting`` inverted index with BM25 scoring
+done in Python. Both fold diacritics and Porter-stem every word (see
+azfi/porter.py), so they match the same documents for the same query.
+
+``search()`` returns a lazy sequence that Django's ``Paginator`` can slice and
+count, so both the page and the total come straight from the index.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter, namedtuple
+
+from django.db import connection, connections, router, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import BlogPost, SearchDocument, SearchPosting, Treatment, TreatmentFAQ
+from .porter import stem
+
+FTS_TABLE = 'azfi_searchdocument_fts'
+# Contact messages, for the admin (see migration 0013)
+CONTACT_FTS_TABLE = 'azfi_contact_fts'
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+SNIPPET_TOKENS = 16
+
+# Highlight markers that cannot appear in user content; swapped for <mark> after escaping
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+REBUILD_BATCH_SIZE = 1000
+
+SearchHit = namedtuple('SearchHit', 'kind object_id title snippet url rank')
+
+_fts5_enabled = None
+
+
+def fold(word):
+    """Lowercase ``word`` and strip its diacritics, like FTS5's ``unicode61 remove_diacritics 2``."""
+    decomposed = unicodedata.normalize('NFD', word.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return [fold(token) for token in TOKEN_RE.findall(text or '')]
+
+
+def matches(word, stems):
+    """Whether ``word`` matches a query: one of its stems, or a prefix of the last one."""
+    stemmed = stem(fold(word))
+    return stemmed in stems[:-1] or stemmed.startswith(stems[-1])
+
+
+def fts5_enabled():
+    """True when the FTS5 index table exists on the default connection."""
+    global _fts5_enabled
+    if _fts5_enabled is None:
+        _fts5_enabled = (connection.vendor == 'sqlite'
+                         and FTS_TABLE in connection.introspection.table_names())
+    return _fts5_enabled
+
+
+def _read_connection():
+    """The connection search queries read from, a replica while serving a public page."""
+    return connections[router.db_for_read(SearchDocument)]
+
+
+def _highlight(text):
+    """Escape an index snippet and turn its markers into ``<mark>`` tags."""
+    return mark_safe(escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+# Indexing ----------------------------------------------------------------
+
+def documents_for(instance):
+    """Return ``(kind, title, body, url)`` for an indexable model instance."""
+    if isinstance(instance, Treatment):
+        return ('treatment', instance.name,
+                f"{instance.description}\n{instance.what_to_expect}",
+                instance.get_absolute_url())
+    if isinstance(instance, BlogPost):
+        return ('post', instance.title,
+                f"{instance.excerpt}\n{instance.content}",
+                instance.get_absolute_url())
+    if isinstance(instance, TreatmentFAQ):
+        return ('faq', instance.question, instance.answer,
+                f"{instance.treatment.get_absolute_url()}#heading{instance.pk}")
+    raise TypeError(f"{type(instance).__name__} is not searchable")
+
+
+def build_document(instance):
+    """Return an unsaved ``SearchDocument`` for ``instance`` and its tokens."""
+    kind, title, body, url = documents_for(instance)
+    tokens = tokenize(f"{title}\n{body}")
+    document = SearchDocument(kind=kind, object_id=instance.pk, title=title[:255], body=body,
+                              url=url, length=len(tokens))
+    return document, tokens
+
+
+def postings_for(document, tokens):
+    return [
+        SearchPosting(term=term[:64], document=document, frequency=count)
+        for term, count in Counter(stem(token) for token in tokens).items()
+    ]
+
+
+def index_instance(instance):
+    built, tokens = build_document(instance)
+    document, _created = SearchDocument.objects.update_or_create(
+        kind=built.kind, object_id=built.object_id,
+        defaults={'title': built.title, 'body': built.body, 'url': built.url, 'length': built.length},
+    )
+    if not fts5_enabled():
+        SearchPosting.objects.filter(document=document).delete()
+        SearchPosting.objects.bulk_create(postings_for(document, tokens))
+    return document
+
+
+def remove_instance(instance):
+    kind = documents_for(instance)[0]
+    SearchDocument.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+
+def _index_batch(instances):
+    built = [build_document(instance) for instance in instances]
+    documents = SearchDocument.objects.bulk_create([document for document, _tokens in built])
+    if not fts5_enabled():
+        SearchPosting.objects.bulk_create(
+            [posting for document, (_d, tokens) in zip(documents, built)
+             for posting in postings_for(document, tokens)],
+            batch_size=REBUILD_BATCH_SIZE,
+        )
+    return len(documents)
+
+
+def rebuild():
+    """Re-index every searchable row from scratch and return the document count."""
+    count = 0
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        querysets = (Treatment.objects.all(), BlogPost.objects.all(),
+                     TreatmentFAQ.objects.select_related('treatment'))
+        for queryset in querysets:
+            batch = []
+            for instance in queryset.iterator(chunk_size=REBUILD_BATCH_SIZE):
+                batch.append(instance)
+                if len(batch) == REBUILD_BATCH_SIZE:
+                    count += _index_batch(batch)
+                    batch = []
+            if batch:
+                count += _index_batch(batch)
+        if fts5_enabled():
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def update_index(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    index_instance(instance)
+    if isinstance(instance, Treatment):
+        # FAQ documents link to the treatment page, keep their URLs in step with the slug
+        for faq in instance.faqs.all():
+            faq.treatment = instance
+            index_instance(faq)
+
+
+def remove_from_index(sender, instance, **kwargs):
+    remove_instance(instance)
+
+
+def connect_signals():
+    for model in (Treatment, BlogPost, TreatmentFAQ):
+        post_save.connect(update_index, sender=model, dispatch_uid=f'search_update_{model.__name__}')
+        post_delete.connect(remove_from_index, sender=model, dispatch_uid=f'search_remove_{model.__name__}')
+
+
+# Querying ----------------------------------------------------------------
+
+def fts5_query(terms):
+    """Build an FTS5 MATCH expression; the last term is a prefix for search-as-you-type."""
+    parts = [f'"{term}"' for term in terms]
+    parts[-1] += '*'
+    return ' '.join(parts)
+
+
+def contact_matches(query):
+    """Ids of the contacts whose message matches ``query``, as SQL for ``pk__in``; None without FTS5."""
+    terms = tokenize(query)
+    if not terms or not fts5_enabled():
+        return None
+    return RawSQL(f"SELECT rowid FROM {CONTACT_FTS_TABLE} WHERE {CONTACT_FTS_TABLE} MATCH %s", [fts5_query(terms)])
+
+
+class SearchResults:
+    """
+    Lazy, sliceable search result list.
+
+    ``count()`` and slicing each run one query against the index, which lets
+    ``django.core.paginator.Paginator`` page through results without loading
+    them all.
+    """
+
+    def __init__(self, query, kinds=None):
+        self.query = query
+        self.terms = tokenize(query)
+        # What the inverted index holds; FTS5 stems the query itself
+        self.stems = [stem(term) for term in self.terms]
+        self.kinds = tuple(kinds) if kinds else None
+        self._count = None
+
+    def __len__(self):
+        return self.count()
+
+    def count(self):
+        if self._count is None:
+            self._count = self._fetch_count() if self.terms else 0
+        return self._count
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if not self.terms or stop <= start:
+            return []
+        return self._fetch(start, stop - start)
+
+    def _kind_clause(self, column):
+        if not self.kinds:
+            return '', []
+        return f" AND {column} IN ({', '.join(['%s'] * len(self.kinds))})", list(self.kinds)
+
+    def _fetch_count(self):
+        if not fts5_enabled():
+            return len(self._posting_scores())
+        kind_sql, kind_params = self._kind_clause('d.kind')
+        with _read_connection().cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {FTS_TABLE} f "
+                f"JOIN azfi_searchdocument d ON d.id = f.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s{kind_sql}",
+                [fts5_query(self.terms)] + kind_params,
+            )
+            return cursor.fetchone()[0]
+
+    def _fetch(self, offset, limit):
+        if not fts5_enabled():
+            return self._fetch_postings(offset, limit)
+        kind_sql, kind_params = self._kind_clause('d.kind')
+        with _read_connection().cursor() as cursor:
+            cursor.execute(
+                f"SELECT d.kind, d.object_id, "
+                f"highlight({FTS_TABLE}, 0, %s, %s), "
+                f"snippet({FTS_TABLE}, 1, %s, %s, '…', {SNIPPET_TOKENS}), "
+                f"d.url, bm25({FTS_TABLE}, {TITLE_WEIGHT}, {BODY_WEIGHT}) AS rank "
+                f"FROM {FTS_TABLE} f JOIN azfi_searchdocument d ON d.id = f.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s{kind_sql} "
+                f"ORDER BY rank LIMIT %s OFFSET %s",
+                [MARK_START, MARK_END, MARK_START, MARK_END, fts5_query(self.terms)]
+                + kind_params + [limit, offset],
+            )
+            return [
+                SearchHit(kind, object_id, _highlight(title), _highlight(snippet), url, rank)
+                for kind, object_id, title, snippet, url, rank in cursor.fetchall()
+            ]
+
+    # Inverted index fallback ---------------------------------------------
+
+    def _posting_scores(self):
+        """Return ``{document_id: bm25 score}`` for documents matching every term."""
+        if hasattr(self, '_scores'):
+            return self._scores
+
+        documents = SearchDocument.objects.all()
+        if self.kinds:
+            documents = documents.filter(kind__in=self.kinds)
+        total = documents.count()
+        average_length = (sum(documents.values_list('length', flat=True)) / total) if total else 0
+
+        matches = None
+        per_term = []
+        for position, term in enumerate(self.stems):
+            postings = SearchPosting.objects.filter(document__in=documents)
+            if position == len(self.stems) - 1:
+                postings = postings.filter(term__startswith=term)
+            else:
+                postings = postings.filter(term=term)
+            frequencies = Counter()
+            for document_id, frequency in postings.values_list('document_id', 'frequency'):
+                frequencies[document_id] += frequency
+            per_term.append(frequencies)
+            matches = set(frequencies) if matches is None else matches & set(frequencies)
+
+        lengths = dict(documents.filter(pk__in=matches or ()).values_list('pk', 'length'))
+        k1, b = 1.2, 0.75
+        scores = {}
+        for document_id in matches or ():
+            score = 0.0
+            for frequencies in per_term:
+                idf = math.log(1 + (total - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+                tf = frequencies[document_id]
+                norm = 1 - b + b * lengths[document_id] / (average_length or 1)
+                score += idf * tf * (k1 + 1) / (tf + k1 * norm)
+            scores[document_id] = score
+        self._scores = scores
+        return scores
+
+    def _fetch_postings(self, offset, limit):
+        scores = self._posting_scores()
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], pk))[offset:offset + limit]
+        documents = SearchDocument.objects.in_bulk(ranked)
+        hits = []
+        for pk in ranked:
+            document = documents[pk]
+            hits.append(SearchHit(
+                document.kind, document.object_id,
+                _highlight(mark_terms(document.title, self.stems)),
+                _highlight(make_snippet(document.body, self.stems)),
+                document.url, -scores[pk],
+            ))
+        return hits
+
+
+def mark_terms(text, stems):
+    def mark(match):
+        word = match.group(0)
+        return f"{MARK_START}{word}{MARK_END}" if matches(word, stems) else word
+    return TOKEN_RE.sub(mark, text)
+
+
+def make_snippet(text, stems, size=SNIPPET_TOKENS):
+    """Return a window of ``size`` words around the first matching term."""
+    words = text.split()
+    start = 0
+    for index, word in enumerate(words):
+        if any(matches(token, stems) for token in TOKEN_RE.findall(word)):
+            start = max(0, index - size // 4)
+            break
+    window = ' '.join(words[start:start + size])
+    prefix = '…' if start else ''
+    suffix = '…' if start + size < len(words) else ''
+    return prefix + mark_terms(window, stems) + suffix
+
+
+def search(query, kinds=None):
+    """Return ranked ``SearchHit`` results for ``query`` as a lazy sequence."""
+    return SearchResults(query, kinds)
@@ -0,0 +1,76 @@
+"""
+Page shells: public pages that are the same for every visitor.
+
+Three parts of a page depend on who is asking: flash messages, the CSRF
+token in forms and the staff toolbar. Normally they are rendered in place,
+and the page cache (azfi/cache.py) steps aside for anyone with a session or
+messages cookie. With ``PAGE_SHELL_ENABLED`` the ``{% user_fragment %}`` and
+``{% shell_csrf_token %}`` tags (azfi/templatetags/page_shell.py) render
+empty placeholders instead. Each page is then a shell that the page cache
+serves to everyone, and that a reverse proxy may keep for
+``PAGE_SHELL_MAX_AGE`` seconds (``Cache-Control: public, s-maxage``).
+
+base.js fills the placeholders with one request to ``/fragments/``. That
+response is private and sets the cookies the fragments need: the CSRF
+cookie, and the emptied messages cookie once messages are shown. The
+fragments are not edge-side includes because a proxy drops cookies set by an
+included response, so messages would be shown again and forms would carry a
+token without its cookie.
+
+Pages rendered by azfi/prerender.py are always shells, whatever the setting:
+they are written to disk and served to everyone by the web server.
+"""
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+
+
+# Set in request.META by azfi/prerender.py
+PRERENDER_KEY = 'azfi.prerender'
+
+
+def is_enabled():
+    return getattr(settings, 'PAGE_SHELL_ENABLED', False)
+
+
+def is_prerender(request):
+    return request is not None and bool(request.META.get(PRERENDER_KEY))
+
+
+def is_shell(request):
+    """Whether the page for ``request`` leaves its per-visitor parts to /fragments/."""
+    return is_enabled() or is_prerender(request)
+
+
+def max_age():
+    return getattr(settings, 'PAGE_SHELL_MAX_AGE', 60 * 5)
+
+
+def messages(request):
+    return render_to_string('partials/messages.html', {'messages': get_messages(request)})
+
+
+def toolbar(request):
+    # Without a session there is no user to look up, and no session read to make the page private
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES or not request.user.is_staff:
+        return ''
+    return render_to_string('partials/staff_toolbar.html', {'user': request.user}, request=request)
+
+
+# Fragments a page can leave for /fragments/ to fill in: name -> HTML renderer
+FRAGMENTS = {
+    'messages': messages,
+    'toolbar': toolbar,
+}
+
+
+def render(request, name):
+    if name not in FRAGMENTS:
+        raise ValueError(f"Unknown fragment {name!r}; add it to shell.FRAGMENTS.")
+    return FRAGMENTS[name](request)
+
+
+def fragments(request):
+    """Everything a shell needs for this visitor: the CSRF token and each fragment's HTML."""
+    return dict({name: render(request, name) for name in FRAGMENTS}, csrf=get_token(request))
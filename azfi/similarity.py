@@ -0,0 +1,203 @@
+"""
+Related treatments by content similarity, precomputed into ``RelatedTreatment``.
+
+Each treatment's name, description, what to expect and FAQs become a TF-IDF
+vector (sublinear term frequency, smoothed IDF, L2-normalised) in a NumPy
+matrix, so cosine similarity is a matrix product. The ``TOP_K`` nearest
+neighbours of every treatment are stored, and the detail page reads them
+with one indexed join instead of computing anything per request.
+
+Saving or deleting a treatment or one of its FAQs queues the treatment (see
+azfi/spool.py). The queue worker re-vectorises the catalogue and scores the
+changed treatments against all others with one product. It then re-ranks
+only the lists the change can affect: the changed treatments' own, the
+lists that showed them, and the lists they now score high enough to enter.
+Other lists keep the IDF weights of their last computation until
+``manage.py build_related_treatments`` recomputes everything.
+"""
+import logging
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.utils.html import strip_tags
+
+from . import cache, freshness, prerender, spool
+from .models import RelatedTreatment, Treatment, TreatmentFAQ
+from .search import tokenize
+
+logger = logging.getLogger('azfi.similarity')
+
+CHANGE_TOPIC = 'related_treatments'
+TOP_K = 3
+# A word shared by two names says more than one shared by two FAQ answers
+NAME_WEIGHT = 3
+# Treatments ranked per matrix product
+BATCH_SIZE = 512
+# Scores are stored rounded, so recomputing an unchanged list compares equal
+PRECISION = 6
+
+# Saves that touch none of these leave the vectors as they were
+TEXT_FIELDS = {
+    Treatment: {'name', 'description', 'what_to_expect'},
+    TreatmentFAQ: {'treatment', 'question', 'answer'},
+}
+
+
+def corpus():
+    """``(ids, documents)``: every treatment's id and tokens, FAQs included."""
+    faqs = defaultdict(list)
+    for treatment_id, question, answer in TreatmentFAQ.objects.values_list(
+            'treatment_id', 'question', 'answer').iterator(chunk_size=2000):
+        faqs[treatment_id] += tokenize(question) + tokenize(strip_tags(answer))
+    ids, documents = [], []
+    for pk, name, description, what_to_expect in Treatment.objects.order_by('pk').values_list(
+            'pk', 'name', 'description', 'what_to_expect'):
+        ids.append(pk)
+        documents.append(tokenize(name) * NAME_WEIGHT + tokenize(strip_tags(description))
+                         + tokenize(strip_tags(what_to_expect)) + faqs[pk])
+    return ids, documents
+
+
+def vectorize(documents):
+    """
+    One L2-normalised TF-IDF row per document. Only terms found in two or
+    more documents get a column: the others count towards a row's norm but
+    cannot add to any dot product, and dropping them keeps the matrix small.
+    """
+    vocabulary = {}
+    rows, columns, counts = [], [], []
+    for row, tokens in enumerate(documents):
+        for term, count in Counter(tokens).items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+    n = len(documents)
+    rows, columns = np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)
+
+    df = np.bincount(columns, minlength=len(vocabulary))
+    idf = np.log((1 + n) / (1 + df)) + 1
+    weights = (1 + np.log(np.array(counts, dtype=np.float64))) * idf[columns]
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n))
+    norms[norms == 0] = 1
+
+    shared = np.flatnonzero(df > 1)
+    position = np.full(len(vocabulary), -1)
+    position[shared] = np.arange(len(shared))
+    keep = position[columns] >= 0
+    matrix = np.zeros((n, len(shared)), dtype=np.float32)
+    matrix[rows[keep], position[columns[keep]]] = weights[keep] / norms[rows[keep]]
+    return matrix
+
+
+def neighbours(matrix, rows, k=TOP_K):
+    """``{row: [(other row, score)]}``, best first, ties by row, leaving out unrelated rows."""
+    found = {}
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = np.asarray(rows[start:start + BATCH_SIZE], dtype=np.int64)
+        scores = matrix[batch] @ matrix.T
+        scores[np.arange(len(batch)), batch] = -1  # not its own neighbour
+        best = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        for i, row in enumerate(batch):
+            found[int(row)] = [(int(other), round(float(scores[i, other]), PRECISION))
+                               for other in best[i] if scores[i, other] > 0]
+    return found
+
+
+def stored_lists():
+    lists = defaultdict(list)
+    for treatment_id, related_id, score in RelatedTreatment.objects.order_by(
+            'treatment_id', 'rank').values_list('treatment_id', 'related_id', 'score'):
+        lists[treatment_id].append((related_id, score))
+    return lists
+
+
+def refresh(changed=None, shown_on=()):
+    """
+    Recompute the related treatments that changes to the ``changed``
+    treatment ids can affect, or every list when ``changed`` is None.
+    ``shown_on`` adds lists that showed since deleted treatments. Return the
+    ids whose stored list changed.
+    """
+    ids, documents = corpus()
+    matrix = vectorize(documents)
+    position = {pk: row for row, pk in enumerate(ids)}
+    stored = stored_lists()
+
+    if changed is None:
+        affected = set(ids)
+    else:
+        changed = set(changed)
+        affected = {pk for pk in changed if pk in position} | set(shown_on)
+        affected |= {pk for pk, items in stored.items() if any(related in changed for related, _score in items)}
+        present = [position[pk] for pk in changed if pk in position]
+        if present:
+            # A list can only gain a changed treatment that outscores its last entry
+            best = (matrix @ matrix[present].T).max(axis=1)
+            floors = np.array([stored[pk][-1][1] if len(stored[pk]) >= TOP_K else 0 for pk in ids])
+            affected |= {ids[row] for row in np.flatnonzero(best > floors)}
+    rows = [position[pk] for pk in sorted(affected) if pk in position]
+    lists = {ids[row]: [(ids[other], score) for other, score in found]
+             for row, found in neighbours(matrix, rows).items()}
+
+    dirty = [pk for pk, items in lists.items() if items != stored.get(pk, [])]
+    with transaction.atomic():
+        RelatedTreatment.objects.filter(treatment_id__in=dirty).delete()
+        RelatedTreatment.objects.bulk_create([
+            RelatedTreatment(treatment_id=pk, related_id=related, rank=rank, score=score)
+            for pk in dirty for rank, (related, score) in enumerate(lists[pk])
+        ], batch_size=1000)
+    return dirty
+
+
+def publish(dirty, changed=()):
+    """Expire the pages of the ``dirty`` lists and those showing a ``changed`` treatment."""
+    pages = set(dirty)
+    if changed:
+        pages.update(RelatedTreatment.objects.filter(related_id__in=changed).values_list('treatment_id', flat=True))
+    if dirty:
+        freshness.touch_treatments(dirty)
+        cache.invalidate(RelatedTreatment)
+    if pages:
+        prerender.enqueue_change(RelatedTreatment, treatment_id=sorted(pages))
+
+
+def rebuild():
+    """Recompute every treatment's related list; return the number of lists that changed."""
+    dirty = refresh()
+    publish(dirty)
+    return len(dirty)
+
+
+def queue_refresh(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & TEXT_FIELDS[sender]:
+        return
+    spool.enqueue(CHANGE_TOPIC, {'treatment': instance.pk if sender is Treatment else instance.treatment_id})
+
+
+def queue_deleted(sender, instance, **kwargs):
+    # The list rows that showed it are cascade-deleted with it, so record them now
+    spool.enqueue(CHANGE_TOPIC, {
+        'treatment': instance.pk,
+        'shown_on': list(RelatedTreatment.objects.filter(related=instance).values_list('treatment_id', flat=True)),
+    })
+
+
+def apply_changes(jobs):
+    changed = {job.payload['treatment'] for job in jobs}
+    shown_on = {pk for job in jobs for pk in job.payload.get('shown_on', ())}
+    dirty = refresh(changed, shown_on)
+    publish(dirty, changed)
+    logger.info("Refreshed related treatments of %d treatment(s)", len(dirty))
+
+
+def connect_signals():
+    post_save.connect(queue_refresh, sender=Treatment, dispatch_uid='similarity_treatment_save')
+    pre_delete.connect(queue_deleted, sender=Treatment, dispatch_uid='similarity_treatment_delete')
+    post_save.connect(queue_refresh, sender=TreatmentFAQ, dispatch_uid='similarity_faq_save')
+    post_delete.connect(queue_refresh, sender=TreatmentFAQ, dispatch_uid='similarity_faq_delete')
+
+
+def register_topics():
+    spool.register(CHANGE_TOPIC, apply_changes, batch_size=500)
@@ -0,0 +1,305 @@
+"""
+Durable write-behind queue stored in a separate SQLite database in WAL mode.
+
+Request handlers ``enqueue()`` a small JSON payload under a topic and return
+immediately; the append is one short transaction on a file nobody else
+writes to, so it never waits on the main database's write lock. A worker
+(``manage.py run_queue_worker``) claims jobs in batches, hands them to the
+handler registered for their topic and deletes them once handled.
+
+Failed jobs are retried with exponential backoff and moved to the dead
+letters after ``SPOOL_MAX_ATTEMPTS``. A claimed job carries a lease, so a
+worker that dies mid-batch only delays its jobs until the lease expires.
+Handlers therefore see each job at least once and must be idempotent.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger('azfi.spool')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_until REAL,
+    last_error TEXT,
+    dead_at REAL
+);
+CREATE INDEX IF NOT EXISTS job_ready ON job (topic, dead_at, available_at);
+CREATE TABLE IF NOT EXISTS flush (
+    topic TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    last_at REAL,
+    last_batch INTEGER,
+    last_latency REAL,
+    last_duration REAL
+);
+"""
+
+Job = namedtuple('Job', 'id topic payload enqueued_at attempts')
+Handler = namedtuple('Handler', 'func batch_size')
+
+_handlers = {}
+
+
+def register(topic, func, batch_size=100):
+    """Process ``topic`` jobs with ``func(jobs)``, which raises to fail the batch."""
+    _handlers[topic] = Handler(func, batch_size)
+
+
+def handlers():
+    return dict(_handlers)
+
+
+class Spool:
+
+    def __init__(self, path, max_attempts=8, retry_delay=5.0, lease=60.0):
+        self.path = str(path)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f'<Spool {self.path}>'
+
+    @property
+    def db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit; transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # FULL: a job acknowledged to a visitor survives a power cut
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def enqueue(self, topic, payload, delay=0):
+        now = time.time()
+        cursor = self.db.execute(
+            'INSERT INTO job (topic, payload, enqueued_at, available_at) VALUES (?, ?, ?, ?)',
+            (topic, json.dumps(payload, default=str), now, now + delay),
+        )
+        return cursor.lastrowid
+
+    def enqueue_many(self, topic, payloads):
+        now = time.time()
+        db = self.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany(
+                'INSERT INTO job (topic, payload, enqueued_at, available_at) VALUES (?, ?, ?, ?)',
+                [(topic, json.dumps(payload, default=str), now, now) for payload in payloads],
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def claim(self, topic, limit):
+        """Lease up to ``limit`` ready jobs of ``topic``, oldest first."""
+        now = time.time()
+        db = self.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = db.execute(
+                'SELECT id, topic, payload, enqueued_at, attempts FROM job '
+                'WHERE topic = ? AND dead_at IS NULL AND available_at <= ? '
+                'AND (claimed_until IS NULL OR claimed_until < ?) ORDER BY id LIMIT ?',
+                (topic, now, now, limit),
+            ).fetchall()
+            db.executemany('UPDATE job SET claimed_until = ? WHERE id = ?',
+                           [(now + self.lease, row[0]) for row in rows])
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return [Job(id, topic, json.loads(payload), enqueued_at, attempts)
+                for id, topic, payload, enqueued_at, attempts in rows]
+
+    def ack(self, jobs, duration=0.0):
+        """Delete handled jobs and record the flush."""
+        if not jobs:
+            return
+        now = time.time()
+        db = self.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany('DELETE FROM job WHERE id = ?', [(job.id,) for job in jobs])
+            for topic in {job.topic for job in jobs}:
+                batch = [job for job in jobs if job.topic == topic]
+                latency = max(now - job.enqueued_at for job in batch)
+                db.execute(
+                    'INSERT INTO flush (topic, total, last_at, last_batch, last_latency, last_duration) '
+                    'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (topic) DO UPDATE SET '
+                    'total = total + excluded.total, last_at = excluded.last_at, '
+                    'last_batch = excluded.last_batch, last_latency = excluded.last_latency, '
+                    'last_duration = excluded.last_duration',
+                    (topic, len(batch), now, len(batch), latency, duration),
+                )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def fail(self, job, error):
+        """Schedule a retry with exponential backoff, or dead-letter the job."""
+        attempts = job.attempts + 1
+        now = time.time()
+        if attempts >= self.max_attempts:
+            self.db.execute(
+                'UPDATE job SET attempts = ?, last_error = ?, claimed_until = NULL, dead_at = ? WHERE id = ?',
+                (attempts, error, now, job.id),
+            )
+            logger.error("Job %s (%s) dead after %d attempts: %s", job.id, job.topic, attempts, error)
+            return False
+        delay = min(self.retry_delay * 2 ** (attempts - 1), 3600)
+        self.db.execute(
+            'UPDATE job SET attempts = ?, last_error = ?, claimed_until = NULL, available_at = ? WHERE id = ?',
+            (attempts, error, now + delay, job.id),
+        )
+        logger.warning("Job %s (%s) failed, retry %d in %.0fs: %s",
+                       job.id, job.topic, attempts, delay, error)
+        return True
+
+    def dead_letters(self, topic=None, limit=100):
+        query = 'SELECT id, topic, payload, attempts, last_error, dead_at FROM job WHERE dead_at IS NOT NULL'
+        params = []
+        if topic:
+            query += ' AND topic = ?'
+            params.append(topic)
+        query += ' ORDER BY id LIMIT ?'
+        return self.db.execute(query, params + [limit]).fetchall()
+
+    def requeue_dead(self, topic=None):
+        """Give dead letters a fresh set of attempts; return how many."""
+        query = ('UPDATE job SET dead_at = NULL, attempts = 0, available_at = ?, claimed_until = NULL '
+                 'WHERE dead_at IS NOT NULL')
+        params = [time.time()]
+        if topic:
+            query += ' AND topic = ?'
+            params.append(topic)
+        return self.db.execute(query, params).rowcount
+
+    def stats(self):
+        """Backlog and flush figures per topic."""
+        now = time.time()
+        topics = {}
+        for topic, ready, delayed, claimed, dead, oldest in self.db.execute(
+            'SELECT topic, '
+            'SUM(CASE WHEN dead_at IS NULL AND available_at <= ? '
+            '    AND (claimed_until IS NULL OR claimed_until < ?) THEN 1 ELSE 0 END), '
+            'SUM(CASE WHEN dead_at IS NULL AND available_at > ? THEN 1 ELSE 0 END), '
+            'SUM(CASE WHEN dead_at IS NULL AND claimed_until >= ? THEN 1 ELSE 0 END), '
+            'SUM(CASE WHEN dead_at IS NOT NULL THEN 1 ELSE 0 END), '
+            'MIN(CASE WHEN dead_at IS NULL THEN enqueued_at END) '
+            'FROM job GROUP BY topic',
+            (now, now, now, now),
+        ):
+            topics[topic] = {
+                'depth': ready + delayed + claimed,
+                'ready': ready,
+                'retrying': delayed,
+                'in_flight': claimed,
+                'dead': dead,
+                'oldest_age_s': round(now - oldest, 3) if oldest else None,
+            }
+        for topic, total, last_at, last_batch, last_latency, last_duration in self.db.execute(
+                'SELECT topic, total, last_at, last_batch, last_latency, last_duration FROM flush'):
+            entry = topics.setdefault(topic, {'depth': 0, 'ready': 0, 'retrying': 0, 'in_flight': 0,
+                                              'dead': 0, 'oldest_age_s': None})
+            entry.update({
+                'flushed': total,
+                'last_flush_age_s': round(now - last_at, 3),
+                'last_batch': last_batch,
+                'last_latency_ms': round(last_latency * 1000, 1),
+                'last_flush_ms': round(last_duration * 1000, 1),
+            })
+        return topics
+
+
+_spools = {}
+_spools_lock = threading.Lock()
+
+
+def get_spool():
+    path = str(getattr(settings, 'SPOOL_PATH', settings.BASE_DIR / 'spool.sqlite3'))
+    with _spools_lock:
+        if path not in _spools:
+            _spools[path] = Spool(
+                path,
+                max_attempts=getattr(settings, 'SPOOL_MAX_ATTEMPTS', 8),
+                retry_delay=getattr(settings, 'SPOOL_RETRY_DELAY', 5.0),
+                lease=getattr(settings, 'SPOOL_LEASE', 60.0),
+            )
+        return _spools[path]
+
+
+def enqueue(topic, payload, delay=0):
+    return get_spool().enqueue(topic, payload, delay)
+
+
+def process(spool, topic, handler):
+    """Claim one batch of ``topic`` and run it; return ``(claimed, handled)``."""
+    jobs = spool.claim(topic, handler.batch_size)
+    if not jobs:
+        return 0, 0
+    started = time.perf_counter()
+    try:
+        handler.func(jobs)
+        done = jobs
+    except Exception as exc:
+        if len(jobs) == 1:
+            logger.exception("Job %s (%s) failed", jobs[0].id, topic)
+            spool.fail(jobs[0], describe(exc))
+            return 1, 0
+        # Retry one job at a time so a single bad payload cannot hold back the batch
+        done = []
+        for job in jobs:
+            try:
+                handler.func([job])
+            except Exception as exc:
+                logger.exception("Job %s (%s) failed", job.id, topic)
+                spool.fail(job, describe(exc))
+            else:
+                done.append(job)
+    spool.ack(done, time.perf_counter() - started)
+    return len(jobs), len(done)
+
+
+def describe(exc):
+    return f'{type(exc).__name__}: {exc}'[:2000]
+
+
+def drain(spool=None, topics=None):
+    """Run every ready job of every registered topic; return how many succeeded."""
+    spool = spool or get_spool()
+    total = 0
+    for topic, handler in handlers().items():
+        if topics and topic not in topics:
+            continue
+        while True:
+            claimed, handled = process(spool, topic, handler)
+            total += handled
+            if not claimed:
+                break
+    return total
@@ -0,0 +1,70 @@
+"""
+``collectstatic`` storage that builds the asset bundles (see azfi/assets.py).
+
+Bundles are written into ``STATIC_ROOT`` before the manifest storage hashes
+everything, so they get fingerprinted names and their ``url()`` references
+are rewritten like any other stylesheet. Every hashed text file then gets
+``.gz``/``.br`` siblings. Serve ``STATIC_URL`` with
+``Cache-Control: public, max-age=31536000, immutable``: a changed file always
+gets a new name.
+"""
+import logging
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+from . import assets
+
+logger = logging.getLogger('azfi.assets')
+
+
+class BundledStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def _replace(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        self.save(name, ContentFile(content))
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            # A stylesheet points at an image that is not in the project; keep the
+            # reference as written instead of failing the whole build
+            logger.warning("Static file %r referenced from a stylesheet does not exist", name)
+            return name
+
+    def build_bundles(self, paths):
+        def read(path):
+            with self.open(path) as fh:
+                return fh.read().decode()
+
+        for name in assets.bundles():
+            path = assets.bundle_path(name)
+            self._replace(path, assets.build_bundle(name, read).encode())
+            paths[path] = (self, path)
+
+    def compress(self, names):
+        if assets.brotli is None:
+            logger.warning("The brotli package is not installed, so no .br files were written; "
+                           "run pip install -r requirements.txt and collectstatic again")
+        for name in names:
+            if not assets.compressible(name) or not self.exists(name):
+                continue
+            with self.open(name) as fh:
+                content = fh.read()
+            if len(content) < assets.MIN_COMPRESS_SIZE:
+                continue
+            for suffix, compressed in assets.precompress(content).items():
+                self._replace(name + suffix, compressed)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+        paths = dict(paths)
+        self.build_bundles(paths)
+        yield from super().post_process(paths, dry_run, **options)
+        self.compress(set(self.hashed_files.values()))
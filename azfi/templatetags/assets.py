@@ -0,0 +1,37 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import PrefixNode
+from django.utils.html import format_html_join
+
+from azfi import assets
+
+register = template.Library()
+
+
+def bundle_urls(name):
+    """URLs to load bundle ``name``: the hashed bundle once built, else its sources."""
+    if name not in assets.bundles():
+        raise template.TemplateSyntaxError(f"Unknown asset bundle {name!r}; add it to ASSET_BUNDLES.")
+    if not settings.DEBUG:
+        try:
+            return [staticfiles_storage.url(assets.bundle_path(name))]
+        except ValueError:
+            # collectstatic has not run (tests, a fresh checkout)
+            pass
+    prefix = PrefixNode.handle_simple('STATIC_URL')
+    return [prefix + path for path in assets.bundles()[name]]
+
+
+@register.simple_tag
+def bundle(name):
+    """
+    Render the ``<link>`` or ``<script>`` tags for the asset bundle ``name``.
+
+    In production this is one fingerprinted, minified file; with ``DEBUG`` on
+    the source files are included one by one so edits show up immediately.
+    """
+    urls = bundle_urls(name)
+    if name.endswith('.css'):
+        return format_html_join('\n', '<link rel="stylesheet" href="{}">', ((url,) for url in urls))
+    return format_html_join('\n', '<script src="{}"></script>', ((url,) for url in urls))
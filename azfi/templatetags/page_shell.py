@@ -0,0 +1,27 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import format_html
+
+from azfi import shell
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def user_fragment(context, name):
+    """
+    Render the per-visitor fragment ``name`` (see ``shell.FRAGMENTS``) in
+    place, or in shell mode an empty element that base.js fills in.
+    """
+    if shell.is_shell(context.get('request')):
+        return format_html('<div data-fragment="{}" data-src="{}"></div>', name, reverse('user_fragments'))
+    return shell.render(context['request'], name)
+
+
+@register.simple_tag(takes_context=True)
+def shell_csrf_token(context):
+    """``{% csrf_token %}``, or in shell mode a hidden input without a value that base.js fills in."""
+    if shell.is_shell(context.get('request')):
+        return format_html('<input type="hidden" name="csrfmiddlewaretoken" data-fragment="csrf" data-src="{}">',
+                           reverse('user_fragments'))
+    return format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', context['csrf_token'])
@@ -0,0 +1,57 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from azfi import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes='100vw', css_class='', loading='lazy'):
+    """
+    Render a ``<picture>`` with WebP and JPEG ``srcset`` candidates for ``image``.
+
+    Falls back to a plain ``<img>`` of the original upload until the
+    derivatives have been generated.
+    """
+    if not image:
+        return ''
+    name = image.name
+    manifest = images.load_manifest(name)
+    if manifest is None:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="{}">',
+                           image.url, alt, css_class, loading)
+
+    largest = manifest['widths'][-1]
+    height = round(manifest['height'] * largest / manifest['width'])
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="{}" decoding="async" style="background: url({}) center / cover no-repeat;">'
+        '</picture>',
+        images.srcset(name, manifest, 'webp'), sizes,
+        default_storage.url(images.derivative_name(name, largest, 'jpg')),
+        images.srcset(name, manifest, 'jpg'), sizes, largest, height, alt, css_class,
+        loading, manifest['placeholder'],
+    )
+
+
+@register.simple_tag
+def image_url(image, width, fmt='jpg'):
+    """Return the smallest derivative at least ``width`` pixels wide, or the original."""
+    return images.url_for_width(image, width, fmt)
+
+
+@register.simple_tag
+def image_set(image, width=1280):
+    """Return a CSS ``image-set()`` value for background images."""
+    if not image:
+        return ''
+    if images.load_manifest(image.name) is None:
+        return format_html('url("{}")', image.url)
+    return format_html(
+        'image-set(url("{}") type("image/webp"), url("{}") type("image/jpeg"))',
+        image_url(image, width, 'webp'), image_url(image, width, 'jpg'),
+    )
@@ -1,3 +1,1753 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection
+from django.http import Http404
+from django.template import Context, Template
+from django.test import (
+    AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+
+from . import (
+    assets, booking, cache, content, datagen, exports, images, minhash, newsletter, prerender, profiling, queryplan, ratelimit,
+    routers, search, similarity, spool, views,
+)
+from .management.commands.benchmark_views import routes
+from .middleware import QueryRecorder
+from .storage import BundledStaticFilesStorage
+from .models import (
+    Treatment, TreatmentFAQ, BeforeAfterImage,
+    TeamMember, Testimonial, BlogPost, Contact, Subscriber, RelatedTreatment, RelatedPost, WorkingHours, Booking,
+    BookingSlot, SearchPosting,
+)
+
+# The admin's static files have no manifest entries until collectstatic runs
+PLAIN_STATIC_STORAGES = dict(
+    settings.STORAGES, staticfiles={'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'})
+
+
+def create_test_content(treatments_per_category=3, posts=8):
+    """
+    Seed enough related rows for N+1 patterns to show up in query counts:
+    several treatments per category, each with FAQs, before/after images and
+    testimonials, plus team members and posts from more than one author.
+    """
+    authors = [
+        User.objects.create_user('sophia', first_name='Sophia', last_name='Williams'),
+        User.objects.create_user('emma', first_name='Emma', last_name='Johnson'),
+    ]
+
+    treatments = []
+    for category, label in Treatment.CATEGORY_CHOICES:
+        for i in range(treatments_per_category):
+            treatment = Treatment.objects.create(
+                name=f"{label} Treatment {i}",
+                slug=f"{category.lower()}-treatment-{i}",
+                description=f"A relaxing {label.lower()} treatment with visible results and no downtime.",
+                what_to_expect="Expect a consultation followed by a gentle, comfortable session.",
+                price_range='$150 - $300',
+                duration='45 minutes',
+                image='treatments/placeholder.jpg',
+                category=category,
+                featured=i == 0,
+            )
+            treatments.append(treatment)
+            for order in range(3):
+                TreatmentFAQ.objects.create(
+                    treatment=treatment,
+                    question=f"Question {order} about {treatment.name}?",
+                    answer="Most clients need three sessions spaced four weeks apart.",
+                    order=order,
+                )
+            for n in range(2):
+                BeforeAfterImage.objects.create(
+                    treatment=treatment,
+                    title=f"Case {n}",
+                    before_image='before_after/before/placeholder.jpg',
+                    after_image='before_after/after/placeholder.jpg',
+                )
+            for n in range(2):
+                Testimonial.objects.create(
+                    name=f"Client {n}",
+                    treatment=treatment,
+                    quote="The results look completely natural.",
+                    featured=True,
+                )
+
+    for order in range(4):
+        TeamMember.objects.create(
+            name=f"Practitioner {order}",
+            role='Aesthetician',
+            bio="Specialises in advanced facial treatments.",
+            image='team/placeholder.jpg',
+            order=order,
+        )
+
+    for i in range(posts):
+        BlogPost.objects.create(
+            title=f"Skin Care Article {i}",
+            slug=f"skin-care-article-{i}",
+            author=authors[i % len(authors)],
+            content="**Collagen**\n\nCollagen keeps skin firm and elastic as we age.",
+            excerpt="How collagen stimulating treatments work.",
+            featured_image='blog/placeholder.jpg',
+        )
+
+    return treatments
+
+
+class FullBucketsMixin:
+    """Start each test with full rate limit buckets; the test client always posts from one address."""
+
+    def setUp(self):
+        super().setUp()
+        ratelimit.get_cache().clear()
+
+
+class TemporarySpoolMixin:
+    """Point the write-behind queue at a throwaway database for each test."""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = self.settings(SPOOL_PATH=Path(tmp.name) / 'spool.sqlite3')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.spool = spool.get_spool()
+        self.addCleanup(self.spool.close)
+        # The subscriber pre-check would otherwise remember addresses from rolled back tests
+        newsletter.seen.reset()
+        self.addCleanup(newsletter.seen.reset)
+
+
+@override_settings(PAGE_CACHE_ENABLED=False, QUERY_INSTRUMENTATION=False)
+class QueryBudgetTests(FullBucketsMixin, TemporarySpoolMixin, TestCase):
+    """
+    Every URL in azfi/urls.py renders within a fixed number of queries.
+
+    A failing budget usually means a template started dereferencing a
+    relation per row; fix it with select_related/prefetch_related rather than
+    raising the number. The treatment, gallery and blog pages include the
+    freshness aggregate that validates conditional GETs (azfi/freshness.py).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_content()
+
+    def assertQueryBudget(self, budget, url, data=None, method='get', status=200):
+        with self.assertNumQueries(budget):
+            response = getattr(self.client, method)(url, data or {})
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_home(self):
+        self.assertQueryBudget(4, reverse('home'))
+
+    def test_treatment_list(self):
+        self.assertQueryBudget(2, reverse('treatment_list'))
+        self.assertQueryBudget(2, reverse('treatment_list'), {'category': 'FACE'})
+
+    def test_treatment_detail(self):
+        self.assertQueryBudget(6, reverse('treatment_detail', args=['face-treatment-0']))
+
+    def test_treatment_detail_missing(self):
+        self.assertQueryBudget(2, reverse('treatment_detail', args=['missing']), status=404)
+
+    def test_about(self):
+        self.assertQueryBudget(1, reverse('about'))
+
+    def test_gallery(self):
+        self.assertQueryBudget(2, reverse('gallery'))
+        self.assertQueryBudget(2, reverse('gallery'), {'category': 'BODY'})
+
+    def test_gallery_images(self):
+        # Treatments come in the same query as their cases, and later pages cost the same
+        response = self.assertQueryBudget(2, reverse('gallery_images'))
+        self.assertQueryBudget(2, response.json()['next_url'])
+
+    def test_testimonials(self):
+        self.assertQueryBudget(1, reverse('testimonial_list'))
+
+    def test_blog_list(self):
+        # Cursor pagination: no COUNT(*), and later pages cost the same as the first
+        response = self.assertQueryBudget(2, reverse('blog_list'))
+        self.assertQueryBudget(2, response.context['page_obj'].next_url)
+
+    def test_blog_detail(self):
+        # Related posts are one join against the precomputed list (azfi/minhash.py)
+        self.assertQueryBudget(6, reverse('blog_detail', args=['skin-care-article-3']))
+
+    def test_blog_search(self):
+        self.assertQueryBudget(1, reverse('blog_search'))
+        self.assertQueryBudget(3, reverse('blog_search'), {'q': 'collagen'})
+
+    def test_search(self):
+        self.assertQueryBudget(0, reverse('search'))
+        self.assertQueryBudget(2, reverse('search'), {'q': 'treatment'})
+
+    def test_contact(self):
+        self.assertQueryBudget(0, reverse('contact'))
+
+    def test_contact_submit(self):
+        data = {
+            'first_name': 'Jane', 'last_name': 'Doe', 'email': 'jane@example.com',
+            'phone': '555 0100', 'subject': 'HydraFacial', 'message': 'Is Saturday possible?',
+            'booking': 'on',
+        }
+        # The submission is spooled, not written to the main database
+        self.assertQueryBudget(0, reverse('contact'), data, method='post', status=302)
+        self.assertFalse(Contact.objects.exists())
+
+        self.assertEqual(spool.drain(self.spool), 2)  # the contact, then its notification
+        contact = Contact.objects.get()
+        self.assertEqual(contact.name, 'Jane Doe')
+        self.assertIn('Booking request', contact.message)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].reply_to, ['jane@example.com'])
+
+    def test_contact_success(self):
+        self.assertQueryBudget(0, reverse('contact_success'))
+
+    def test_booking(self):
+        member = TeamMember.objects.first()
+        member.treatments.add(Treatment.objects.get(slug='face-treatment-0'))
+        WorkingHours.objects.bulk_create([WorkingHours(member=member, weekday=day, start=time(9), end=time(17))
+                                          for day in range(7)])
+        # Treatments, the chosen one, its practitioners, their hours and their booked time
+        self.assertQueryBudget(5, reverse('booking'), {'treatment': 'face-treatment-0'})
+        self.assertQueryBudget(3, reverse('booking_slots'), {'treatment': 'face-treatment-0'})
+
+    def test_user_fragments(self):
+        self.assertQueryBudget(0, reverse('user_fragments'))
+
+    def test_newsletter_signup(self):
+        newsletter.seen.warm()
+        self.assertQueryBudget(0, reverse('newsletter_signup'), {'email': 'jane@example.com'},
+                               method='post', status=302)
+
+
+@override_settings(PAGE_CACHE_ENABLED=False, QUERY_INSTRUMENTATION=True)
+class QueryCountMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_content(treatments_per_category=1, posts=2)
+
+    def test_reports_query_headers(self):
+        response = self.client.get(reverse('treatment_detail', args=['face-treatment-0']))
+        self.assertEqual(response['X-Query-Count'], '6')
+        self.assertEqual(response['X-Query-Duplicates'], '0')
+        self.assertGreaterEqual(float(response['X-Query-Time']), 0)
+
+    def test_logs_each_request(self):
+        with self.assertLogs('azfi.queries', level='INFO') as logs:
+            self.client.get(reverse('about'))
+        self.assertIn('GET /about/ queries=1', logs.output[0])
+
+
+class SpoolTests(TemporarySpoolMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.spool.retry_delay = 0
+        self.spool.max_attempts = 2
+        self.handled = []
+        registered = spool.handlers()
+        self.addCleanup(lambda: spool._handlers.clear() or spool._handlers.update(registered))
+        spool.register('test', self.handle, batch_size=10)
+
+    def handle(self, jobs):
+        if any(job.payload.get('poison') for job in jobs):
+            raise ValueError('bad payload')
+        self.handled.extend(job.payload['n'] for job in jobs)
+
+    def test_batch_is_isolated_from_poison_job(self):
+        for n in range(5):
+            self.spool.enqueue('test', {'n': n, 'poison': n == 2})
+        self.assertEqual(spool.drain(self.spool, ['test']), 4)
+        self.assertEqual(self.handled, [0, 1, 3, 4])
+        # With no retry delay the poison job uses up its attempts within the same drain
+        stats = self.spool.stats()['test']
+        self.assertEqual((stats['depth'], stats['dead'], stats['flushed']), (0, 1, 4))
+
+    def test_failed_job_is_retried_then_dead_lettered(self):
+        self.spool.enqueue('test', {'n': 1, 'poison': True})
+        spool.drain(self.spool, ['test'])
+        self.assertEqual(self.spool.stats()['test']['dead'], 1)
+        [(_id, topic, _payload, attempts, error, _dead_at)] = self.spool.dead_letters()
+        self.assertEqual((topic, attempts, error), ('test', 2, 'ValueError: bad payload'))
+
+        self.assertEqual(self.spool.requeue_dead(), 1)
+        self.assertEqual(self.spool.stats()['test']['ready'], 1)
+
+    def test_replayed_contact_is_stored_once(self):
+        from .intake import CONTACT_TOPIC
+
+        payload = {'name': 'Jane Doe', 'email': 'jane@example.com', 'phone': '555', 'message': 'Hi',
+                   'intake_id': '0f8fad5b-d9cb-469f-a165-70867728950e',
+                   'submitted_at': '2024-05-01T09:30:00+00:00'}
+        self.spool.enqueue(CONTACT_TOPIC, payload)
+        self.spool.enqueue(CONTACT_TOPIC, payload)
+        spool.drain(self.spool)
+        contact = Contact.objects.get()
+        self.assertEqual(contact.created_at.isoformat(), '2024-05-01T09:30:00+00:00')
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Replayed after its email went out, as when the worker dies before acknowledging the batch
+        self.spool.enqueue(CONTACT_TOPIC, payload)
+        spool.drain(self.spool)
+        self.assertEqual(Contact.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIsNotNone(Contact.objects.get().notified_at)
+
+    def test_stats_view_is_staff_only(self):
+        self.assertEqual(self.client.get(reverse('queue_stats')).status_code, 302)
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        self.spool.enqueue('test', {'n': 1})
+        response = self.client.get(reverse('queue_stats'))
+        self.assertEqual(response.json()['topics']['test']['ready'], 1)
+
+
+@override_settings(QUERY_INSTRUMENTATION=False)
+class AsyncViewTests(TestCase):
+    """The async home and treatment views render what the sync ones do, with the same queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_content(treatments_per_category=2, posts=3)
+
+    async def render(self, view, url, **kwargs):
+        request = AsyncRequestFactory().get(url, headers=kwargs.pop('headers', None))
+        response = await view.as_view()(request, **kwargs)
+        if hasattr(response, 'render'):
+            # On the event loop: the template must not query anything the view did not fetch
+            response.render()
+        return response
+
+    def html(self, response):
+        return cache.CSRF_INPUT_RE.sub(rb'\1\2', response.content)
+
+    @override_settings(PAGE_CACHE_ENABLED=False)
+    async def test_async_views_match_sync_views(self):
+        for sync_view, async_view, url, kwargs in [
+            (views.HomeView, views.AsyncHomeView, '/', {}),
+            (views.TreatmentDetailView, views.AsyncTreatmentDetailView, '/treatments/face-treatment-0/',
+             {'slug': 'face-treatment-0'}),
+        ]:
+            self.assertTrue(async_view.view_is_async)
+            expected = await sync_to_async(
+                lambda: sync_view.as_view()(RequestFactory().get(url), **kwargs).render())()
+            response = await self.render(async_view, url, **kwargs)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.html(response), self.html(expected))
+
+    @override_settings(PAGE_CACHE_ENABLED=False)
+    async def test_conditional_get_and_missing_treatment(self):
+        url = '/treatments/face-treatment-0/'
+        response = await self.render(views.AsyncTreatmentDetailView, url, slug='face-treatment-0')
+        revalidated = await self.render(views.AsyncTreatmentDetailView, url, slug='face-treatment-0',
+                                        headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        with self.assertRaises(Http404):
+            await self.render(views.AsyncTreatmentDetailView, '/treatments/missing/', slug='missing')
+
+    async def test_page_cache_serves_async_views(self):
+        cache.get_cache().clear()
+        first = await self.render(views.AsyncHomeView, '/')
+        second = await self.render(views.AsyncHomeView, '/')
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_content(treatments_per_category=2, posts=8)
+        similarity.rebuild()
+
+    def setUp(self):
+        # Cached pages and validators outlive the rolled back rows of earlier tests
+        cache.get_cache().clear()
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_page_is_not_modified_after_one_query(self):
+        url = reverse('treatment_detail', args=['face-treatment-0'])
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            revalidated = self.revalidate(url, response)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_child_rows_touch_the_treatment(self):
+        url = reverse('treatment_detail', args=['face-treatment-0'])
+        treatment = Treatment.objects.get(slug='face-treatment-0')
+        for change in [
+            lambda: treatment.faqs.first().delete(),
+            lambda: BeforeAfterImage.objects.filter(treatment=treatment).first().save(),
+            lambda: Testimonial.objects.create(name='New', treatment=treatment, quote='Lovely.'),
+            # Its related treatments are shown on the page too
+            lambda: Treatment.objects.filter(related_from__treatment=treatment).first().save(),
+        ]:
+            response = self.client.get(url)
+            change()
+            self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_moved_child_rows_touch_both_treatments(self):
+        treatment = Treatment.objects.get(slug='face-treatment-0')
+        testimonial = Testimonial.objects.create(name='Moved', treatment=treatment, quote='Worth the wait.')
+        url = reverse('treatment_detail', args=[treatment.slug])
+        response = self.client.get(url)
+        self.assertContains(response, 'Worth the wait.')
+
+        # To a treatment the page does not list, whose timestamp does not validate it
+        testimonial.treatment = Treatment.objects.exclude(pk=treatment.pk).exclude(
+            related_from__treatment=treatment).first()
+        testimonial.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+        moved = self.client.get(url)
+        self.assertNotContains(moved, 'Worth the wait.')
+        self.assertNotEqual(moved['ETag'], response['ETag'])
+
+    def test_renamed_author_changes_blog_pages(self):
+        post = BlogPost.objects.select_related('author').first()
+        for url in [reverse('blog_list'), reverse('blog_detail', args=[post.slug])]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                post.author.first_name = f'Renamed {url}'
+                post.author.save()
+                self.assertEqual(self.revalidate(url, response).status_code, 200)
+        self.assertContains(self.client.get(url), f'Renamed {url}')
+
+        # Logging in changes nothing a page shows
+        url = reverse('blog_list')
+        response = self.client.get(url)
+        post.author.save(update_fields=['last_login'])
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_cached_pages_are_validated_without_queries(self):
+        for url in [reverse('treatment_detail', args=['face-treatment-0']), reverse('gallery'),
+                    reverse('blog_list'), reverse('blog_detail', args=['skin-care-article-0'])]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                # The validators are cached with the page, so neither a hit nor a 304 reads the database
+                with self.assertNumQueries(0):
+                    hit = self.client.get(url)
+                self.assertEqual((hit['X-Page-Cache'], hit['ETag']), ('hit', response['ETag']))
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        # Invalidating the page drops its validators too
+        url = reverse('treatment_detail', args=['face-treatment-0'])
+        response = self.client.get(url)
+        Treatment.objects.get(slug='face-treatment-0').faqs.first().delete()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_post_etag_follows_the_posts_it_links_to(self):
+        posts = list(BlogPost.objects.order_by('created_at'))
+        for n, post in enumerate(posts):
+            BlogPost.objects.filter(pk=post.pk).update(created_at=timezone.now() - timedelta(days=len(posts) - n))
+        RelatedPost.objects.filter(post=posts[0]).delete()
+        url = reverse('blog_detail', args=[posts[0].slug])
+        response = self.client.get(url)
+        # Not among the newest, not a neighbour, not related: not on the page
+        BlogPost.objects.filter(pk=posts[2].pk).update(updated_at=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        # Its next post is linked from it
+        BlogPost.objects.filter(pk=posts[1].pk).update(updated_at=timezone.now() + timedelta(minutes=2))
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_deleted_post_changes_the_list_etag(self):
+        url = reverse('blog_list')
+        response = self.client.get(url)
+        BlogPost.objects.order_by('published_date').first().delete()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_pending_message_forces_a_full_response(self):
+        url = reverse('blog_list')
+        response = self.client.get(url)
+        self.client.cookies['messages'] = 'pending'
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_missing_treatment_is_not_found(self):
+        response = self.client.get(reverse('treatment_detail', args=['missing']), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], PAGE_CACHE_ENABLED=False, QUERY_INSTRUMENTATION=False,
+                   STORAGES=PLAIN_STATIC_STORAGES)
+class ReplicaRoutingTests(TemporarySpoolMixin, TransactionTestCase):
+    # The replica mirrors the test database. Its own connection cannot see
+    # uncommitted rows, so these tests commit instead of rolling back.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        create_test_content(treatments_per_category=1, posts=2)
+
+    def aliases(self, method, url, data=None):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = getattr(self.client, method)(url, data or {})
+        self.assertIn(response.status_code, (200, 302))
+        return {alias for alias, _sql, _params, _duration in recorder.queries}
+
+    def test_read_only_pages_read_from_the_replica(self):
+        for url in [reverse('home'), reverse('blog_list'), reverse('treatment_detail', args=['face-treatment-0']),
+                    reverse('search') + '?q=collagen']:
+            self.assertEqual(self.aliases('get', url), {'replica'}, url)
+        self.assertIsNone(routers.current_replica())
+
+    def test_post_sends_the_browser_to_the_primary(self):
+        self.client.post(reverse('newsletter_signup'), {'email': 'sticky@example.com'})
+        self.assertIn(routers.sticky_cookie(), self.client.cookies)
+        self.assertEqual(self.aliases('get', reverse('blog_list')), {'default'})
+
+    def test_admin_and_writes_use_the_primary(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        self.assertEqual(self.aliases('get', reverse('admin:azfi_treatment_changelist')), {'default'})
+        router = routers.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_write(Contact), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'azfi'))
+
+    def test_without_replicas_everything_reads_the_primary(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.aliases('get', reverse('blog_list')), {'default'})
+
+
+class PrerenderTests(FullBucketsMixin, TemporarySpoolMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_content(treatments_per_category=2, posts=3)
+        similarity.rebuild()
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        override = self.settings(PRERENDER_ROOT=self.root, PRERENDER_ENABLED=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        prerender.build()
+
+    def queued(self):
+        jobs = self.spool.claim(prerender.CHANGE_TOPIC, 100)
+        self.spool.ack(jobs)
+        return [job.payload for job in jobs]
+
+    def test_build_writes_static_pages_as_shells(self):
+        page = self.root / 'treatments' / 'face-treatment-0' / 'index.html'
+        self.assertIn(b'Face Treatment 0', page.read_bytes())
+        self.assertEqual(gzip.decompress(page.with_name('index.html.gz').read_bytes()), page.read_bytes())
+        self.assertTrue((self.root / 'index.html').exists())
+        blog = (self.root / 'blog' / 'index.html').read_bytes()
+        self.assertIn(b'name="csrfmiddlewaretoken" data-fragment="csrf"', blog)
+        self.assertNotIn(b'name="csrfmiddlewaretoken" value=', blog)
+        self.assertFalse((self.root / 'contact').exists())
+        self.assertFalse((self.root / 'search').exists())
+
+        entry = prerender.load_manifest(self.root)['/treatments/face-treatment-0/']
+        self.assertIn('azfi.treatmentfaq', entry['models'])
+        self.assertEqual(entry['scope']['azfi.treatmentfaq'], ['treatment_id', Treatment.objects.get(
+            slug='face-treatment-0').pk])
+
+    def test_static_pages_get_their_csrf_token_from_fragments(self):
+        client = Client(enforce_csrf_checks=True)
+        signup = reverse('newsletter_signup')
+        self.assertEqual(client.post(signup, {'email': 'jo@example.com'}).status_code, 403)
+
+        token = client.get(reverse('user_fragments')).json()['csrf']
+        response = client.post(signup, {'email': 'jo@example.com', 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+
+    def test_changes_rerender_only_affected_pages(self):
+        TreatmentFAQ.objects.filter(treatment__slug='face-treatment-0').first().save()
+        rendered, removed = prerender.update(self.queued())
+        self.assertEqual(rendered, ['/treatments/face-treatment-0/'])
+        self.assertEqual(removed, [])
+
+        body = Treatment.objects.get(slug='body-treatment-1')
+        body.name = 'Body Contouring'
+        body.save()
+        jobs = self.spool.claim(similarity.CHANGE_TOPIC, 100)
+        similarity.apply_changes(jobs)
+        self.spool.ack(jobs)
+        listing = {f'/treatments/{slug}/' for slug in
+                   Treatment.objects.filter(similar__related=body).values_list('slug', flat=True)}
+        rendered, _removed = prerender.update(self.queued())
+        # Its own page, the pages listing it as related and the treatment list; blog pages are untouched
+        self.assertIn('/treatments/body-treatment-1/', rendered)
+        self.assertTrue(listing)
+        self.assertLessEqual(listing, set(rendered))
+        self.assertIn('/treatments/', rendered)
+        self.assertNotIn('/blog/skin-care-article-0/', rendered)
+
+    def test_renamed_and_deleted_posts(self):
+        BlogPost.objects.get(slug='skin-care-article-0').delete()
+        post = BlogPost.objects.get(slug='skin-care-article-1')
+        post.slug = 'renamed-article'
+        post.save()
+        rendered, removed = prerender.update(self.queued())
+        self.assertIn('/blog/renamed-article/', rendered)
+        self.assertEqual(sorted(removed), ['/blog/skin-care-article-0/', '/blog/skin-care-article-1/'])
+        self.assertFalse((self.root / 'blog' / 'skin-care-article-0' / 'index.html').exists())
+        self.assertTrue((self.root / 'blog' / 'renamed-article' / 'index.html').exists())
+
+
+class SearchTests(TestCase):
+    # The FTS5 index; FallbackSearchTests runs the same tests on the SearchPosting index
+    fts5 = True
+
+    def setUp(self):
+        search._fts5_enabled = None if self.fts5 else False
+        self.addCleanup(setattr, search, '_fts5_enabled', None)
+        if self.fts5 and not search.fts5_enabled():
+            self.skipTest("SQLite was built without FTS5")
+        self.peel = Treatment.objects.create(
+            name='Chemical Peel', slug='chemical-peel', category='FACE', price_range='$120', duration='30 minutes',
+            description="A chemical peel resurfaces the skin. Peels <b>lift</b> dull cells.",
+            what_to_expect="Mild peeling for a few days.", image='treatments/placeholder.jpg',
+        )
+        TreatmentFAQ.objects.create(treatment=self.peel, question="Does it sting?",
+                                    answer="A numbing cream is applied in the café-style lounge.")
+        self.post = BlogPost.objects.create(
+            title="Winter skin care", slug='winter-skin-care', author=User.objects.create_user('writer'),
+            excerpt="Keeping dry skin calm.", content="Drink water and moisturise. " * 30 + "Then ask about a peel.",
+        )
+
+    def hits(self, query):
+        return [(hit.kind, hit.object_id) for hit in search.search(query)]
+
+    def test_uses_its_index(self):
+        self.assertEqual(SearchPosting.objects.exists(), not self.fts5)
+
+    def test_ranking(self):
+        self.assertEqual(self.hits('peel'), [('treatment', self.peel.pk), ('post', self.post.pk)])
+        self.assertEqual(search.search('peel').count(), 2)
+        self.assertEqual(self.hits('peel water'), [('post', self.post.pk)])
+
+    def test_stemming_and_diacritics(self):
+        self.assertEqual(self.hits('peeling'), self.hits('peels'))
+        self.assertEqual(self.hits('peels lifted'), [('treatment', self.peel.pk)])
+        self.assertEqual(self.hits('moisturising'), [('post', self.post.pk)])
+        self.assertEqual([hit.kind for hit in search.search('cafe')], ['faq'])
+
+    def test_highlighting(self):
+        hit = search.search('peel')[0]
+        self.assertEqual(hit.title, 'Chemical <mark>Peel</mark>')
+        self.assertIn('<mark>Peels</mark> &lt;b&gt;lift&lt;/b&gt;', hit.snippet)
+        self.assertIn('<mark>peeling</mark>', hit.snippet)
+        self.assertNotIn('<mark>resurfaces</mark>', hit.snippet)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.post.title = "Peel season"
+        self.post.save()
+        self.assertEqual(search.search('season')[0].title, 'Peel <mark>season</mark>')
+        self.post.delete()
+        self.assertEqual(self.hits('peel'), [('treatment', self.peel.pk)])
+        self.peel.faqs.all().delete()
+        self.assertEqual(self.hits('cafe'), [])
+
+
+class FallbackSearchTests(SearchTests):
+    fts5 = False
+
+
+@override_settings(PAGE_CACHE_ENABLED=False, QUERY_INSTRUMENTATION=False)
+class SimilarityTests(TemporarySpoolMixin, TestCase):
+    texts = {
+        'laser-hair-removal': ('Laser Hair Removal', "Laser pulses target the hair follicle.", "Is laser hair removal permanent?"),
+        'laser-resurfacing': ('Laser Resurfacing', "A fractional laser renews the skin surface.", "How long does laser redness last?"),
+        'hydrating-facial': ('Hydrating Facial', "Cleansing and serums hydrate the skin.", "Is the facial suitable for dry skin?"),
+        'lip-filler': ('Lip Filler', "Hyaluronic filler adds volume to the lips.", "How long does lip filler last?"),
+        'cheek-filler': ('Cheek Filler', "Hyaluronic filler restores volume to the cheeks.", "Does cheek filler look natural?"),
+    }
+
+    def setUp(self):
+        super().setUp()
+        for slug, (name, description, question) in self.texts.items():
+            treatment = Treatment.objects.create(
+                name=name, slug=slug, description=description, what_to_expect="A short consultation first.",
+                price_range='$200', duration='30 minutes', image='treatments/placeholder.jpg', category='FACE')
+            TreatmentFAQ.objects.create(treatment=treatment, question=question, answer="Ask us.", order=0)
+        similarity.rebuild()
+        self.work_off()
+
+    def work_off(self):
+        jobs = self.spool.claim(similarity.CHANGE_TOPIC, 100)
+        if jobs:
+            similarity.apply_changes(jobs)
+            self.spool.ack(jobs)
+
+    def related(self, slug):
+        return list(Treatment.objects.filter(related_from__treatment__slug=slug)
+                    .order_by('related_from__rank').values_list('slug', flat=True))
+
+    def test_neighbours_share_content(self):
+        self.assertEqual(self.related('laser-hair-removal')[0], 'laser-resurfacing')
+        self.assertEqual(self.related('lip-filler')[0], 'cheek-filler')
+        self.assertLessEqual(len(self.related('hydrating-facial')), similarity.TOP_K)
+        for slug in self.texts:
+            self.assertNotIn(slug, self.related(slug))
+        scores = list(RelatedTreatment.objects.filter(treatment__slug='lip-filler').values_list('score', flat=True))
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        response = self.client.get(reverse('treatment_detail', args=['lip-filler']))
+        self.assertEqual([t.slug for t in response.context['related_treatments']], self.related('lip-filler'))
+
+    def test_changes_are_refreshed_incrementally(self):
+        facial = Treatment.objects.get(slug='hydrating-facial')
+        TreatmentFAQ.objects.create(treatment=facial, question="Can filler and a facial be combined?",
+                                    answer="Hyaluronic filler volume for lips and cheeks.", order=1)
+        self.work_off()
+        self.assertEqual(self.related('hydrating-facial')[0], 'lip-filler')
+
+        Treatment.objects.get(slug='laser-resurfacing').delete()
+        self.work_off()
+        self.assertNotIn('laser-resurfacing', self.related('laser-hair-removal'))
+        self.assertTrue(self.related('laser-hair-removal'))
+
+    def test_vectors_are_unit_length(self):
+        matrix = similarity.vectorize([['laser', 'skin'], ['laser', 'hair'], ['only']])
+        self.assertEqual(matrix.shape, (3, 1))
+        self.assertAlmostEqual(float((matrix[0] @ matrix[1])), float(matrix[0, 0] * matrix[1, 0]), places=6)
+        self.assertLess(float(matrix[0, 0]), 1)
+        self.assertEqual(float(matrix[2, 0]), 0)
+
+
+class MinHashTests(TestCase):
+    texts = {
+        'laser-aftercare': ("Laser aftercare", "Protect treated skin from sunlight after laser sessions; "
+                            "redness fades within days and gentle moisturiser helps recovery."),
+        'laser-recovery': ("Recovering from laser sessions", "After laser sessions expect redness for days; "
+                           "protect treated skin from sunlight and use gentle moisturiser."),
+        'filler-myths': ("Filler myths", "Hyaluronic filler restores volume to lips and cheeks; "
+                         "results look natural and dissolve slowly over months."),
+        'filler-results': ("Natural filler results", "Natural results from hyaluronic filler: volume for lips "
+                           "and cheeks that dissolve slowly over several months."),
+        'sleep-habits': ("Sleep habits", "Consistent bedtime routines improve rest, mood and overall wellbeing."),
+    }
+
+    def setUp(self):
+        self.author = User.objects.create_user('writer', password='x')
+        for slug, (title, content) in self.texts.items():
+            self.create_post(slug, title, content)
+        minhash.rebuild()
+
+    def create_post(self, slug, title, content):
+        return BlogPost.objects.create(title=title, slug=slug, author=self.author, content=f"<p>{content}</p>",
+                                       featured_image='blog/placeholder.jpg')
+
+    def related(self, slug):
+        return list(BlogPost.objects.filter(related_from__post__slug=slug)
+                    .order_by('related_from__rank').values_list('slug', flat=True))
+
+    def stored(self):
+        return sorted(RelatedPost.objects.values_list('post__slug', 'rank', 'related__slug', 'score'))
+
+    def test_similar_posts_are_related(self):
+        self.assertEqual(self.related('laser-aftercare')[0], 'laser-recovery')
+        self.assertEqual(self.related('filler-myths')[0], 'filler-results')
+        self.assertEqual(self.related('sleep-habits'), [])
+        for slug in self.texts:
+            self.assertNotIn(slug, self.related(slug))
+
+        response = self.client.get(reverse('blog_detail', args=['filler-results']))
+        self.assertEqual([post.slug for post in response.context['related_posts']], self.related('filler-results'))
+
+    def test_saves_match_a_full_rebuild(self):
+        self.create_post('sleep-routines', "Bedtime routines", "Consistent bedtime routines improve rest and mood.")
+        self.assertEqual(self.related('sleep-habits'), ['sleep-routines'])
+
+        post = BlogPost.objects.get(slug='laser-recovery')
+        post.content = self.texts['filler-results'][1]
+        post.save()
+        self.assertNotIn('laser-recovery', self.related('laser-aftercare'))
+        self.assertIn('laser-recovery', self.related('filler-myths'))
+
+        BlogPost.objects.get(slug='filler-results').delete()
+        self.assertNotIn('filler-results', self.related('filler-myths'))
+
+        incremental = self.stored()
+        minhash.rebuild()
+        self.assertEqual(self.stored(), incremental)
+
+    def test_signatures_estimate_jaccard_similarity(self):
+        words = [f"word{i}" for i in range(200)]
+        first = minhash.signature(minhash.hash_shingles(words[:150]))
+        second = minhash.signature(minhash.hash_shingles(words[50:]))  # Jaccard 100/200
+        self.assertEqual(first.shape, (minhash.NUM_PERM,))
+        self.assertAlmostEqual(float(minhash.estimate(first, second[None])[0]), 0.5, delta=0.2)
+        self.assertEqual(float(minhash.estimate(first, first[None])[0]), 1.0)
+        self.assertIsNone(minhash.signature(minhash.hash_shingles([])))
+
+        buckets = minhash.band_hashes([first, first, second])
+        self.assertEqual(buckets.shape, (3, minhash.BANDS))
+        self.assertEqual(buckets[0].tolist(), buckets[1].tolist())
+
+
+class BlogContentTests(TestCase):
+    body = (
+        "## Before your peel\n\nAvoid **retinoids** for a week. See [our guide](/treatments/) first.\n\n"
+        "- Stay out of the sun\n- Skip *exfoliants*\n\n"
+        "### Aftercare\n\n<p onclick=\"steal()\">Moisturise <a href=\"javascript:alert(1)\">daily</a>.</p>"
+        "<script>alert(1)</script>\n\n## Before your peel\n\nBook a review."
+    )
+
+    def setUp(self):
+        self.author = User.objects.create_user('writer', password='x')
+        self.post = BlogPost.objects.create(title="Peel prep", slug='peel-prep', author=self.author,
+                                            content=self.body, featured_image='blog/placeholder.jpg')
+
+    def test_content_is_compiled_on_save(self):
+        post = self.post
+        self.assertInHTML('<h2 id="before-your-peel">Before your peel</h2>', post.content_html)
+        self.assertInHTML('<ul><li>Stay out of the sun</li><li>Skip <em>exfoliants</em></li></ul>', post.content_html)
+        self.assertIn('<a href="/treatments/" rel="noopener nofollow">our guide</a>', post.content_html)
+        for unsafe in ('<script', 'onclick', 'javascript:', 'alert'):
+            self.assertNotIn(unsafe, post.content_html)
+        self.assertEqual(post.toc, [
+            {'level': 2, 'id': 'before-your-peel', 'title': 'Before your peel'},
+            {'level': 3, 'id': 'aftercare', 'title': 'Aftercare'},
+            {'level': 2, 'id': 'before-your-peel-2', 'title': 'Before your peel'},
+        ])
+        self.assertEqual(post.word_count, 28)
+        self.assertEqual(post.reading_time, 1)
+        self.assertTrue(post.summary.startswith("Avoid retinoids for a week."))
+
+        response = self.client.get(post.get_absolute_url())
+        self.assertContains(response, '<a href="#aftercare">Aftercare</a>', html=True)
+        self.assertContains(response, post.content_html)
+        self.assertNotContains(response, '**retinoids**')
+
+    def test_saves_recompile_only_when_the_text_changes(self):
+        self.post.excerpt = "A written excerpt."
+        self.post.save(update_fields=['excerpt'])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.summary, "A written excerpt.")
+
+        BlogPost.objects.filter(pk=self.post.pk).update(summary='stale')
+        self.post.title = "Peel preparation"
+        self.post.save(update_fields=['title'])
+        self.assertEqual(BlogPost.objects.get(pk=self.post.pk).summary, 'stale')
+
+    def test_backfill_compiles_existing_posts(self):
+        compiled = BlogPost.objects.values(*BlogPost.COMPILED_FIELDS).get(pk=self.post.pk)
+        BlogPost.objects.update(content_html='', toc=[], word_count=0, summary='')
+        out = io.StringIO()
+        call_command('build_post_content', stdout=out)
+        self.assertIn("1 changed", out.getvalue())
+        self.assertEqual(BlogPost.objects.values(*BlogPost.COMPILED_FIELDS).get(pk=self.post.pk), compiled)
+
+        call_command('build_post_content', stdout=out)
+        self.assertIn("0 changed", out.getvalue())
+
+
+class BookingTests(FullBucketsMixin, TestCase):
+
+    def setUp(self):
+        self.treatment = Treatment.objects.create(
+            name='HydraFacial', slug='hydrafacial', category='FACE', description='x', what_to_expect='x',
+            price_range='$150', duration='45 minutes', duration_minutes=45, image='treatments/placeholder.jpg',
+        )
+        self.ana, self.ben, self.cal = [
+            TeamMember.objects.create(name=name, role='Aesthetician', bio='x', image='team/placeholder.jpg')
+            for name in ('Ana', 'Ben', 'Cal')
+        ]
+        for member in (self.ana, self.ben, self.cal):
+            WorkingHours.objects.create(member=member, weekday=0, start=time(9), end=time(12))
+        # Cal works then too, but does not offer the treatment
+        self.treatment.practitioners.add(self.ana, self.ben)
+        today = timezone.localdate()
+        self.monday = timezone.make_aware(datetime.combine(today + timedelta(days=7 - today.weekday()), time.min))
+
+    def at(self, hour, minute=0):
+        return self.monday + timedelta(hours=hour, minutes=minute)
+
+    def times(self, member):
+        slots = booking.open_slots(self.treatment, self.monday, self.monday + timedelta(days=7), member_id=member.pk)
+        return [timezone.localtime(slot.start).strftime('%H:%M') for slot in slots]
+
+    def test_open_slots_follow_hours_and_bookings(self):
+        self.assertEqual(self.times(self.ana), ['09:00', '09:15', '09:30', '09:45', '10:00', '10:15', '10:30',
+                                                '10:45', '11:00', '11:15'])
+        self.assertEqual(self.times(self.cal), [])
+
+        booking.reserve(self.treatment, self.at(10), member_id=self.ana.pk, name='Jo', email='jo@example.com',
+                        phone='555 0100')
+        self.assertEqual(self.times(self.ana), ['09:00', '09:15', '10:45', '11:00', '11:15'])
+        self.assertEqual(len(self.times(self.ben)), 10)
+
+        busy = booking.IntervalIndex([(0, 15), (30, 45), (10, 20)])
+        self.assertEqual(list(busy.gaps(0, 60)), [(20, 30), (45, 60)])
+        self.assertTrue(busy.overlaps(19, 21))
+        self.assertFalse(busy.overlaps(20, 30))
+
+    def test_overlapping_bookings_are_refused(self):
+        details = {'name': 'Jo', 'email': 'jo@example.com', 'phone': '555 0100'}
+        first = booking.reserve(self.treatment, self.at(10), **details)
+        second = booking.reserve(self.treatment, self.at(10), **details)
+        self.assertEqual({first.member, second.member}, {self.ana, self.ben})
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.reserve(self.treatment, self.at(10, 30), **details)
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.reserve(self.treatment, self.at(10, 5), member_id=self.ana.pk, **details)
+
+        # A request that read the calendar before another booked loses at the constraint
+        with self.assertRaises(IntegrityError):
+            booking.book(self.treatment, self.ana.pk, self.at(10, 30), **details)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertFalse(booking.overlapping().exists())
+
+    def test_cancel_frees_the_time(self):
+        made = booking.reserve(self.treatment, self.at(9), member_id=self.ana.pk, name='Jo',
+                               email='jo@example.com', phone='555 0100')
+        self.assertEqual(BookingSlot.objects.filter(booking=made).count(), 3)
+        self.assertEqual(booking.cancel(Booking.objects.all()), 1)
+        self.assertEqual(Booking.objects.get().status, Booking.CANCELLED)
+        self.assertEqual(len(self.times(self.ana)), 10)
+
+    def test_booking_page(self):
+        response = self.client.get(reverse('booking'), {'treatment': 'hydrafacial',
+                                                        'week': self.monday.date().isoformat()})
+        self.assertContains(response, f'value="{timezone.localtime(self.at(9)).isoformat()}"')
+
+        data = {'treatment': 'hydrafacial', 'start': self.at(9).isoformat(), 'member': self.ana.pk,
+                'name': 'Jo', 'email': 'jo@example.com', 'phone': '555 0100'}
+        response = self.client.post(reverse('booking'), data)
+        made = Booking.objects.get()
+        self.assertRedirects(response, reverse('booking_confirmed', args=[made.reference]))
+        self.assertEqual((made.member, made.start), (self.ana, self.at(9)))
+        self.assertEqual(self.client.post(reverse('booking'), data).status_code, 409)
+
+        slots = self.client.get(reverse('booking_slots'), {'treatment': 'hydrafacial',
+                                                           'week': self.monday.date().isoformat()}).json()
+        self.assertEqual(len(slots['slots']), 7 + 10)  # Ana from 09:45, Ben all morning
+        self.assertEqual(self.client.get(reverse('contact'), {'booking': 'true'})['Location'], reverse('booking'))
+
+
+@override_settings(RATE_LIMITS={
+    'newsletter_signup': {'rate': 1, 'period': 60, 'burst': 2, 'keys': ('ip', 'email')},
+}, QUERY_INSTRUMENTATION=False)
+class RateLimitTests(FullBucketsMixin, TemporarySpoolMixin, TestCase):
+
+    def signup(self, email, ip='10.0.0.1'):
+        return self.client.post(reverse('newsletter_signup'), {'email': email}, REMOTE_ADDR=ip)
+
+    def test_bursts_are_refused_before_any_work(self):
+        newsletter.seen.warm()
+        self.assertEqual(self.signup('a@example.com').status_code, 302)
+        self.assertEqual(self.signup('b@example.com').status_code, 302)
+        with self.assertNumQueries(0):
+            response = self.signup('c@example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+        self.assertEqual(self.spool.stats()[newsletter.SUBSCRIBE_TOPIC]['depth'], 2)
+
+        # The address is limited from anywhere, and other clients are not
+        self.assertEqual(self.signup('d@example.com', ip='10.0.0.2').status_code, 302)
+        self.assertEqual(self.signup('A@example.com ', ip='10.0.0.3').status_code, 302)
+        self.assertEqual(self.signup('a@example.com', ip='10.0.0.4').status_code, 429)
+        # Other endpoints have no policy here
+        self.assertEqual(self.client.get(reverse('contact')).status_code, 200)
+
+        counts = ratelimit.stats()['newsletter_signup']
+        self.assertEqual((counts['allowed'], counts['limited']), (4, 2))
+        staff = User.objects.create_superuser('ops', 'ops@example.com', 'x')
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('rate_limit_stats')).json()['policies'], ratelimit.stats())
+
+    def test_refused_requests_spend_no_tokens(self):
+        self.signup('a@example.com', ip='10.0.0.1')
+        self.signup('a@example.com', ip='10.0.0.2')
+        # Refused for the address, after the new IP's bucket handed out a token
+        self.assertEqual(self.signup('a@example.com', ip='10.0.0.3').status_code, 429)
+        self.assertEqual(self.signup('a@example.com', ip='10.0.0.3').status_code, 429)
+        self.assertEqual(self.signup('b@example.com', ip='10.0.0.3').status_code, 302)
+        self.assertEqual(self.signup('c@example.com', ip='10.0.0.3').status_code, 302)
+
+    def test_buckets_refill_at_the_rate(self):
+        policy = ratelimit.Policy('test', rate=1, period=10, burst=2, keys=('ip',))
+        self.assertEqual([ratelimit.take('bucket', policy, now=1000) for _ in range(3)], [0, 0, 10])
+        self.assertEqual(ratelimit.take('bucket', policy, now=1004), 6)
+        self.assertEqual([ratelimit.take('bucket', policy, now=1010) for _ in range(2)], [0, 10])
+        # Idle long enough to fill up again, and no more than full
+        self.assertEqual([ratelimit.take('bucket', policy, now=1100) for _ in range(3)], [0, 0, 10])
+
+
+@override_settings(PAGE_CACHE_ENABLED=False, PROFILING_ENABLED=True)
+class ProfilingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_content()
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = self.settings(PROFILING_DIR=Path(tmp.name))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.dir = Path(tmp.name)
+
+    def test_token_profiles_the_request_carrying_it(self):
+        self.client.force_login(User.objects.create_superuser('ops', 'ops@example.com', 'x'))
+        token = self.client.get(reverse('profiling_token')).json()['token']
+        self.client.logout()
+
+        self.assertNotIn(profiling.HEADER, self.client.get(reverse('gallery')))
+        self.assertNotIn(profiling.HEADER, self.client.get(reverse('gallery'), HTTP_X_PROFILE=token + 'x'))
+        response = self.client.get(reverse('gallery'), HTTP_X_PROFILE=token)
+        name = response[profiling.HEADER]
+        self.assertEqual(sorted(path.name for path in self.dir.iterdir()),
+                         [f'{name}.cpu.folded', f'{name}.folded', f'{name}.json'])
+
+        summary = json.loads((self.dir / f'{name}.json').read_text())
+        self.assertEqual([template['name'] for template in summary['templates']][:2], ['gallery.html', 'base.html'])
+        # The freshness check and the page of cases both run in the view
+        self.assertEqual([query['template'] for query in summary['queries']], [None, None])
+        folded = (self.dir / f'{name}.folded').read_text().splitlines()
+        self.assertTrue(any(line.startswith('GET /gallery/;SQL SELECT') for line in folded))
+        self.assertTrue(any(line.startswith('GET /gallery/;gallery.html;base.html ') for line in folded))
+        self.assertAlmostEqual(sum(int(line.rsplit(' ', 1)[1]) for line in folded) / 1000,
+                               summary['total_ms'], delta=1)
+
+        response = self.client.get(reverse('about'), {profiling.PARAM: token})
+        summary = json.loads((self.dir / f'{response[profiling.HEADER]}.json').read_text())
+        # The team is queried from about.html's block, which renders inside base.html
+        self.assertEqual([query['template'] for query in summary['queries']], ['base.html'])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_sample_rate_profiles_without_a_token(self):
+        self.assertIn(profiling.HEADER, self.client.get(reverse('about')))
+
+    @override_settings(PROFILING_ENABLED=False, PROFILING_SAMPLE_RATE=1.0)
+    def test_disabled_profiler_is_not_loaded(self):
+        response = self.client.get(reverse('about'), HTTP_X_PROFILE=profiling.make_token())
+        self.assertNotIn(profiling.HEADER, response)
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTests(FullBucketsMixin, TemporarySpoolMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_content(treatments_per_category=2, posts=4)
+
+    def served(self, url, client=None):
+        return (client or self.client).get(url)['X-Page-Cache']
+
+    def assertOrphaned(self, url, change):
+        self.served(url)
+        self.assertEqual(self.served(url), 'hit')
+        change()
+        self.assertEqual(self.served(url), 'miss')
+
+    def test_tagged_models_orphan_their_pages(self):
+        detail = reverse('treatment_detail', args=['face-treatment-0'])
+        other = Treatment.objects.get(slug='body-treatment-0')
+        pages = {
+            'azfi.treatmentfaq': (detail, lambda: other.faqs.first()),
+            'azfi.beforeafterimage': (reverse('gallery'), lambda: other.before_after_images.first()),
+            'azfi.teammember': (reverse('about'), lambda: TeamMember.objects.first()),
+            'azfi.testimonial': (reverse('testimonial_list'), lambda: other.testimonials.first()),
+            'azfi.blogpost': (reverse('blog_list'), lambda: BlogPost.objects.order_by('pk').first()),
+            'auth.user': (reverse('blog_list'), lambda: User.objects.create_user('reader')),
+            # Last: deleting it takes its FAQs, cases and testimonials along
+            'azfi.treatment': (reverse('treatment_list'), lambda: other),
+        }
+        self.assertEqual(set(pages), {label.lower() for label in cache.TAGGED_MODELS})
+        for label, (url, row) in pages.items():
+            with self.subTest(model=label):
+                obj = row()
+                self.assertOrphaned(url, obj.save)
+                self.assertOrphaned(url, obj.delete)
+
+    def test_unrelated_changes_keep_pages(self):
+        self.served(reverse('about'))
+        BlogPost.objects.first().save()
+        self.assertEqual(self.served(reverse('about')), 'hit')
+
+    def test_related_lists_orphan_their_pages(self):
+        treatment = Treatment.objects.get(slug='face-treatment-0')
+        self.assertOrphaned(treatment.get_absolute_url(), lambda: similarity.publish([treatment.pk]))
+        post = BlogPost.objects.order_by('pk').first()
+        self.assertOrphaned(post.get_absolute_url(), minhash.rebuild)
+
+    def test_ignored_params_share_an_entry(self):
+        url = reverse('about')
+        self.assertEqual(self.served(url + '?utm_source=mail&utm_campaign=spring'), 'miss')
+        self.assertEqual(self.served(url + '?gclid=abc'), 'hit')
+        self.assertEqual(self.served(url), 'hit')
+        self.assertEqual(self.served(url + '?ref=mail'), 'miss')
+
+    def test_csrf_token_is_filled_in_per_visitor(self):
+        first, second = Client(enforce_csrf_checks=True), Client(enforce_csrf_checks=True)
+        token_re = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+        miss = first.get(reverse('home'))
+        hit = second.get(reverse('home'))
+        self.assertEqual((miss['X-Page-Cache'], hit['X-Page-Cache']), ('miss', 'hit'))
+        self.assertNotIn(cache.CSRF_PLACEHOLDER, hit.content)
+        self.assertIn(settings.CSRF_COOKIE_NAME, hit.cookies)
+
+        tokens = [token_re.search(response.content.decode()).group(1) for response in (miss, hit)]
+        self.assertNotEqual(*tokens)
+        form = {'first_name': 'Jo', 'last_name': 'Lee', 'email': 'jo@example.com', 'phone': '555 0100', 'message': 'Hello'}
+        self.assertEqual(second.post(reverse('contact'), dict(form, csrfmiddlewaretoken=tokens[1])).status_code, 302)
+        # It is the second visitor's token, which the first visitor's cookie does not match
+        self.assertEqual(first.post(reverse('contact'), dict(form, csrfmiddlewaretoken=tokens[1])).status_code, 403)
+
+
+class PageShellTests(FullBucketsMixin, TemporarySpoolMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_content()
+        cls.staff = User.objects.create_superuser('ops', 'ops@example.com', 'x')
+
+    def signup(self):
+        return self.client.post(reverse('newsletter_signup'), {'email': 'jane@example.com'})
+
+    def test_default_pages_render_fragments_in_place(self):
+        self.assertContains(self.client.get(reverse('contact')), 'name="csrfmiddlewaretoken" value="')
+        response = self.client.get(self.signup().url)
+        self.assertContains(response, 'Thank you for subscribing')
+        self.assertNotIn('public', response.get('Cache-Control', ''))
+        self.assertNotContains(self.client.get(reverse('home')), 'Thank you for subscribing')
+
+    @override_settings(PAGE_SHELL_ENABLED=True)
+    def test_shell_is_shared_and_fragments_fill_it(self):
+        anonymous = self.client.get(reverse('home'))
+        self.assertEqual(anonymous['Cache-Control'], 'public, max-age=0, s-maxage=300')
+        self.assertFalse(anonymous.cookies)
+        self.assertNotIn('Vary', anonymous)
+        self.assertContains(anonymous, '<input type="hidden" name="csrfmiddlewaretoken" data-fragment="csrf"')
+        self.assertNotContains(anonymous, 'name="csrfmiddlewaretoken" value=')
+        self.assertEqual(self.client.get(reverse('contact'))['Cache-Control'], 'public, max-age=0, s-maxage=300')
+
+        # Signed in, with a message waiting: the same page, straight from the cache
+        self.client.force_login(self.staff)
+        self.signup()
+        with self.assertNumQueries(0):
+            page = self.client.get(reverse('home'))
+        self.assertEqual(page['X-Page-Cache'], 'hit')
+        self.assertEqual(page.content, anonymous.content)
+
+        response = self.client.get(reverse('user_fragments'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        fragments = response.json()
+        self.assertTrue(fragments['csrf'])
+        self.assertIn('Thank you for subscribing', fragments['messages'])
+        self.assertIn('Signed in as ops', fragments['toolbar'])
+        # Messages are shown once
+        self.assertNotIn('Thank you for subscribing', self.client.get(reverse('user_fragments')).json()['messages'])
+
+        self.client.logout()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('user_fragments')).json()['toolbar'], '')
+
+    @override_settings(PAGE_SHELL_ENABLED=True)
+    def test_every_cached_page_is_public(self):
+        for url in prerender.pages():
+            with self.subTest(url=url):
+                for attempt in ('miss', 'hit'):
+                    response = self.client.get(url)
+                    self.assertEqual(response['X-Page-Cache'], attempt)
+                    self.assertEqual(response['Cache-Control'], 'public, max-age=0, s-maxage=300')
+
+
+class NewsletterTests(FullBucketsMixin, TemporarySpoolMixin, TestCase):
+
+    def signup(self, email):
+        return self.client.post(reverse('newsletter_signup'), {'email': email},
+                                HTTP_REFERER='http://testserver/blog/')
+
+    def test_repeat_signups_are_caught_before_the_queue(self):
+        Subscriber.objects.create(email='known@example.com')
+        for email in ['Jane@Example.com', ' jane@example.com ', 'KNOWN@example.com', 'amara@example.com']:
+            self.assertRedirects(self.signup(email), 'http://testserver/blog/', fetch_redirect_response=False)
+        self.assertEqual(self.spool.stats()[newsletter.SUBSCRIBE_TOPIC]['depth'], 2)
+
+        spool.drain(self.spool)
+        self.assertQuerySetEqual(Subscriber.objects.order_by('email').values_list('email', 'source'), [
+            ('amara@example.com', '/blog/'), ('jane@example.com', '/blog/'), ('known@example.com', ''),
+        ])
+
+    def test_replayed_batch_is_stored_once(self):
+        payload = {'email': 'jane@example.com', 'source': '', 'subscribed_at': '2024-05-01T09:30:00+00:00'}
+        for _ in range(3):
+            self.spool.enqueue(newsletter.SUBSCRIBE_TOPIC, payload)
+        spool.drain(self.spool)
+        subscriber = Subscriber.objects.get()
+        self.assertEqual(subscriber.created_at.isoformat(), '2024-05-01T09:30:00+00:00')
+
+    def test_invalid_email_and_foreign_referer(self):
+        response = self.client.post(reverse('newsletter_signup'), {'email': 'not-an-email'},
+                                    HTTP_REFERER='https://evil.example/')
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        self.assertNotIn(newsletter.SUBSCRIBE_TOPIC, self.spool.stats())
+
+    def test_deleted_subscriber_can_sign_up_again(self):
+        with self.settings(NEWSLETTER_INTAKE_ASYNC=False):
+            self.signup('jane@example.com')
+            Subscriber.objects.get().delete()
+            self.signup('jane@example.com')
+        self.assertTrue(Subscriber.objects.filter(email='jane@example.com').exists())
+
+    def test_export_streams_csv_to_staff(self):
+        Subscriber.objects.create(email='jane@example.com', source='/')
+        self.assertEqual(self.client.get(reverse('subscriber_export')).status_code, 302)
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        response = self.client.get(reverse('subscriber_export'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'email,source,subscribed_at')
+        self.assertTrue(lines[1].startswith('jane@example.com,/,'))
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+class CursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('sophia')
+        published = timezone.now()
+        for i in range(14):
+            BlogPost.objects.create(
+                title=f"Post {i}", slug=f"post-{i}", author=author, content="Body",
+                featured_image='blog/placeholder.jpg',
+                # Pairs of posts share a timestamp so the id tiebreak matters
+                published_date=published - timezone.timedelta(hours=i // 2),
+            )
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            page = response.context['page_obj']
+            seen.append([post.slug for post in page])
+            url = page.next_url
+        return seen, page
+
+    def test_pages_cover_every_post_once_in_order(self):
+        pages, last = self.walk(reverse('blog_list'))
+        slugs = [slug for page in pages for slug in page]
+        expected = list(BlogPost.objects.order_by('-published_date', '-id').values_list('slug', flat=True))
+        self.assertEqual(slugs, expected)
+        self.assertEqual([len(page) for page in pages], [6, 6, 2])
+        self.assertFalse(last.has_next())
+
+    def test_previous_returns_to_same_rows(self):
+        first = self.client.get(reverse('blog_list')).context['page_obj']
+        self.assertFalse(first.has_previous())
+        second = self.client.get(first.next_url).context['page_obj']
+        back = self.client.get(second.previous_url).context['page_obj']
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('blog_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_keeps_filters(self):
+        treatment = Treatment.objects.create(
+            name='Peel', slug='peel', description='', what_to_expect='', price_range='',
+            duration='', image='treatments/placeholder.jpg', category='FACE')
+        for n in range(12):
+            BeforeAfterImage.objects.create(treatment=treatment, title=f"Case {n}",
+                                            before_image='b.jpg', after_image='a.jpg')
+        page = self.client.get(reverse('gallery'), {'category': 'FACE'}).context['page_obj']
+        self.assertIn('category=FACE', page.next_url)
+        self.assertIn('cursor=', page.next_url)
+
+    def test_gallery_feed_continues_the_page(self):
+        face, body = (Treatment.objects.create(
+            name=name, slug=name.lower(), description='', what_to_expect='', price_range='',
+            duration='', image='treatments/placeholder.jpg', category=category,
+        ) for name, category in (('Peel', 'FACE'), ('Sculpt', 'BODY')))
+        for n in range(20):
+            BeforeAfterImage.objects.create(treatment=face if n % 4 else body, title=f"Case {n}",
+                                            before_image='b.jpg', after_image='a.jpg')
+        response = self.client.get(reverse('gallery'), {'category': 'FACE'})
+        titles = [image.title for image in response.context['page_obj']]
+        self.assertContains(response, f'data-feed="{reverse("gallery_images")}?category=FACE&amp;cursor=')
+
+        url = reverse('gallery_images') + f"?category=FACE&cursor={response.context['page_obj'].next_cursor}"
+        while url:
+            data = self.client.get(url).json()
+            titles += [case['title'] for case in data['results']]
+            url = data['next_url']
+        expected = BeforeAfterImage.objects.filter(treatment=face).order_by('-created_at', '-id')
+        self.assertEqual(titles, [image.title for image in expected])
+        self.assertIsNone(data['next'])
+
+        case = data['results'][0]
+        self.assertEqual(case['treatment'], {'name': 'Peel', 'category': 'FACE', 'url': face.get_absolute_url()})
+        # Without generated derivatives only the original upload is offered
+        self.assertEqual(case['before']['src'], '/media/b.jpg')
+        self.assertEqual(case['after']['srcset'], '')
+
+
+class DatasetGeneratorTests(TestCase):
+
+    def test_generate_is_consistent(self):
+        created = datagen.generate(scale=0.01, seed=1)
+        counts = datagen.counts_for(0.01)
+        self.assertEqual(created['posts'], BlogPost.objects.count())
+        self.assertEqual(created['contacts'], counts['contacts'])
+        self.assertEqual(TreatmentFAQ.objects.count(), Treatment.objects.count() * datagen.FAQS_PER_TREATMENT)
+        self.assertFalse(BlogPost.objects.filter(published_date__gt=timezone.now()).exists())
+        self.assertEqual(Testimonial.objects.exclude(treatment__in=Treatment.objects.all()).count(), 0)
+
+
+@skipUnless(queryplan.supported(), "EXPLAIN QUERY PLAN is SQLite syntax")
+@override_settings(PAGE_CACHE_ENABLED=False, QUERY_INSTRUMENTATION=False, STORAGES=PLAIN_STATIC_STORAGES)
+class QueryPlanTests(TestCase):
+    """
+    No page reads a whole table once the tables are large.
+
+    The planner only prefers an index once ANALYZE shows the table is big,
+    so this runs on a generated dataset with 50,000 contacts. A failure
+    names the page and table; add an index matching the query rather than
+    allowing the scan. ``manage.py explain_queries`` prints the plans.
+    """
+    scale = 0.5
+
+    @classmethod
+    def setUpTestData(cls):
+        datagen.generate(scale=cls.scale, seed=3)
+        cls.staff = User.objects.create_superuser('plans', 'plans@example.com', 'x')
+        queryplan.analyze()
+
+    def test_no_full_table_scans(self):
+        self.client.force_login(self.staff)
+        pages = [route for route in routes() if route[1] == 'get'] + queryplan.admin_routes()
+        found = queryplan.plans(self.client, pages)
+        self.assertGreater(len(found), len(pages))
+        self.assertEqual(queryplan.problems(found), [])
+
+    def test_scans_are_detected(self):
+        plan = ['SCAN azfi_contact', 'SCAN azfi_blogpost USING INDEX blogpost_published_id_idx',
+                'SCAN TABLE azfi_treatment', 'SCAN f VIRTUAL TABLE INDEX 0:M2']
+        self.assertEqual(queryplan.full_scans(plan), ['azfi_contact', 'azfi_treatment'])
+
+
+@override_settings(PAGE_CACHE_ENABLED=False, QUERY_INSTRUMENTATION=False, STORAGES=PLAIN_STATIC_STORAGES)
+class LargeTableAdminTests(TestCase):
+    changelist = reverse_lazy('admin:azfi_contact_changelist')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('desk', 'desk@example.com', 'x')
+        for i, (name, email) in enumerate([
+            ('Ada Lovelace', 'ada@example.com'), ('Bea Smith', 'ADA.b@example.com'), ('Zed Ada', 'zed@example.com'),
+            ('Cal Jones', 'cal@example.com'), ('Dee Ray', 'dee@example.com'), ('Eve Long', 'eve@example.com'),
+        ]):
+            Contact.objects.create(name=name, email=email, phone='1', message='Hello', responded=i < 2)
+        Contact.objects.filter(name='Cal Jones').update(created_at=timezone.make_aware(datetime(2025, 3, 15)))
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def names(self, response):
+        return sorted(contact.name for contact in response.context['cl'].result_list)
+
+    @override_settings(ADMIN_COUNT_LIMIT=4)
+    def test_counts_stop_at_the_limit(self):
+        self.assertEqual(self.client.get(self.changelist).context['cl'].result_count, 4)
+        filtered = self.client.get(self.changelist, {'responded__exact': '1'})
+        self.assertEqual(filtered.context['cl'].result_count, 2)
+
+    def test_prefix_search_and_month_filter(self):
+        found = self.client.get(self.changelist, {'q': ' ADA '})
+        self.assertEqual(self.names(found), ['Ada Lovelace', 'Bea Smith'])
+
+        month = self.client.get(self.changelist, {'month': '2025-03'})
+        self.assertEqual(self.names(month), ['Cal Jones'])
+        choices = [choice['display'] for spec in month.context['cl'].filter_specs for choice in spec.choices(month.context['cl'])]
+        self.assertIn('March 2025', choices)
+        self.assertEqual(self.client.get(self.changelist, {'month': 'soon'}).status_code, 302)
+
+    def test_search_finds_words_in_the_message(self):
+        if not search.fts5_enabled():
+            self.skipTest("SQLite was built without FTS5")
+        contact = Contact.objects.get(name='Dee Ray')
+        contact.message = "Do you offer refunds on chemical peels?"
+        contact.save()
+        self.assertEqual(self.names(self.client.get(self.changelist, {'q': 'refund peel'})), ['Dee Ray'])
+        self.assertEqual(self.names(self.client.get(self.changelist, {'q': 'ada'})), ['Ada Lovelace', 'Bea Smith'])
+        Contact.objects.filter(pk=contact.pk).update(message="Thanks")
+        self.assertEqual(self.names(self.client.get(self.changelist, {'q': 'refund'})), [])
+
+    def test_subscriber_search_needs_no_lower(self):
+        Subscriber.objects.create(email='jane@example.com')
+        Subscriber.objects.create(email='joe@example.com')
+        found = self.client.get(reverse('admin:azfi_subscriber_changelist'), {'q': ' JA '})
+        self.assertEqual([row.email for row in found.context['cl'].result_list], ['jane@example.com'])
+
+    def test_mark_responded_is_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.changelist, {
+                'action': 'mark_responded', 'select_across': '1', '_selected_action': [Contact.objects.first().pk],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Contact.objects.filter(responded=False).exists())
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+
+    def test_foreign_keys_are_joined(self):
+        url = reverse('admin:azfi_testimonial_changelist')
+        treatment = Treatment.objects.create(name='Peel', slug='peel', category='FACE', description='x',
+                                             what_to_expect='x', price_range='x', duration='x', image='peel.jpg')
+        Testimonial.objects.create(name='One', quote='x', treatment=treatment, date=timezone.now().date())
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(url)
+        for i in range(4):
+            Testimonial.objects.create(name=f'More {i}', quote='x', treatment=treatment, date=timezone.now().date())
+        with self.assertNumQueries(len(one)):
+            self.client.get(url)
+
+
+@override_settings(QUERY_INSTRUMENTATION=False)
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('crm', 'crm@example.com', 'x')
+        for name in ('Ada', 'Bea'):
+            Contact.objects.create(name=name, email=f'{name.lower()}@example.com', phone='1', message='Hi,\n"there"')
+
+    def test_endpoint_streams_only_new_rows_after_the_watermark(self):
+        url = reverse('export_rows', args=['contacts', 'csv'])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('desk', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:3], ['id', 'name', 'email'])
+        self.assertEqual([row[1] for row in rows[1:]], ['Ada', 'Bea'])
+        self.assertEqual(rows[1][4], 'Hi,\n"there"')
+
+        Contact.objects.create(name='Cal', email='cal@example.com', phone='1', message='New')
+        newer = self.client.get(reverse('export_rows', args=['contacts', 'jsonl']),
+                                {'since': response[exports.WATERMARK_HEADER]})
+        lines = b''.join(newer.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ['Cal'])
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_rows', args=['users', 'csv'])).status_code, 404)
+
+    def test_late_flushed_rows_are_not_skipped(self):
+        self.client.force_login(self.staff)
+        url = reverse('export_rows', args=['contacts', 'jsonl'])
+        watermark = self.client.get(url)[exports.WATERMARK_HEADER]
+        # A spooled submission stored after the export, backdated to when it was sent
+        late = Contact.objects.create(name='Cal', email='cal@example.com', phone='1', message='Queued')
+        Contact.objects.filter(pk=late.pk).update(created_at=Contact.objects.get(name='Ada').created_at)
+
+        response = self.client.get(url, {'since': watermark})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ['Cal'])
+        self.assertEqual(response[exports.WATERMARK_HEADER], str(late.pk))
+
+    def test_admin_action_exports_the_selection(self):
+        self.client.force_login(self.staff)
+        bea = Contact.objects.get(name='Bea')
+        response = self.client.post(reverse('admin:azfi_contact_changelist'), {
+            'action': 'export_jsonl', '_selected_action': [bea.pk],
+        })
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['email'] for line in lines], ['bea@example.com'])
+
+    def test_command_resumes_from_its_state_file(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        state, output = Path(tmp.name) / 'state.json', Path(tmp.name) / 'contacts.jsonl'
+        args = ['contacts', '--format', 'jsonl', '--output', str(output), '--state', str(state)]
+        call_command('export_rows', *args, stderr=io.StringIO())
+        self.assertEqual(len(output.read_text().splitlines()), 2)
+        call_command('export_rows', *args, stderr=io.StringIO())
+        self.assertEqual(output.read_text(), '')
+        self.assertIn('contacts', json.loads(state.read_text()))
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+class ContentBundleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_content(treatments_per_category=2, posts=3)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.bundle = Path(tmp.name)
+
+    def snapshot(self):
+        return {
+            'treatments': list(Treatment.objects.order_by('slug').values_list('slug', 'name', 'featured')),
+            'faqs': sorted(TreatmentFAQ.objects.values_list('treatment__slug', 'order', 'question')),
+            'cases': sorted(BeforeAfterImage.objects.values_list('treatment__slug', 'title', 'after_image')),
+            'testimonials': sorted(Testimonial.objects.values_list('name', 'treatment__slug', 'date')),
+            'posts': list(BlogPost.objects.order_by('slug').values_list(
+                'slug', 'author__username', 'published_date', 'content_html', 'summary')),
+        }
+
+    def test_round_trip(self):
+        for fmt in content.FORMATS:
+            with self.subTest(fmt=fmt):
+                before = self.snapshot()
+                content.export_bundle(self.bundle / fmt, fmt=fmt)
+                Treatment.objects.all().delete()
+                BlogPost.objects.all().delete()
+                Testimonial.objects.all().delete()
+
+                stats, _media = content.import_bundle(self.bundle / fmt)
+                self.assertEqual(self.snapshot(), before)
+                self.assertEqual(stats['treatments']['created'], 6)
+                self.assertEqual(stats['authors']['unchanged'], 2)
+
+    def test_synced_site_keeps_availability(self):
+        treatment = Treatment.objects.order_by('slug').first()
+        Treatment.objects.filter(pk=treatment.pk).update(duration_minutes=90)
+        member = TeamMember.objects.get(name='Practitioner 0')
+        member.treatments.add(treatment)
+        WorkingHours.objects.create(member=member, weekday=0, start=time(9), end=time(12))
+        today = timezone.localdate()
+        monday = timezone.make_aware(datetime.combine(today + timedelta(days=7 - today.weekday()), time.min))
+
+        def availability():
+            slots = booking.open_slots(Treatment.objects.get(slug=treatment.slug), monday, monday + timedelta(days=7))
+            names = dict(TeamMember.objects.values_list('pk', 'name'))
+            return [(timezone.localtime(slot.start).strftime('%H:%M'), slot.end - slot.start, names[slot.member_id])
+                    for slot in slots]
+
+        before = availability()
+        self.assertEqual(before[-1], ('10:30', timedelta(minutes=90), 'Practitioner 0'))
+        content.export_bundle(self.bundle)
+        Treatment.objects.all().delete()
+        TeamMember.objects.all().delete()
+
+        stats, _media = content.import_bundle(self.bundle)
+        self.assertEqual(stats['practitioners']['created'], 1)
+        self.assertEqual(stats['hours']['created'], 1)
+        self.assertEqual(availability(), before)
+
+    def test_reimport_writes_nothing(self):
+        content.export_bundle(self.bundle)
+        with CaptureQueriesContext(connection) as queries:
+            stats, _media = content.import_bundle(self.bundle)
+        writes = [q['sql'] for q in queries if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+        for name, counts in stats.items():
+            self.assertEqual(counts['read'], counts['unchanged'], name)
+
+    def test_dry_run_reports_diff_without_writing(self):
+        content.export_bundle(self.bundle)
+        path = self.bundle / 'treatments.jsonl'
+        rows = [json.loads(line) for line in path.read_text().splitlines()]
+        rows[0]['price_range'] = '$999'
+        rows.append(dict(rows[1], slug='new-treatment'))
+        path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+        faqs = self.bundle / 'faqs.jsonl'
+        faqs.write_text(faqs.read_text() + json.dumps(
+            {'treatment': 'new-treatment', 'order': 0, 'question': 'New?', 'answer': 'Yes.'}) + '\n')
+
+        lines = []
+        stats, _media = content.import_bundle(self.bundle, dry_run=True, log=lines.append)
+        self.assertIn(f"~ treatments/{rows[0]['slug']} (price_range)", lines)
+        self.assertIn('+ treatments/new-treatment', lines)
+        self.assertEqual(stats['faqs']['created'], 1)
+        self.assertFalse(Treatment.objects.filter(slug='new-treatment').exists())
+
+        content.import_bundle(self.bundle)
+        self.assertEqual(Treatment.objects.get(slug=rows[0]['slug']).price_range, '$999')
+        self.assertEqual(Treatment.objects.get(slug='new-treatment').faqs.count(), 1)
+
+    def test_unknown_parent_is_skipped(self):
+        content.export_bundle(self.bundle, sections=['faqs'])
+        faqs = self.bundle / 'faqs.jsonl'
+        faqs.write_text(faqs.read_text() + json.dumps(
+            {'treatment': 'missing', 'order': 0, 'question': 'Q?', 'answer': 'A.'}) + '\n')
+        lines = []
+        stats, _media = content.import_bundle(self.bundle, log=lines.append)
+        self.assertEqual(stats['faqs']['skipped'], 1)
+        self.assertTrue(any("unknown treatment 'missing'" in line for line in lines))
+
+    def test_sample_content(self):
+        stats, _media = content.import_bundle(settings.BASE_DIR / 'sample_content', media=False)
+        self.assertEqual(stats['treatments']['read'], 7)
+        self.assertFalse(any(counts['skipped'] for counts in stats.values()))
+
+
+@override_settings(IMAGE_DERIVATIVE_WIDTHS=(320, 640, 1280), IMAGE_DERIVATIVES_ASYNC=False, PAGE_CACHE_ENABLED=False)
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media = Path(tmp.name)
+        override = self.settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(images._manifest_cache.clear)
+        self.upload((800, 400))
+        self.treatment = Treatment(
+            name='Chemical Peel', slug='chemical-peel', category='FACE', description='x', what_to_expect='x',
+            price_range='$120', duration='30 minutes', image='treatments/peel.png',
+        )
+
+    def upload(self, size, mtime=1_700_000_000):
+        from PIL import Image
+
+        path = self.media / 'treatments' / 'peel.png'
+        path.parent.mkdir(exist_ok=True)
+        # Half transparent, to be flattened onto white for JPEG
+        Image.new('RGBA', size, (200, 40, 40, 128)).save(path)
+        os.utime(path, (mtime, mtime))
+
+    def save(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.treatment.save()
+        return callbacks
+
+    def render(self, source):
+        return Template('{% load responsive_images %}' + source).render(Context({'treatment': self.treatment}))
+
+    def test_saving_an_upload_builds_its_derivatives(self):
+        from PIL import Image
+
+        self.save()
+        output = self.media / 'derivatives' / 'treatments' / 'peel'
+        self.assertEqual(sorted(path.name for path in output.iterdir()),
+                         ['320.jpg', '320.webp', '640.jpg', '640.webp', 'manifest.json'])
+        manifest = images.load_manifest('treatments/peel.png')
+        self.assertEqual((manifest['width'], manifest['height'], manifest['widths']), (800, 400, [320, 640]))
+        self.assertTrue(manifest['placeholder'].startswith('data:image/jpeg;base64,'))
+        with Image.open(output / '320.jpg') as thumbnail:
+            self.assertEqual((thumbnail.size, thumbnail.mode), ((320, 160), 'RGB'))
+            # Green at half opacity over white
+            self.assertAlmostEqual(thumbnail.getpixel((0, 0))[1], 147, delta=3)
+
+        html = self.render('{% responsive_image treatment.image alt="Peel" %}')
+        self.assertIn('srcset="/media/derivatives/treatments/peel/320.webp 320w, '
+                      '/media/derivatives/treatments/peel/640.webp 640w"', html)
+        self.assertIn('width="640" height="320"', html)
+        self.assertEqual(self.render('{% image_url treatment.image 400 "webp" %}'),
+                         '/media/derivatives/treatments/peel/640.webp')
+
+    def test_unchanged_sources_are_skipped(self):
+        self.save()
+        self.assertEqual(self.save(), [])
+        out = io.StringIO()
+        call_command('build_image_derivatives', stdout=out)
+        self.assertIn('0 image(s) to process, 1 up to date, 0 missing.', out.getvalue())
+
+        # A replaced upload under the same name is built again
+        self.upload((1600, 800), mtime=1_700_000_100)
+        self.assertFalse(images.is_current('treatments/peel.png'))
+        self.assertEqual(len(self.save()), 1)
+        self.assertEqual(images.load_manifest('treatments/peel.png')['widths'], [320, 640, 1280])
+
+    def test_tags_fall_back_to_the_original(self):
+        self.assertEqual(self.render('{% responsive_image treatment.image alt="Peel" css_class="hero" %}'),
+                         '<img src="/media/treatments/peel.png" alt="Peel" class="hero" loading="lazy">')
+        self.assertEqual(self.render('{% image_url treatment.image 640 %}'), '/media/treatments/peel.png')
+        self.assertEqual(self.render('{% image_set treatment.image %}'), 'url("/media/treatments/peel.png")')
+        self.treatment.image = ''
+        self.assertEqual(self.render('{% responsive_image treatment.image %}{% image_set treatment.image %}'), '')
+
+
+@override_settings(ASSET_BUNDLES={'site.css': ['css/a.css', 'css/b.css'], 'site.js': ['js/a.js']})
+class AssetBundleTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        sources = {
+            'css/a.css': "/* palette */\n.nav a :hover {\n    color: red;\n}\n",
+            'css/b.css': ".hero {\n    background: url('/static/images/missing.jpg');\n}\n" * 20,
+            'js/a.js': "// toggle\nconst x = 1;\n\n    console.log(x);\n",
+        }
+        for name, text in sources.items():
+            (self.root / name).parent.mkdir(parents=True, exist_ok=True)
+            (self.root / name).write_text(text)
+        self.sources = sources
+
+    def render(self):
+        return Template("{% load assets %}{% bundle 'site.css' %}{% bundle 'site.js' %}").render(Context())
+
+    def test_minifiers_keep_meaning(self):
+        self.assertEqual(assets.minify_css(self.sources['css/a.css']), '.nav a :hover{color:red}')
+        self.assertEqual(assets.minify_js(self.sources['js/a.js']), 'const x = 1;\nconsole.log(x);')
+
+    def test_unbuilt_bundles_fall_back_to_sources(self):
+        html = self.render()
+        self.assertIn('<link rel="stylesheet" href="/static/css/a.css">', html)
+        self.assertIn('<link rel="stylesheet" href="/static/css/b.css">', html)
+        self.assertIn('<script src="/static/js/a.js"></script>', html)
+
+    def test_collectstatic_builds_hashed_compressed_bundles(self):
+        storage = BundledStaticFilesStorage(location=self.root, base_url='/static/')
+        paths = {name: (storage, name) for name in self.sources}
+        with self.assertLogs('azfi.assets', 'WARNING'):
+            list(storage.post_process(paths))
+
+        hashed = storage.stored_name('bundles/site.css')
+        self.assertRegex(hashed, r'^bundles/site\.[0-9a-f]{12}\.css$')
+        built = storage.open(hashed).read()
+        self.assertTrue(built.startswith(b'.nav a :hover{color:red}\n.hero{'))
+        self.assertEqual(gzip.decompress((self.root / (hashed + '.gz')).read_bytes()), built)
+        self.assertFalse(storage.exists(storage.stored_name('bundles/site.js') + '.gz'))  # too small
+
+        with self.settings(STATIC_ROOT=self.root, STORAGES=dict(
+                settings.STORAGES, staticfiles={'BACKEND': 'azfi.storage.BundledStaticFilesStorage'})):
+            html = self.render()
+        self.assertEqual(html.count('<link'), 1)
+        self.assertIn(f'href="/static/{hashed}"', html)
+
+    def test_brotli_siblings_or_a_warning(self):
+        storage = BundledStaticFilesStorage(location=self.root, base_url='/static/')
+        paths = {name: (storage, name) for name in self.sources}
+        fake = mock.Mock(compress=lambda content, quality: b'br:' + content)
+        with mock.patch.object(assets, 'brotli', fake), self.assertLogs('azfi.assets', 'WARNING') as logs:
+            list(storage.post_process(paths))
+        self.assertFalse(any('brotli' in line for line in logs.output))
+        hashed = storage.stored_name('bundles/site.css')
+        self.assertEqual((self.root / (hashed + '.br')).read_bytes(), b'br:' + storage.open(hashed).read())
+
+        with mock.patch.object(assets, 'brotli', None), self.assertLogs('azfi.assets', 'WARNING') as logs:
+            storage.compress([hashed])
+        self.assertIn('brotli package is not installed', logs.output[0])
@@ -1,18 +1,26 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# settings/asgi.py turns ASYNC_VIEWS on, so ASGI servers run these natively
+if settings.ASYNC_VIEWS:
+    HomeView, TreatmentDetailView = views.AsyncHomeView, views.AsyncTreatmentDetailView
+else:
+    HomeView, TreatmentDetailView = views.HomeView, views.TreatmentDetailView
+
 urlpatterns = [
-    path('', views.HomeView.as_view(), name='home'),
+    path('', HomeView.as_view(), name='home'),
     
     # Treatments
     path('treatments/', views.TreatmentListView.as_view(), name='treatment_list'),
-    path('treatments/<slug:slug>/', views.TreatmentDetailView.as_view(), name='treatment_detail'),
+    path('treatments/<slug:slug>/', TreatmentDetailView.as_view(), name='treatment_detail'),
     
     # About
     path('about/', views.AboutView.as_view(), name='about'),
     
     # Gallery
     path('gallery/', views.GalleryView.as_view(), name='gallery'),
+    path('gallery/images.json', views.GalleryImagesView.as_view(), name='gallery_images'),
     
     # Testimonials
     path('testimonials/', views.TestimonialListView.as_view(), name='testimonial_list'),
@@ -26,9 +34,22 @@ urlpatterns = [
     path('contact/', views.ContactView.as_view(), name='contact'),
     path('contact/success/', views.ContactSuccessView.as_view(), name='contact_success'),
     
+    # Booking
+    path('booking/', views.booking_page, name='booking'),
+    path('booking/slots.json', views.booking_slots, name='booking_slots'),
+    path('booking/<uuid:reference>/', views.booking_confirmed, name='booking_confirmed'),
+    
     # Search
     path('search/', views.search_view, name='search'),
     
     # Newsletter Signup
     path('newsletter-signup/', views.newsletter_signup, name='newsletter_signup'),
+    path('fragments/', views.user_fragments, name='user_fragments'),
+    
+    # Operations
+    path('ops/queue/', views.queue_stats, name='queue_stats'),
+    path('ops/ratelimits/', views.rate_limit_stats, name='rate_limit_stats'),
+    path('ops/profiling/', views.profiling_token, name='profiling_token'),
+    path('ops/subscribers.csv', views.subscriber_export, name='subscriber_export'),
+    path('ops/exports/<slug:name>.<slug:fmt>', views.export_rows, name='export_rows'),
 ] 
\ No newline at end of file
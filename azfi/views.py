@@ -1,28 +1,81 @@
+import asyncio
+from datetime import datetime, time, timedelta
+from urllib.parse import urlsplit
+
 from django.shortcuts import render, get_object_or_404, redirect
+from django.db.models import QuerySet, Subquery
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.generic import ListView, DetailView, CreateView, TemplateView
 from django.contrib import messages
 from django.urls import reverse_lazy
-from django.db.models import Q
+from django.core.paginator import Paginator
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.cache import never_cache
+
+from .models import (
+    Treatment, TreatmentFAQ, TeamMember, Testimonial, BlogPost, BeforeAfterImage, Contact, Subscriber, RelatedTreatment,
+    RelatedPost, Booking,
+)
+from .forms import BookingForm, ContactForm, NewsletterForm
+from . import booking, cache, exports, images, intake, newsletter, profiling, ratelimit, shell, spool
+from .search import search
+from .cache import CachedPageMixin
+from .freshness import ConditionalGetMixin
+from .pagination import CursorPaginationMixin
+
+# Post cards show the title and stored summary, never the article body
+CARD_DEFERRED = ('content', 'content_html', 'toc')
+
+async def fetch_concurrently(context):
+    """
+    Evaluate every queryset in ``context`` at once with the async ORM.
 
-from .models import Treatment, TeamMember, Testimonial, BlogPost, BeforeAfterImage, Contact
-from .forms import ContactForm
+    Django runs one request's queries on a single database thread, so they
+    still execute one after another; gathering them removes the wait between
+    each hand-off to that thread. Meanwhile the event loop serves other
+    requests, which is what lets one ASGI worker replace several WSGI ones.
+    """
+    names = [name for name, value in context.items() if isinstance(value, QuerySet)]
+    results = await asyncio.gather(*[alist(context[name]) for name in names])
+    context.update(zip(names, results))
+    return context
 
-class HomeView(TemplateView):
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+class HomeView(CachedPageMixin, TemplateView):
+    cache_models = (Treatment, Testimonial, TeamMember, BlogPost)
     template_name = 'home.html'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['featured_treatments'] = Treatment.objects.filter(featured=True)[:3]
-        context['testimonials'] = Testimonial.objects.filter(featured=True)[:6]
+        context['testimonials'] = Testimonial.objects.filter(featured=True).select_related('treatment')[:6]
         context['team_members'] = TeamMember.objects.all()[:3]
-        context['latest_posts'] = BlogPost.objects.all()[:3]
+        context['latest_posts'] = BlogPost.objects.select_related('author').defer(*CARD_DEFERRED)[:3]
         return context
 
-class TreatmentListView(ListView):
+class AsyncHomeView(HomeView):
+    """``HomeView`` for ASGI: the four independent queries run concurrently."""
+    
+    async def get(self, request, *args, **kwargs):
+        context = await fetch_concurrently(self.get_context_data(**kwargs))
+        return self.render_to_response(context)
+
+class TreatmentListView(ConditionalGetMixin, CachedPageMixin, ListView):
+    cache_models = (Treatment,)
     model = Treatment
     template_name = 'treatments/treatment_list.html'
     context_object_name = 'treatments'
     
+    def get_freshness_queryset(self):
+        return Treatment.objects.all()
+    
     def get_queryset(self):
         queryset = Treatment.objects.all()
         category = self.request.GET.get('category')
@@ -35,23 +88,45 @@ class TreatmentListView(ListView):
         context['categories'] = Treatment.CATEGORY_CHOICES
         return context
 
-class TreatmentDetailView(DetailView):
+class TreatmentDetailView(ConditionalGetMixin, CachedPageMixin, DetailView):
+    cache_models = (Treatment, TreatmentFAQ, BeforeAfterImage, Testimonial, RelatedTreatment)
     model = Treatment
     template_name = 'treatments/treatment_detail.html'
     context_object_name = 'treatment'
     
+    def get_freshness_queryset(self):
+        # The treatment (touched by its FAQs, cases, testimonials and related list) and its related treatments
+        slug = self.kwargs['slug']
+        page = Treatment.objects.filter(slug=slug).values('pk')
+        related = RelatedTreatment.objects.filter(treatment__slug=slug).values('related_id')
+        # IN over a UNION, which the planner answers from two index lookups (an OR scans the table)
+        return Treatment.objects.filter(pk__in=page.union(related))
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        treatment = self.get_object()
+        treatment = self.object
         context['faqs'] = treatment.faqs.all()
         context['before_after'] = treatment.before_after_images.all()
+        # Precomputed by content similarity (azfi/similarity.py)
         context['related_treatments'] = Treatment.objects.filter(
-            category=treatment.category
-        ).exclude(pk=treatment.pk)[:3]
+            related_from__treatment=treatment
+        ).order_by('related_from__rank')
         context['testimonials'] = treatment.testimonials.all()[:3]
         return context
 
-class AboutView(TemplateView):
+class AsyncTreatmentDetailView(TreatmentDetailView):
+    """``TreatmentDetailView`` for ASGI: FAQs, cases, related treatments and testimonials load concurrently."""
+    
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.object = await self.get_queryset().aget(slug=self.kwargs['slug'])
+        except Treatment.DoesNotExist:
+            raise Http404("No treatment found matching the query")
+        context = await fetch_concurrently(self.get_context_data(object=self.object))
+        return self.render_to_response(context)
+
+class AboutView(CachedPageMixin, TemplateView):
+    cache_models = (TeamMember,)
     template_name = 'about.html'
     
     def get_context_data(self, **kwargs):
@@ -59,13 +134,24 @@ class AboutView(TemplateView):
         context['team_members'] = TeamMember.objects.all()
         return context
 
-class GalleryView(ListView):
+class GalleryView(ConditionalGetMixin, CachedPageMixin, CursorPaginationMixin, ListView):
+    cache_models = (BeforeAfterImage, Treatment)
     model = BeforeAfterImage
     template_name = 'gallery.html'
     context_object_name = 'images'
+    paginate_by = 9
+    cursor_ordering = ('-created_at', '-id')
+    
+    def get_freshness_queryset(self):
+        # Adding or removing a case touches its treatment
+        return Treatment.objects.all()
     
     def get_queryset(self):
-        queryset = BeforeAfterImage.objects.all()
+        # The cards need the treatment's name and link, not its long descriptions
+        queryset = BeforeAfterImage.objects.select_related('treatment').only(
+            'title', 'before_image', 'after_image', 'created_at',
+            'treatment__name', 'treatment__slug', 'treatment__category',
+        )
         category = self.request.GET.get('category')
         if category:
             queryset = queryset.filter(treatment__category=category)
@@ -76,49 +162,98 @@ class GalleryView(ListView):
         context['categories'] = Treatment.CATEGORY_CHOICES
         return context
 
-class TestimonialListView(ListView):
+class GalleryImagesView(GalleryView):
+    """
+    The gallery's cases as JSON, a page at a time, for the script that loads
+    more as the visitor scrolls. ``?cursor=`` takes the previous page's
+    ``next`` token and ``?category=`` filters as the page does.
+    """
+    thumbnail_width = 640
+    
+    def serialize(self, image):
+        treatment = image.treatment
+        return {
+            'id': image.pk,
+            'title': image.title,
+            'created_at': image.created_at.isoformat(),
+            'treatment': {'name': treatment.name, 'category': treatment.category,
+                          'url': treatment.get_absolute_url()},
+            'before': images.describe(image.before_image, self.thumbnail_width),
+            'after': images.describe(image.after_image, self.thumbnail_width),
+        }
+    
+    def render_to_response(self, context, **response_kwargs):
+        page = context['page_obj']
+        return JsonResponse({
+            'results': [self.serialize(image) for image in page.object_list],
+            'next': page.next_cursor,
+            'next_url': page.next_url,
+        })
+
+class TestimonialListView(CachedPageMixin, CursorPaginationMixin, ListView):
+    cache_models = (Testimonial, Treatment)
     model = Testimonial
     template_name = 'testimonials.html'
     context_object_name = 'testimonials'
+    paginate_by = 12
+    cursor_ordering = ('-date', '-id')
+    
+    def get_queryset(self):
+        return Testimonial.objects.select_related('treatment')
 
-class BlogListView(ListView):
+class BlogListView(ConditionalGetMixin, CachedPageMixin, CursorPaginationMixin, ListView):
+    cache_models = (BlogPost, User)
     model = BlogPost
     template_name = 'blog/blog_list.html'
     context_object_name = 'posts'
     paginate_by = 6
+    cursor_ordering = ('-published_date', '-id')
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
-        # Add featured post
-        try:
-            context['featured_post'] = BlogPost.objects.filter(featured=True).latest('created_at')
-        except (BlogPost.DoesNotExist, AttributeError):
-            context['featured_post'] = None
-            
-        return context
+    def get_freshness_queryset(self):
+        return BlogPost.objects.all()
+    
+    def get_queryset(self):
+        return BlogPost.objects.select_related('author').defer(*CARD_DEFERRED)
 
-class BlogDetailView(DetailView):
+class BlogDetailView(ConditionalGetMixin, CachedPageMixin, DetailView):
+    cache_models = (BlogPost, User, RelatedPost)
     model = BlogPost
     template_name = 'blog/blog_detail.html'
     context_object_name = 'post'
     
+    def get_freshness_queryset(self):
+        # The post and the ones its page links to: the newest, its neighbours and its related posts
+        slug = self.kwargs['slug']
+        posts = BlogPost.objects.order_by()
+        created = posts.filter(slug=slug).values('created_at')[:1]
+        linked = [
+            BlogPost.objects.values('pk')[:4],
+            posts.filter(created_at__gt=Subquery(created)).order_by('created_at').values('pk')[:1],
+            posts.filter(created_at__lt=Subquery(created)).order_by('-created_at').values('pk')[:1],
+        ]
+        # SQLite takes no LIMIT inside a UNION, so each sliced query is wrapped in its own IN
+        page = posts.filter(slug=slug).values('pk').union(
+            *(posts.filter(pk__in=query).values('pk') for query in linked),
+            RelatedPost.objects.filter(post__slug=slug).values('related_id'),
+        )
+        # IN over a UNION, as for treatments: each part is an index lookup, where an OR scans the table
+        return posts.filter(pk__in=page)
+    
+    def get_queryset(self):
+        return BlogPost.objects.select_related('author')
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        post = self.get_object()
-        context['recent_posts'] = BlogPost.objects.exclude(pk=post.pk)[:3]
+        post = self.object
+        cards = BlogPost.objects.defer(*CARD_DEFERRED)
+        context['recent_posts'] = cards.exclude(pk=post.pk)[:3]
         
         # Get next and previous posts
-        try:
-            context['next_post'] = BlogPost.objects.filter(created_at__gt=post.created_at).order_by('created_at').first()
-        except BlogPost.DoesNotExist:
-            context['next_post'] = None
-            
-        try:
-            context['previous_post'] = BlogPost.objects.filter(created_at__lt=post.created_at).order_by('-created_at').first()
-        except BlogPost.DoesNotExist:
-            context['previous_post'] = None
-            
+        context['next_post'] = cards.filter(created_at__gt=post.created_at).order_by('created_at').first()
+        context['previous_post'] = cards.filter(created_at__lt=post.created_at).order_by('-created_at').first()
+        # Precomputed from MinHash signatures (azfi/minhash.py)
+        context['related_posts'] = cards.filter(related_from__post=post).order_by('related_from__rank')
+        
         return context
 
 class ContactView(CreateView):
@@ -127,29 +262,126 @@ class ContactView(CreateView):
     template_name = 'contact.html'
     success_url = reverse_lazy('contact_success')
     
+    def get(self, request, *args, **kwargs):
+        # The old "Book Consultation" links pointed here
+        if request.GET.get('booking'):
+            return redirect('booking')
+        # Not page cached, but in shell mode a proxy may keep the empty form
+        response = super().get(request, *args, **kwargs)
+        return cache.when_rendered(response, lambda r: cache.share(request, r))
+    
     def form_valid(self, form):
+        # Acknowledge now; the queue worker stores the submission and emails the clinic
+        intake.submit_contact(form.contact_fields())
         messages.success(self.request, "Your message has been sent successfully! We'll be in touch soon.")
-        return super().form_valid(form)
+        return redirect(self.success_url)
 
 class ContactSuccessView(TemplateView):
     template_name = 'contact_success.html'
 
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        return cache.when_rendered(response, lambda r: cache.share(request, r))
+
+@never_cache
+def user_fragments(request):
+    """The visitor's CSRF token, messages and toolbar, for base.js to fill into a page shell."""
+    return JsonResponse(shell.fragments(request))
+
+# Appointment booking (azfi/booking.py). These pages change with every booking, so none is cached.
+
+def bookable_treatments():
+    return Treatment.objects.filter(practitioners__isnull=False).distinct()
+
+def booking_window(request, days=7):
+    """``(first day, start, end)`` of the ``days`` from ``?week=`` (a date, default today), in local time."""
+    today = timezone.localdate()
+    first_day = max(parse_date(request.GET.get('week') or '') or today, today)
+    start = timezone.make_aware(datetime.combine(first_day, time.min))
+    return first_day, start, start + timedelta(days=days)
+
+def booking_page(request):
+    """A week of open times for the chosen treatment, and the form that books one."""
+    treatments = bookable_treatments()
+    form = BookingForm(request.POST or None)
+    status = 200
+    if request.method == 'POST':
+        if form.is_valid():
+            data = form.cleaned_data
+            member_id = data['member'].pk if data['member'] else None
+            try:
+                appointment = booking.reserve(data['treatment'], data['start'], member_id=member_id,
+                                              **form.booking_details())
+            except booking.SlotUnavailable:
+                messages.error(request, "Sorry, that time has just been taken. Please choose another.")
+                status = 409
+            else:
+                return redirect('booking_confirmed', reference=appointment.reference)
+        else:
+            status = 400
+        treatment = form.cleaned_data.get('treatment')
+    else:
+        treatment = treatments.filter(slug=request.GET.get('treatment', '')).first()
+
+    first_day, start, end = booking_window(request)
+    member = request.GET.get('member', '')
+    member_id = int(member) if member.isdigit() else None
+    days = []
+    practitioners = []
+    if treatment is not None:
+        practitioners = treatment.practitioners.all()
+        by_day = {}
+        for slot in booking.open_slots(treatment, start, end, member_id=member_id):
+            times = by_day.setdefault(timezone.localtime(slot.start).date(), [])
+            if not times or times[-1] != slot.start:
+                times.append(slot.start)
+        days = [(first_day + timedelta(days=offset), by_day.get(first_day + timedelta(days=offset), []))
+                for offset in range(7)]
+    today = timezone.localdate()
+    context = {
+        'treatments': treatments,
+        'treatment': treatment,
+        'practitioners': practitioners,
+        'member_id': member_id,
+        'days': days,
+        'form': form,
+        'week': first_day,
+        'previous_week': first_day - timedelta(days=7) if first_day > today else None,
+        'next_week': first_day + timedelta(days=7),
+    }
+    return render(request, 'booking.html', context, status=status)
+
+def booking_slots(request):
+    """Open times as JSON: ``?treatment=`` (slug), ``?week=`` (first date), ``?days=`` (1-14), ``?member=``."""
+    treatment = get_object_or_404(bookable_treatments(), slug=request.GET.get('treatment', ''))
+    days, member = request.GET.get('days', '7'), request.GET.get('member', '')
+    if not days.isdigit() or not 1 <= int(days) <= 14 or (member and not member.isdigit()):
+        return HttpResponseBadRequest("days must be 1 to 14 and member a practitioner id")
+    _first_day, start, end = booking_window(request, int(days))
+    slots = booking.open_slots(treatment, start, end, member_id=int(member) if member else None)
+    return JsonResponse({
+        'treatment': treatment.slug,
+        'duration_minutes': treatment.duration_minutes,
+        'slots': [{'start': slot.start.isoformat(), 'end': slot.end.isoformat(), 'member': slot.member_id}
+                  for slot in slots],
+    })
+
+def booking_confirmed(request, reference):
+    appointment = get_object_or_404(Booking.objects.select_related('treatment', 'member'), reference=reference)
+    return render(request, 'booking_confirmed.html', {'booking': appointment})
+
 def search_view(request):
-    query = request.GET.get('q', '')
+    query = request.GET.get('q', '').strip()
     
-    treatments = Treatment.objects.filter(
-        Q(name__icontains=query) | Q(description__icontains=query)
-    ) if query else []
-    
-    posts = BlogPost.objects.filter(
-        Q(title__icontains=query) | Q(content__icontains=query)
-    ) if query else []
+    # Ranking, snippets and the total count all come from the search index
+    page_obj = Paginator(search(query), 10).get_page(request.GET.get('page'))
     
     context = {
         'query': query,
-        'treatments': treatments,
-        'posts': posts,
-        'count': len(treatments) + len(posts)
+        'results': page_obj.object_list,
+        'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
+        'count': page_obj.paginator.count,
     }
     
     return render(request, 'search_results.html', context)
@@ -157,15 +389,20 @@ def search_view(request):
 def newsletter_signup(request):
     """Handle newsletter signups."""
     if request.method == 'POST':
-        email = request.POST.get('email')
-        # Here you would typically save the email to your database
-        # or send it to your email marketing service
-        
-        # For now, just return a success message
-        messages.success(request, "Thank you for subscribing to our newsletter!")
-        
-        # Redirect back to the referring page or home
+        form = NewsletterForm(request.POST)
         next_url = request.META.get('HTTP_REFERER', '/')
+        if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()},
+                                               require_https=request.is_secure()):
+            next_url = '/'
+
+        if form.is_valid():
+            # Stored by the queue worker; repeat addresses are dropped without touching the database
+            newsletter.subscribe(form.cleaned_data['email'], source=urlsplit(next_url).path)
+            messages.success(request, "Thank you for subscribing to our newsletter!")
+        else:
+            messages.error(request, "Please enter a valid email address.")
+
+        # Redirect back to the referring page or home
         return redirect(next_url)
     
     # If not a POST request, redirect to home
@@ -173,15 +410,78 @@ def newsletter_signup(request):
 
 def blog_search(request):
     """Search specifically within blog posts."""
-    query = request.GET.get('q', '')
+    query = request.GET.get('q', '').strip()
+    
+    if not query:
+        context = {
+            'posts': BlogPost.objects.defer(*CARD_DEFERRED)[:6],
+            'search_query': query,
+        }
+        return render(request, 'blog/blog_list.html', context)
     
-    posts = BlogPost.objects.filter(
-        Q(title__icontains=query) | Q(content__icontains=query) | Q(excerpt__icontains=query)
-    ) if query else BlogPost.objects.all()[:6]
+    page_obj = Paginator(search(query, kinds=['post']), 6).get_page(request.GET.get('page'))
+    hits = list(page_obj.object_list)
+    posts_by_id = BlogPost.objects.defer(*CARD_DEFERRED).in_bulk([hit.object_id for hit in hits])
+    
+    posts = []
+    for hit in hits:
+        post = posts_by_id.get(hit.object_id)
+        if post is not None:
+            post.search_snippet = hit.snippet
+            posts.append(post)
     
     context = {
         'posts': posts,
         'search_query': query,
+        'page_obj': page_obj,
+        'paginator': page_obj.paginator,
+        'is_paginated': page_obj.has_other_pages(),
     }
     
     return render(request, 'blog/blog_list.html', context)
+
+@staff_member_required
+def queue_stats(request):
+    """Backlog, dead letters and flush latency of the write-behind queue."""
+    return JsonResponse({'topics': spool.get_spool().stats()})
+
+@staff_member_required
+def rate_limit_stats(request):
+    """Rate limit policies with how many requests each allowed and refused."""
+    return JsonResponse({'enabled': ratelimit.is_enabled(), 'policies': ratelimit.stats()})
+
+@staff_member_required
+def profiling_token(request):
+    """A token that profiles the requests carrying it, and the latest profiles written."""
+    return JsonResponse({
+        'enabled': profiling.is_enabled(),
+        'token': profiling.make_token(),
+        'header': profiling.HEADER,
+        'param': profiling.PARAM,
+        'max_age': profiling.token_max_age(),
+        'recent': profiling.recent(),
+    })
+
+@staff_member_required
+def subscriber_export(request):
+    """Stream the subscriber list as CSV without loading it into memory."""
+    return exports.stream(exports.get_export('subscribers'), 'csv')
+
+@staff_member_required
+def export_rows(request, name, fmt):
+    """
+    Stream one of ``exports.EXPORTS`` as CSV or JSON Lines. ``?since=`` takes
+    the ``X-Export-Watermark`` of the previous export to fetch only new rows.
+    """
+    if name not in exports.EXPORTS or fmt not in exports.FORMATS:
+        raise Http404("No such export")
+    export = exports.get_export(name)
+    if not request.user.has_perm(f'{export.model._meta.app_label}.view_{export.model._meta.model_name}'):
+        raise PermissionDenied
+    since = None
+    if request.GET.get('since'):
+        try:
+            since = exports.parse_watermark(export, request.GET['since'])
+        except ValueError:
+            return HttpResponseBadRequest("since must be the X-Export-Watermark of an earlier export")
+    return exports.stream(export, fmt, since=since)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings.settings')
+# Serve the async variants of the home and treatment pages (see ASYNC_VIEWS)
+os.environ.setdefault('AZFI_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -45,17 +45,26 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'azfi.middleware.ProfilingMiddleware',
+    'azfi.middleware.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'azfi.middleware.RateLimitMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'azfi.middleware.ReplicaRoutingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'settings.urls'
 
+# Route the home and treatment detail pages to their async views, which fetch
+# their context concurrently. settings/asgi.py turns this on; under WSGI the
+# sync views avoid an event loop per request.
+ASYNC_VIEWS = os.environ.get('AZFI_ASYNC_VIEWS', '') == '1'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -81,10 +90,30 @@ WSGI_APPLICATION = 'settings.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Point at a scratch file for generated benchmark datasets
+        'NAME': os.environ.get('AZFI_DATABASE_PATH', BASE_DIR / 'db.sqlite3'),
+    },
+    # Read replica for the public pages (azfi/routers.py). Locally a copy of the
+    # primary refreshed by `manage.py sync_replica`; in production a replicated
+    # copy of the file (Litestream, LiteFS) or a replica server.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('AZFI_REPLICA_PATH', BASE_DIR / 'db.replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['azfi.routers.PrimaryReplicaRouter']
+
+# Aliases the read-only views read from, e.g. AZFI_READ_REPLICAS=replica;
+# empty serves everything from the primary
+DATABASE_REPLICAS = [alias for alias in os.environ.get('AZFI_READ_REPLICAS', '').split(',') if alias]
+# After a POST, read from the primary for this long so visitors see their own writes
+REPLICA_STICKY_SECONDS = 10
+# Pages rendered from a replica may predate the write that invalidated them, so they
+# are cached for at most this long
+REPLICA_PAGE_CACHE_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -124,6 +153,37 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic builds ASSET_BUNDLES into STATIC_ROOT/bundles/, fingerprints every
+# file and writes .gz/.br siblings (azfi/storage.py). Templates load bundles with
+# {% bundle 'name' %}; with DEBUG on the sources are served one by one instead.
+# Run: python manage.py build_assets
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'azfi.storage.BundledStaticFilesStorage',
+    },
+}
+ASSET_BUNDLES = {
+    'base.css': ['css/pages/base.css'],
+    'base.js': ['js/pages/base.js'],
+    'about.css': ['css/pages/about.css'],
+    'about.js': ['js/pages/about.js'],
+    'blog_list.css': ['css/pages/blog_list.css'],
+    'blog_list.js': ['js/pages/blog_list.js'],
+    'blog_detail.css': ['css/blog.css'],
+    'booking.css': ['css/pages/booking.css'],
+    'contact.css': ['css/pages/contact.css'],
+    'gallery.css': ['css/pages/gallery.css'],
+    'gallery.js': ['js/pages/gallery.js'],
+    'search_results.css': ['css/pages/search_results.css'],
+    'treatment_detail.css': ['css/pages/treatment_detail.css'],
+    'treatment_list.css': ['css/pages/treatment_list.css'],
+    'treatments.css': ['css/pages/treatments.css'],
+    'treatments.js': ['js/pages/treatments.js'],
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -145,3 +205,129 @@ CKEDITOR_CONFIGS = {
         'width': '100%',
     },
 }
+
+# Responsive image derivatives (see azfi/images.py)
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 960, 1280, 1920)
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_DERIVATIVE_WORKERS = 2
+# Build derivatives on a process pool instead of the admin request thread
+IMAGE_DERIVATIVES_ASYNC = True
+
+# Caching
+# The page cache (azfi/cache.py) only needs get/set/add/incr, so the
+# local-memory default works for a single process. Switch to the file-based
+# backend to share cached pages between workers:
+#   'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#   'LOCATION': os.path.join(BASE_DIR, 'var', 'cache'),
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'aesthetics-clinic',
+    }
+}
+
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Page shells (azfi/shell.py): render public pages without the visitor's
+# messages, CSRF token and staff toolbar, which base.js fetches from
+# /fragments/. Pages are then the same for everyone, so the page cache serves
+# visitors with a session too, and responses say `Cache-Control: public,
+# s-maxage=PAGE_SHELL_MAX_AGE` for a reverse proxy. Forms need JavaScript.
+PAGE_SHELL_ENABLED = False
+PAGE_SHELL_MAX_AGE = 60 * 5
+
+# Per-request SQL instrumentation (azfi.middleware.QueryCountMiddleware)
+QUERY_INSTRUMENTATION = DEBUG
+QUERY_COUNT_WARNING = 20
+QUERY_SIMILAR_WARNING = 3
+
+# Request profiling (azfi/profiling.py). Staff get a token from /ops/profiling/
+# and send it as the X-Profile header or ?_profile= to profile one request;
+# PROFILING_SAMPLE_RATE profiles that fraction of all requests as well. The
+# CPU, template and SQL profiles are written to PROFILING_DIR as
+# flamegraph-compatible collapsed stacks. Off, the middleware is not loaded.
+PROFILING_ENABLED = os.environ.get('AZFI_PROFILING', '') == '1'
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_INTERVAL_MS = 2
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+
+# Write-behind queue for form submissions (azfi/spool.py, azfi/intake.py).
+# Run the worker with: python manage.py run_queue_worker
+SPOOL_PATH = os.environ.get('AZFI_SPOOL_PATH', BASE_DIR / 'spool.sqlite3')
+SPOOL_MAX_ATTEMPTS = 8
+SPOOL_RETRY_DELAY = 5  # seconds, doubled after every failed attempt
+SPOOL_LEASE = 60
+CONTACT_INTAKE_ASYNC = True
+CONTACT_INTAKE_BATCH_SIZE = 200
+CONTACT_NOTIFICATION_EMAILS = ['info@aestheticsclinic.com']
+
+# Newsletter signups (see azfi/newsletter.py): spooled and stored in batches,
+# with repeat addresses caught by an in-memory set reloaded every TTL seconds
+NEWSLETTER_INTAKE_ASYNC = True
+NEWSLETTER_BATCH_SIZE = 500
+NEWSLETTER_SEEN_TTL = 300
+
+# Conditional GET (azfi/freshness.py): treatment and blog pages answer
+# If-None-Match/If-Modified-Since with 304. Change the version after a deploy
+# that alters templates but no content, so browsers fetch the new markup.
+CONDITIONAL_GET_ENABLED = True
+CONDITIONAL_GET_VERSION = '1'
+
+# Pre-rendered pages (azfi/prerender.py): `manage.py prerender` writes every
+# cacheable public page to PRERENDER_ROOT for the web server to serve as is.
+# With PRERENDER_ENABLED, content changes queue the affected pages and the
+# queue worker re-renders them. Absolute URLs in the pages use PRERENDER_HOST,
+# or the first entry of ALLOWED_HOSTS.
+PRERENDER_ENABLED = False
+PRERENDER_ROOT = BASE_DIR / 'prerendered'
+
+# Admin changelists over large tables (LargeTableAdminMixin in azfi/admin.py)
+# count at most this many rows; past it an unfiltered list shows the planner's
+# row estimate instead of running COUNT(*) over the table.
+ADMIN_COUNT_LIMIT = 10000
+
+# Appointment booking (azfi/booking.py): bookings start on this grid of
+# minutes and hold every step they cover; times are offered from the notice
+# period after now up to the horizon.
+BOOKING_SLOT_MINUTES = 15
+BOOKING_MIN_NOTICE_MINUTES = 120
+BOOKING_HORIZON_DAYS = 60
+
+# Rate limits (azfi/ratelimit.py): POSTs to these URL names are refused with
+# 429 once a client IP or submitted email address spends its burst, until
+# the bucket refills at `rate` per `period` seconds. Buckets live in
+# RATE_LIMIT_CACHE_ALIAS; use a shared cache (Redis, Memcached) when running
+# more than one worker process. Behind a proxy, set RATE_LIMIT_IP_HEADER to
+# the header it puts the client address in, e.g. 'HTTP_X_FORWARDED_FOR'.
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_CACHE_ALIAS = 'default'
+RATE_LIMIT_IP_HEADER = 'REMOTE_ADDR'
+RATE_LIMITS = {
+    'contact': {'rate': 5, 'period': 60 * 10, 'burst': 3, 'keys': ('ip', 'email')},
+    'newsletter_signup': {'rate': 10, 'period': 60 * 10, 'burst': 5, 'keys': ('ip', 'email')},
+    'booking': {'rate': 10, 'period': 60 * 10, 'burst': 5, 'keys': ('ip', 'email')},
+}
+
+# Email
+DEFAULT_FROM_EMAIL = 'Aesthetics Clinic <no-reply@aestheticsclinic.com>'
+if DEBUG:
+    EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'azfi': {
+            'handlers': ['console'],
+            'level': 'INFO' if DEBUG else 'WARNING',
+        },
+    },
+}
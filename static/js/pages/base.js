@@ -0,0 +1,37 @@
+// Back to Top Button
+const backToTopBtn = document.getElementById('back-to-top');
+
+if (backToTopBtn) {
+    window.addEventListener('scroll', function() {
+        if (window.pageYOffset > 300) {
+            backToTopBtn.classList.add('show');
+        } else {
+            backToTopBtn.classList.remove('show');
+        }
+    });
+
+    backToTopBtn.addEventListener('click', function(e) {
+        e.preventDefault();
+        window.scrollTo({ top: 0, behavior: 'smooth' });
+    });
+}
+
+// Per-visitor fragments of a cached page shell: one private request fills them all
+const fragmentHoles = document.querySelectorAll('[data-fragment]');
+
+if (fragmentHoles.length) {
+    fetch(fragmentHoles[0].dataset.src, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+        .then(response => response.json())
+        .then(fragments => {
+            fragmentHoles.forEach(hole => {
+                const name = hole.dataset.fragment;
+                if (name === 'csrf') {
+                    hole.value = fragments.csrf;
+                } else if (fragments[name]) {
+                    hole.outerHTML = fragments[name];
+                } else {
+                    hole.remove();
+                }
+            });
+        });
+}
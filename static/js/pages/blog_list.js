@@ -0,0 +1,18 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Initialize image lazy loading
+    if ('loading' in HTMLImageElement.prototype) {
+        const images = document.querySelectorAll('img');
+        images.forEach(img => {
+            img.loading = 'lazy';
+        });
+    }
+
+    // Animate section entrance if AOS is available
+    if (typeof AOS !== 'undefined') {
+        AOS.init({
+            duration: 800,
+            easing: 'ease-in-out',
+            once: true
+        });
+    }
+});
@@ -0,0 +1,128 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Before-After Slider Functionality
+    let isDown = false;
+
+    window.addEventListener('mouseup', () => {
+        isDown = false;
+    });
+
+    window.addEventListener('touchend', () => {
+        isDown = false;
+    });
+
+    function initSlider(container) {
+        const afterImg = container.querySelector('.after-img');
+        const sliderHandle = container.querySelector('.slider-handle');
+
+        function slideTo(clientX) {
+            const rect = container.getBoundingClientRect();
+            const x = clientX - rect.left;
+            const percent = Math.max(0, Math.min(100, x / rect.width * 100));
+
+            afterImg.style.clipPath = `polygon(${percent}% 0, 100% 0, 100% 100%, ${percent}% 100%)`;
+            sliderHandle.style.left = `${percent}%`;
+        }
+
+        // Mouse events
+        container.addEventListener('mousedown', () => {
+            isDown = true;
+        });
+
+        container.addEventListener('mousemove', (e) => {
+            if (!isDown) return;
+            slideTo(e.clientX);
+        });
+
+        // Touch events for mobile
+        container.addEventListener('touchstart', () => {
+            isDown = true;
+        });
+
+        container.addEventListener('touchmove', (e) => {
+            if (!isDown) return;
+            slideTo(e.touches[0].clientX);
+        });
+    }
+
+    document.querySelectorAll('.before-after-container').forEach(initSlider);
+
+    // Load more cases from the JSON feed as the visitor nears the end of the grid
+    const grid = document.querySelector('.gallery-row');
+    const template = document.getElementById('gallery-item-template');
+    const moreBtn = document.querySelector('.gallery-more');
+
+    if (!grid || !template || !moreBtn || !('IntersectionObserver' in window) || !('fetch' in window)) {
+        // The Load More link pages through the gallery instead
+        return;
+    }
+
+    const sentinel = moreBtn.parentElement;
+    let next = moreBtn.dataset.feed;
+    let loading = false;
+
+    function fillImage(img, image, alt) {
+        img.alt = alt;
+        if (!image) {
+            img.closest('picture').remove();
+            return;
+        }
+        img.src = image.src;
+        if (image.srcset) {
+            img.srcset = image.srcset;
+            img.previousElementSibling.srcset = image.webp_srcset;
+            img.width = image.width;
+            img.height = image.height;
+            img.style.background = `url(${image.placeholder}) center / cover no-repeat`;
+        } else {
+            // No derivatives yet: only the original upload
+            img.previousElementSibling.remove();
+        }
+    }
+
+    function renderCase(item) {
+        const card = template.content.firstElementChild.cloneNode(true);
+        card.dataset.category = item.treatment.category.toLowerCase();
+        fillImage(card.querySelector('.before-img'), item.before, `Before ${item.treatment.name}`);
+        fillImage(card.querySelector('.after-img'), item.after, `After ${item.treatment.name}`);
+        card.querySelector('h3').textContent = item.title;
+        const link = card.querySelector('.gallery-caption a');
+        link.href = item.treatment.url;
+        link.textContent = item.treatment.name;
+        initSlider(card.querySelector('.before-after-container'));
+        return card;
+    }
+
+    const observer = new IntersectionObserver((entries) => {
+        if (!entries.some(entry => entry.isIntersecting) || loading || !next) return;
+        loading = true;
+        fetch(next, { headers: { 'Accept': 'application/json' } })
+            .then(response => {
+                if (!response.ok) throw new Error(`Gallery feed returned ${response.status}`);
+                return response.json();
+            })
+            .then(data => {
+                const fragment = document.createDocumentFragment();
+                data.results.forEach(item => fragment.appendChild(renderCase(item)));
+                grid.appendChild(fragment);
+                next = data.next_url;
+                if (next) {
+                    // Observe afresh, so a sentinel still in view asks for the next page too
+                    observer.unobserve(sentinel);
+                    observer.observe(sentinel);
+                } else {
+                    observer.disconnect();
+                }
+            })
+            .catch(() => {
+                // Leave the link for the visitor to page on by hand
+                observer.disconnect();
+                moreBtn.hidden = false;
+            })
+            .finally(() => {
+                loading = false;
+            });
+    }, { rootMargin: '600px 0px' });
+
+    moreBtn.hidden = true;
+    observer.observe(sentinel);
+});
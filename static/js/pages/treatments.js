@@ -0,0 +1,26 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Treatment category filtering
+    const categoryButtons = document.querySelectorAll('.category-btn');
+    const treatmentItems = document.querySelectorAll('.treatment-item');
+
+    categoryButtons.forEach(button => {
+        button.addEventListener('click', function() {
+            // Remove active class from all buttons
+            categoryButtons.forEach(btn => btn.classList.remove('active'));
+
+            // Add active class to clicked button
+            this.classList.add('active');
+
+            const category = this.getAttribute('data-category');
+
+            // Show/hide treatment items based on category
+            treatmentItems.forEach(item => {
+                if (category === 'all' || item.getAttribute('data-category') === category) {
+                    item.style.display = 'block';
+                } else {
+                    item.style.display = 'none';
+                }
+            });
+        });
+    });
+});